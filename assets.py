@@ -0,0 +1,102 @@
+import attr
+import errno
+import hashlib
+import os
+import pathlib
+import shutil
+
+
+@attr.s
+class AssetStore:
+    """
+    Content-addressed store for the files that are identical in every
+    generated lab. Each unique file is written once under objects/ and
+    linked into the output directories. A hardlink is used when possible, a
+    symlink when the store is on another filesystem, and a plain copy as a
+    last resort. Every lab written through the store is listed in the labs
+    file so that collect_garbage can find its symlinks.
+    """
+
+    OBJECTS_DIRECTORY = "objects"
+    LABS_FILE = "labs"
+
+    directory = attr.ib(converter=pathlib.Path)
+
+    @property
+    def objects_directory(self):
+        return self.directory / self.OBJECTS_DIRECTORY
+
+    @property
+    def labs_file(self):
+        return self.directory / self.LABS_FILE
+
+    def add(self, text):
+        data = text.encode()
+        object_path = self.objects_directory / hashlib.sha256(data).hexdigest()
+        if not object_path.exists():
+            self.objects_directory.mkdir(parents=True, exist_ok=True)
+            # Write under a temporary name so a concurrent writer never links a partial file
+            temporary_path = object_path.with_name(f"{object_path.name}.{os.getpid()}.tmp")
+            temporary_path.write_bytes(data)
+            # Read only so a later write to a linked copy cannot change every lab
+            temporary_path.chmod(0o444)
+            temporary_path.replace(object_path)
+        return object_path
+
+    def link(self, text, destination):
+        object_path = self.add(text)
+        destination = pathlib.Path(destination)
+        destination.unlink(missing_ok=True)
+        try:
+            os.link(object_path, destination)
+            return
+        except OSError as error:
+            if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+        try:
+            destination.symlink_to(object_path.resolve())
+            return
+        except OSError:
+            pass
+        shutil.copyfile(object_path, destination)
+
+    def labs(self):
+        if not self.labs_file.exists():
+            return []
+        return [pathlib.Path(line) for line in self.labs_file.read_text().splitlines() if line]
+
+    def register_lab(self, output_directory):
+        output_directory = pathlib.Path(output_directory).resolve()
+        labs = self.labs()
+        if output_directory not in labs:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.labs_file, "a") as labs_file:
+                labs_file.write(f"{output_directory}\n")
+
+    def collect_garbage(self, lab_directories):
+        """
+        Remove the objects no lab links to and drop labs that no longer exist
+        from the labs file. An object is in use when it has another hardlink
+        or is the target of a symlink inside one of lab_directories. Returns
+        the removed object paths.
+        """
+        labs = [lab for lab in self.labs() if lab.is_dir()]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.labs_file.write_text("".join(f"{lab}\n" for lab in labs))
+
+        symlinked = set()
+        for lab in labs:
+            for directory in lab_directories:
+                for path in (lab / directory).rglob("*"):
+                    if path.is_symlink():
+                        symlinked.add(pathlib.Path(os.readlink(path)).name)
+
+        removed = []
+        if not self.objects_directory.is_dir():
+            return removed
+        for object_path in sorted(self.objects_directory.iterdir()):
+            if object_path.stat().st_nlink > 1 or object_path.name in symlinked:
+                continue
+            object_path.unlink()
+            removed.append(object_path)
+        return removed
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+import argparse
+import pathlib
+import subprocess
+import sys
+
+REPO_DIRECTORY = pathlib.Path(__file__).resolve().parent
+
+# ipaddress is not listed since pathlib pulls it in through urllib.parse
+FORBIDDEN_AT_STARTUP = ["pdb", "lxml", "lxml.etree", "pickle", "hcl", "terraform", "assets", "parse_cache", "solution_store", "sqlite3", "startup_configs", "resource_manifest"]
+# Only used when a lab is read or written
+FORBIDDEN_IN_TERRAFORM = ["lxml", "sqlite3", "resource_manifest", "hashlib", "json", "heapq", "random"]
+
+# Budgets are the cumulative import time in microseconds reported by
+# python -X importtime for the modules a scenario pulls in beyond the
+# interpreter's own startup.
+SCENARIOS = {
+    "help": {
+        "command": [str(REPO_DIRECTORY / "unl2terraform.py"), "--help"],
+        "budget": 30000,
+        "forbidden": FORBIDDEN_AT_STARTUP,
+    },
+    "import-unl2terraform": {
+        "command": ["-c", "import unl2terraform"],
+        "budget": 30000,
+        "forbidden": FORBIDDEN_AT_STARTUP,
+    },
+    "import-terraform": {
+        # Loading a saved solution only needs terraform, hcl and attr
+        "command": ["-c", "import terraform"],
+        "budget": 100000,
+        "forbidden": FORBIDDEN_IN_TERRAFORM,
+    },
+}
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Measure import time of unl2terraform startup paths against a budget")
+    parser.add_argument("-r", "--runs", type=int, default=5, help="Number of runs per scenario, the fastest is reported")
+    parser.add_argument("-s", "--scale", type=float, default=1.0, help="Multiply every budget by this factor for slower hosts")
+    return parser.parse_args()
+
+
+def parse_importtime(stderr):
+    """
+    Return (total cumulative microseconds, set of imported module names) for
+    the top level imports in python -X importtime output.
+    """
+    total = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, modules
+
+
+def run_scenario(command, runs):
+    baseline = []
+    measured = []
+    modules = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "pass"],
+            capture_output=True, text=True, cwd=REPO_DIRECTORY,
+        )
+        baseline_total, baseline_modules = parse_importtime(result.stderr)
+        baseline.append(baseline_total)
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *command],
+            capture_output=True, text=True, cwd=REPO_DIRECTORY,
+        )
+        total, modules = parse_importtime(result.stderr)
+        measured.append(total)
+    return min(measured) - min(baseline), modules - baseline_modules
+
+
+def main(args):
+    failed = False
+    for name, scenario in SCENARIOS.items():
+        cost, modules = run_scenario(scenario["command"], args.runs)
+        budget = scenario["budget"] * args.scale
+        status = "ok" if cost <= budget else "OVER BUDGET"
+        print(f"{name}: {cost / 1000:.1f} ms (budget {budget / 1000:.1f} ms) {status}")
+        if cost > budget:
+            failed = True
+        loaded = sorted(module for module in scenario["forbidden"] if module in modules)
+        if loaded:
+            print(f"{name}: modules that should be lazily imported were loaded: {', '.join(loaded)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = process_args()
+    main(args)
@@ -0,0 +1,80 @@
+resource "openstack_compute_instance_v2" "conductor" {
+  name         = "conductor"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.conductor_0.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.conductor_1.id
+  }
+}
+
+resource "openstack_compute_instance_v2" "router-a" {
+  name         = "router-a"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.router-a_0.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-a_1.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-a_2.id
+  }
+}
+
+resource "openstack_compute_instance_v2" "router-b" {
+  name         = "router-b"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.router-b_0.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-b_1.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-b_2.id
+  }
+}
+
+resource "openstack_compute_instance_v2" "client-a" {
+  name         = "client-a"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.client-a.rendered
+
+  network {
+    port = openstack_networking_port_v2.client-a_0.id
+  }
+}
+
+resource "openstack_compute_instance_v2" "client-b" {
+  name         = "client-b"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.client-b.rendered
+
+  network {
+    port = openstack_networking_port_v2.client-b_0.id
+  }
+}
+
@@ -0,0 +1,135 @@
+resource "openstack_networking_port_v2" "conductor_0" {
+  name       = "conductor_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = "192.168.2.5"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_0" {
+  name       = "router-a_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = "192.168.2.6"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_0" {
+  name       = "router-b_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = "192.168.2.7"
+  }
+}
+
+resource "openstack_networking_port_v2" "conductor_1" {
+  name       = "conductor_1"
+  network_id = openstack_networking_network_v2.wan.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan.id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6.id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_1" {
+  name       = "router-a_1"
+  network_id = openstack_networking_network_v2.wan.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan.id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6.id
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_1" {
+  name       = "router-b_1"
+  network_id = openstack_networking_network_v2.wan.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan.id
+    ip_address = "169.254.0.3"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6.id
+    ip_address = "fd00:10::3"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_2" {
+  name       = "router-a_2"
+  network_id = openstack_networking_network_v2.lan-a.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a.id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a_v6.id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-a_0" {
+  name       = "client-a_0"
+  network_id = openstack_networking_network_v2.lan-a.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a.id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a_v6.id
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_2" {
+  name       = "router-b_2"
+  network_id = openstack_networking_network_v2.lan-b.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b.id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b_v6.id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-b_0" {
+  name       = "client-b_0"
+  network_id = openstack_networking_network_v2.lan-b.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b.id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b_v6.id
+    ip_address = "fd00:10::2"
+  }
+}
+
@@ -0,0 +1,64 @@
+resource "openstack_networking_subnet_v2" "solution-management" {
+  name            = "solution-management"
+  network_id      = openstack_networking_network_v2.solution-management.id
+  cidr            = "192.168.2.0/24"
+  ip_version      = "4"
+  enable_dhcp     = "true"
+  no_gateway      = "false"
+  dns_nameservers = ["172.20.0.100", "172.20.0.101"]
+}
+
+resource "openstack_networking_subnet_v2" "wan" {
+  name        = "wan"
+  network_id  = openstack_networking_network_v2.wan.id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "wan_v6" {
+  name        = "wan_v6"
+  network_id  = openstack_networking_network_v2.wan.id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-a" {
+  name        = "lan-a"
+  network_id  = openstack_networking_network_v2.lan-a.id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-a_v6" {
+  name        = "lan-a_v6"
+  network_id  = openstack_networking_network_v2.lan-a.id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-b" {
+  name        = "lan-b"
+  network_id  = openstack_networking_network_v2.lan-b.id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-b_v6" {
+  name        = "lan-b_v6"
+  network_id  = openstack_networking_network_v2.lan-b.id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
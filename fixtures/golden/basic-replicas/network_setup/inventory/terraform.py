@@ -0,0 +1,74 @@
+#!/usr/bin/env python3.6
+###############################################################################
+# Copyright (c) 2018 128 Technology, Inc.
+# All rights reserved.
+###############################################################################
+"""
+Dynamic ansible inventory that discovers the necessary Terraform output data.
+Assumes the file is run from the network_setup/ directory.
+"""
+
+import argparse
+import os.path
+import sys
+
+#temporary until t128_solutions_tools is a package
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), '../../../../utils/lib'))
+import t128_solutions_tools
+
+
+def main():
+    args = parse_args()
+    dynamic_terraform = TerraformInventory()
+    if args.list:
+        result = dynamic_terraform.get_inventory_list()
+        print(result)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Dynamic host inventory')
+    parser.add_argument('--list', action='store_true', default=False)
+    return parser.parse_args()
+
+
+class TerraformInventory:
+    TERRAFORM_FILE = '../terraform_setup/terraform.tfstate'
+
+    def __init__(self):
+        TBM_FILE = 'files/testbed.json'
+        TERRAFORM_FILE = '../terraform_setup/terraform.tfstate'
+        if os.path.exists(TBM_FILE):
+            self._dut_names = ['bard-jumper', 'traffic-generator']
+        else:
+            self._dut_names = ['pod-1-conductor', 'pod-2-conductor', 'pod-3-conductor']
+        self._output = t128_solutions_tools.get_output(TBM_FILE, TERRAFORM_FILE)
+
+    def get_inventory_list(self):
+        json_template = t128_solutions_tools.create_template(
+            """
+            {{
+                "__terraform_dependent": ['pod-1-conductor', 'pod-2-conductor', 'pod-3-conductor'],
+                "_meta": {{
+                    "hostvars": {{
+                        "pod-1-conductor" : {{
+                            "ansible_host" : {pod_1_conductor}
+                        }},
+                        "pod-2-conductor" : {{
+                            "ansible_host" : {pod_2_conductor}
+                        }},
+                        "pod-3-conductor" : {{
+                            "ansible_host" : {pod_3_conductor}
+                        }}
+                    }}
+                }}
+            }}
+            """)
+
+        return json_template(
+            pod_1_conductor=self._output[self._dut_names[0]],
+            pod_2_conductor=self._output[self._dut_names[1]],
+            pod_3_conductor=self._output[self._dut_names[2]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+data "template_cloudinit_config" "default" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.default.rendered
+  }
+}
+
+data "template_cloudinit_config" "client-a" {
+  count = 3
+
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.client-a[count.index].rendered
+  }
+}
+
+data "template_cloudinit_config" "client-b" {
+  count = 3
+
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.client-b[count.index].rendered
+  }
+}
+
@@ -0,0 +1,15 @@
+groups:
+- t128
+users:
+- default
+- name: t128
+  primary-group: t128
+  groups: wheel
+  lock_passwd: False
+  plain_text_passwd: exit33
+chpasswd:
+  list: |
+    root:exit33
+  expire: False
+disable_root: False
+ssh_pwauth: True
@@ -0,0 +1,14 @@
+resource "openstack_networking_floatingip_v2" "conductor" {
+  count = 3
+
+  pool = var.external_network
+}
+
+resource "openstack_compute_floatingip_associate_v2" "conductor" {
+  count = 3
+
+  floating_ip = openstack_networking_floatingip_v2.conductor[count.index].address
+  instance_id = openstack_compute_instance_v2.conductor[count.index].id
+  fixed_ip    = openstack_compute_instance_v2.conductor[count.index].network.0.fixed_ip_v4
+}
+
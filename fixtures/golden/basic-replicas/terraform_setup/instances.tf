@@ -0,0 +1,90 @@
+resource "openstack_compute_instance_v2" "conductor" {
+  count = 3
+
+  name         = "pod-${count.index + 1}-conductor"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.conductor_0[count.index].id
+  }
+
+  network {
+    port = openstack_networking_port_v2.conductor_1[count.index].id
+  }
+}
+
+resource "openstack_compute_instance_v2" "router-a" {
+  count = 3
+
+  name         = "pod-${count.index + 1}-router-a"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.router-a_0[count.index].id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-a_1[count.index].id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-a_2[count.index].id
+  }
+}
+
+resource "openstack_compute_instance_v2" "router-b" {
+  count = 3
+
+  name         = "pod-${count.index + 1}-router-b"
+  image_id     = data.openstack_images_image_v2.t128_image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.router-b_0[count.index].id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-b_1[count.index].id
+  }
+
+  network {
+    port = openstack_networking_port_v2.router-b_2[count.index].id
+  }
+}
+
+resource "openstack_compute_instance_v2" "client-a" {
+  count = 3
+
+  name         = "pod-${count.index + 1}-client-a"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.client-a[count.index].rendered
+
+  network {
+    port = openstack_networking_port_v2.client-a_0[count.index].id
+  }
+}
+
+resource "openstack_compute_instance_v2" "client-b" {
+  count = 3
+
+  name         = "pod-${count.index + 1}-client-b"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.client-b[count.index].rendered
+
+  network {
+    port = openstack_networking_port_v2.client-b_0[count.index].id
+  }
+}
+
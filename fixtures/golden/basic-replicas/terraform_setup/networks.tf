@@ -0,0 +1,42 @@
+resource "openstack_networking_network_v2" "solution-management" {
+  name           = "solution-management"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "wan" {
+  count = 3
+
+  name           = "pod-${count.index + 1}-wan"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "lan-a" {
+  count = 3
+
+  name           = "pod-${count.index + 1}-lan-a"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "lan-b" {
+  count = 3
+
+  name           = "pod-${count.index + 1}-lan-b"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
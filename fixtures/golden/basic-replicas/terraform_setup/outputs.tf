@@ -0,0 +1,12 @@
+output "pod-1-conductor" {
+  value = openstack_networking_floatingip_v2.conductor[0].address
+}
+
+output "pod-2-conductor" {
+  value = openstack_networking_floatingip_v2.conductor[1].address
+}
+
+output "pod-3-conductor" {
+  value = openstack_networking_floatingip_v2.conductor[2].address
+}
+
@@ -0,0 +1,155 @@
+resource "openstack_networking_port_v2" "conductor_0" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-conductor_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = cidrhost(openstack_networking_subnet_v2.solution-management.cidr, 5 + count.index * 3)
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_0" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-a_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = cidrhost(openstack_networking_subnet_v2.solution-management.cidr, 6 + count.index * 3)
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_0" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-b_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = cidrhost(openstack_networking_subnet_v2.solution-management.cidr, 7 + count.index * 3)
+  }
+}
+
+resource "openstack_networking_port_v2" "conductor_1" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-conductor_1"
+  network_id = openstack_networking_network_v2.wan[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan[count.index].id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6[count.index].id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_1" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-a_1"
+  network_id = openstack_networking_network_v2.wan[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan[count.index].id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6[count.index].id
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_1" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-b_1"
+  network_id = openstack_networking_network_v2.wan[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan[count.index].id
+    ip_address = "169.254.0.3"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.wan_v6[count.index].id
+    ip_address = "fd00:10::3"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_2" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-a_2"
+  network_id = openstack_networking_network_v2.lan-a[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a[count.index].id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a_v6[count.index].id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-a_0" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-client-a_0"
+  network_id = openstack_networking_network_v2.lan-a[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a[count.index].id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-a_v6[count.index].id
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_2" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-router-b_2"
+  network_id = openstack_networking_network_v2.lan-b[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b[count.index].id
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b_v6[count.index].id
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-b_0" {
+  count = 3
+
+  name       = "pod-${count.index + 1}-client-b_0"
+  network_id = openstack_networking_network_v2.lan-b[count.index].id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b[count.index].id
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.lan-b_v6[count.index].id
+    ip_address = "fd00:10::2"
+  }
+}
+
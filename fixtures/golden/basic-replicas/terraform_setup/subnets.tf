@@ -0,0 +1,76 @@
+resource "openstack_networking_subnet_v2" "solution-management" {
+  name            = "solution-management"
+  network_id      = openstack_networking_network_v2.solution-management.id
+  cidr            = "192.168.2.0/24"
+  ip_version      = "4"
+  enable_dhcp     = "true"
+  no_gateway      = "false"
+  dns_nameservers = ["172.20.0.100", "172.20.0.101"]
+}
+
+resource "openstack_networking_subnet_v2" "wan" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-wan"
+  network_id  = openstack_networking_network_v2.wan[count.index].id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "wan_v6" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-wan_v6"
+  network_id  = openstack_networking_network_v2.wan[count.index].id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-a" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-lan-a"
+  network_id  = openstack_networking_network_v2.lan-a[count.index].id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-a_v6" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-lan-a_v6"
+  network_id  = openstack_networking_network_v2.lan-a[count.index].id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-b" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-lan-b"
+  network_id  = openstack_networking_network_v2.lan-b[count.index].id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
+resource "openstack_networking_subnet_v2" "lan-b_v6" {
+  count = 3
+
+  name        = "pod-${count.index + 1}-lan-b_v6"
+  network_id  = openstack_networking_network_v2.lan-b[count.index].id
+  cidr        = "fd00:10::/64"
+  ip_version  = "6"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
@@ -0,0 +1,30 @@
+data "template_file" "default" {
+  template = file("${path.module}/default.tpl")
+}
+
+data "template_file" "client-a" {
+  count = 3
+
+  template = file("${path.module}/static_eth0.tpl")
+
+  vars = {
+    ip-address    = openstack_networking_port_v2.client-a_0[count.index].all_fixed_ips[0]
+    prefix-length = element(split("/", openstack_networking_subnet_v2.lan-a[count.index].cidr), 1)
+    gateway-ip    = openstack_networking_port_v2.router-a_2[count.index].all_fixed_ips[0]
+    nameserver    = "172.20.0.100"
+  }
+}
+
+data "template_file" "client-b" {
+  count = 3
+
+  template = file("${path.module}/static_eth0.tpl")
+
+  vars = {
+    ip-address    = openstack_networking_port_v2.client-b_0[count.index].all_fixed_ips[0]
+    prefix-length = element(split("/", openstack_networking_subnet_v2.lan-b[count.index].cidr), 1)
+    gateway-ip    = openstack_networking_port_v2.router-b_2[count.index].all_fixed_ips[0]
+    nameserver    = "172.20.0.100"
+  }
+}
+
@@ -0,0 +1,4 @@
+resource "openstack_networking_floatingip_v2" "conductor" {
+  pool = var.external_network
+}
+
@@ -0,0 +1,10 @@
+data "template_cloudinit_config" "default" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.default.rendered
+  }
+}
+
@@ -0,0 +1,6 @@
+resource "openstack_compute_floatingip_associate_v2" "conductor" {
+  floating_ip = data.terraform_remote_state.core.outputs.floating_ip_addresses["conductor"]
+  instance_id = openstack_compute_instance_v2.conductor.id
+  fixed_ip    = openstack_compute_instance_v2.conductor.network.0.fixed_ip_v4
+}
+
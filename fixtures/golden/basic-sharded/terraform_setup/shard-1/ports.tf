@@ -0,0 +1,65 @@
+resource "openstack_networking_port_v2" "conductor_0" {
+  name       = "conductor_0"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["solution-management"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["solution-management"]
+    ip_address = "192.168.2.5"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_0" {
+  name       = "router-a_0"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["solution-management"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["solution-management"]
+    ip_address = "192.168.2.6"
+  }
+}
+
+resource "openstack_networking_port_v2" "conductor_1" {
+  name       = "conductor_1"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["wan"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan"]
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan_v6"]
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_1" {
+  name       = "router-a_1"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["wan"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan"]
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan_v6"]
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-a_2" {
+  name       = "router-a_2"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["lan-a"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-a"]
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-a_v6"]
+    ip_address = "fd00:10::1"
+  }
+}
+
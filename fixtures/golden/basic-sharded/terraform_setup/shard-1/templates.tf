@@ -0,0 +1,4 @@
+data "template_file" "default" {
+  template = file("${path.module}/default.tpl")
+}
+
@@ -0,0 +1,70 @@
+resource "openstack_networking_port_v2" "router-b_0" {
+  name       = "router-b_0"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["solution-management"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["solution-management"]
+    ip_address = "192.168.2.7"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_1" {
+  name       = "router-b_1"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["wan"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan"]
+    ip_address = "169.254.0.3"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["wan_v6"]
+    ip_address = "fd00:10::3"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-a_0" {
+  name       = "client-a_0"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["lan-a"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-a"]
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-a_v6"]
+    ip_address = "fd00:10::2"
+  }
+}
+
+resource "openstack_networking_port_v2" "router-b_2" {
+  name       = "router-b_2"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["lan-b"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-b"]
+    ip_address = "169.254.0.1"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-b_v6"]
+    ip_address = "fd00:10::1"
+  }
+}
+
+resource "openstack_networking_port_v2" "client-b_0" {
+  name       = "client-b_0"
+  network_id = data.terraform_remote_state.core.outputs.network_ids["lan-b"]
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-b"]
+    ip_address = "169.254.0.2"
+  }
+
+  fixed_ip {
+    subnet_id  = data.terraform_remote_state.core.outputs.subnet_ids["lan-b_v6"]
+    ip_address = "fd00:10::2"
+  }
+}
+
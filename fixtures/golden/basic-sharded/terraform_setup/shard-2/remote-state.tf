@@ -0,0 +1,7 @@
+data "terraform_remote_state" "core" {
+  backend = "local"
+
+  config = {
+    path = "../terraform.tfstate"
+  }
+}
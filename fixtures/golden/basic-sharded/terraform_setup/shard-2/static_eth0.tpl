@@ -0,0 +1,41 @@
+groups:
+- t128
+- ha_user
+users:
+- default
+- name: t128
+  primary-group: t128
+  groups: wheel
+  lock_passwd: False
+  plain_text_passwd: exit33
+- name: ha_user
+  primary-group: ha_user
+  groups: wheel
+  sudo: ALL=(ALL) ALL
+  lock_passwd: False
+  plain_text_passwd: exit33
+chpasswd:
+  list: |
+    root:exit33
+  expire: False
+disable_root: False
+ssh_pwauth: True
+
+write_files:
+- path: /etc/sysconfig/network-scripts/ifcfg-eth0
+  content: |
+    DEVICE="eth0"
+    USERCTL="no"
+    TYPE="Ethernet"
+    BOOTPROTO="none"
+    ONBOOT="yes"
+    IPADDR="${ip-address}"
+    PREFIX="${prefix-length}"
+    GATEWAY="${gateway-ip}"
+    DNS1="${nameserver}"
+    
+runcmd:
+- systemctl restart network
+# Don't use DNS for sshd because the public ip lookups will time out
+- sed -i 's/^#UseDNS yes$/UseDNS no/' /etc/ssh/sshd_config
+- systemctl restart sshd
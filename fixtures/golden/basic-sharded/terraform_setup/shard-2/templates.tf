@@ -0,0 +1,26 @@
+data "template_file" "default" {
+  template = file("${path.module}/default.tpl")
+}
+
+data "template_file" "client-a" {
+  template = file("${path.module}/static_eth0.tpl")
+
+  vars = {
+    ip-address    = openstack_networking_port_v2.client-a_0.all_fixed_ips[0]
+    prefix-length = element(split("/", data.terraform_remote_state.core.outputs.subnet_cidrs["lan-a"]), 1)
+    gateway-ip    = "169.254.0.1"
+    nameserver    = "172.20.0.100"
+  }
+}
+
+data "template_file" "client-b" {
+  template = file("${path.module}/static_eth0.tpl")
+
+  vars = {
+    ip-address    = openstack_networking_port_v2.client-b_0.all_fixed_ips[0]
+    prefix-length = element(split("/", data.terraform_remote_state.core.outputs.subnet_cidrs["lan-b"]), 1)
+    gateway-ip    = openstack_networking_port_v2.router-b_2.all_fixed_ips[0]
+    nameserver    = "172.20.0.100"
+  }
+}
+
@@ -0,0 +1,40 @@
+variable "openstack_user" {
+  default = ""
+}
+
+variable "openstack_domain_name" {
+  default = "128T"
+}
+
+variable "openstack_project_name" {
+  default = "solutionTest"
+}
+
+variable "external_network" {
+  default = "public"
+}
+
+variable "image" {
+  default = "se-centos7-e1000"
+}
+
+variable "t128_image" {
+  default = "128T-5.4.3-2.el7"
+}
+
+variable "traffic_generator_image" {
+  default = "centos_td20190517-163222"
+}
+
+variable "openstack_auth_url" {
+  default = "https://spaceport.lab.128technology.com:5000/v3"
+}
+
+variable "openstack_region" {
+  default = "RegionOne"
+}
+
+variable "vm_flavor" {
+  default = "dev_medium"
+}
+
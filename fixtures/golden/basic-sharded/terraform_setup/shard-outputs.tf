@@ -0,0 +1,34 @@
+output "floating_ip_addresses" {
+  value = {
+    "conductor" = openstack_networking_floatingip_v2.conductor.address
+  }
+}
+
+output "network_ids" {
+  value = {
+    "lan-a"               = openstack_networking_network_v2.lan-a.id
+    "lan-b"               = openstack_networking_network_v2.lan-b.id
+    "solution-management" = openstack_networking_network_v2.solution-management.id
+    "wan"                 = openstack_networking_network_v2.wan.id
+  }
+}
+
+output "subnet_cidrs" {
+  value = {
+    "lan-a" = openstack_networking_subnet_v2.lan-a.cidr
+    "lan-b" = openstack_networking_subnet_v2.lan-b.cidr
+  }
+}
+
+output "subnet_ids" {
+  value = {
+    "lan-a"               = openstack_networking_subnet_v2.lan-a.id
+    "lan-a_v6"            = openstack_networking_subnet_v2.lan-a_v6.id
+    "lan-b"               = openstack_networking_subnet_v2.lan-b.id
+    "lan-b_v6"            = openstack_networking_subnet_v2.lan-b_v6.id
+    "solution-management" = openstack_networking_subnet_v2.solution-management.id
+    "wan"                 = openstack_networking_subnet_v2.wan.id
+    "wan_v6"              = openstack_networking_subnet_v2.wan_v6.id
+  }
+}
+
@@ -0,0 +1,4 @@
+output "conductor" {
+  value = openstack_networking_floatingip_v2.conductor.address
+}
+
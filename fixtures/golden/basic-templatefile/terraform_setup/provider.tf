@@ -0,0 +1,16 @@
+terraform {
+  required_providers {
+    openstack = {
+      source  = "terraform-provider-openstack/openstack"
+      version = "1.46.0"
+    }
+  }
+}
+
+provider "openstack" {
+  auth_url    = var.openstack_auth_url
+  domain_name = var.openstack_domain_name
+  region      = var.openstack_region
+  tenant_name = var.openstack_project_name
+  user_name   = var.openstack_user
+}
@@ -0,0 +1,13 @@
+data "openstack_networking_network_v2" "external-network" {
+  name = var.external_network
+}
+
+resource "openstack_networking_router_v2" "solution-management" {
+  name                = "solution-management"
+  external_network_id = data.openstack_networking_network_v2.external-network.id
+}
+
+resource "openstack_networking_router_interface_v2" "solution-management" {
+  router_id = openstack_networking_router_v2.solution-management.id
+  subnet_id = openstack_networking_subnet_v2.solution-management.id
+}
@@ -0,0 +1,30 @@
+data "template_cloudinit_config" "default" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.default.rendered
+  }
+}
+
+data "template_cloudinit_config" "client-a" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.client-a.rendered
+  }
+}
+
+data "template_cloudinit_config" "client-b" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.client-b.rendered
+  }
+}
+
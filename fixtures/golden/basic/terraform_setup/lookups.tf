@@ -0,0 +1,12 @@
+data "openstack_images_image_v2" "t128_image" {
+  name = var.t128_image
+}
+
+data "openstack_images_image_v2" "image" {
+  name = var.image
+}
+
+data "openstack_compute_flavor_v2" "vm_flavor" {
+  name = var.vm_flavor
+}
+
@@ -0,0 +1,36 @@
+resource "openstack_networking_network_v2" "solution-management" {
+  name           = "solution-management"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "wan" {
+  name           = "wan"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "lan-a" {
+  name           = "lan-a"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "lan-b" {
+  name           = "lan-b"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
@@ -0,0 +1,28 @@
+#!/usr/bin/env bash
+
+# To use an OpenStack cloud you need to authenticate against the Identity
+# service named keystone, which returns a **Token** and **Service Catalog**.
+# The catalog contains the endpoints for all services the user/tenant has
+# access to - such as Compute, Image Service, Identity, Object Storage, Block
+# Storage, and Networking (code-named nova, glance, keystone, swift,
+# cinder, and neutron).
+#
+# For more information on Openstack configuration, see:
+# https://docs.openstack.org/python-openstackclient/latest/configuration/index.html
+#
+# Instead of explicitly setting Openstack environment variables with this
+# script, most Openstack preferences are set in overridable terraform
+# variables. Source this file to enter your Openstack password, which will
+# be stored in an environment variable, which is somewhat better than
+# storing it in a file
+#
+# To download your project's full openrc.sh file to set these variables
+# - go to: Project >> Compute >> Access & Security
+# - select the "API Access" tab
+# - choose "Download OpenStack RC File v3"
+# - source the downloaded file
+
+# With Keystone you pass the keystone password.
+echo "Please enter your OpenStack Password where Project and User names are set as terraform variables: "
+read -sr OS_PASSWORD_INPUT
+export OS_PASSWORD=$OS_PASSWORD_INPUT
@@ -0,0 +1,20 @@
+data "template_cloudinit_config" "default" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.default.rendered
+  }
+}
+
+data "template_cloudinit_config" "openstack_client" {
+  gzip          = "false"
+  base64_encode = "false"
+
+  part {
+    content_type = "text/cloud-config"
+    content      = data.template_file.openstack_client.rendered
+  }
+}
+
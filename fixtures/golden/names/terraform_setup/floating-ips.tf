@@ -0,0 +1,10 @@
+resource "openstack_networking_floatingip_v2" "file-server" {
+  pool = var.external_network
+}
+
+resource "openstack_compute_floatingip_associate_v2" "file-server" {
+  floating_ip = openstack_networking_floatingip_v2.file-server.address
+  instance_id = openstack_compute_instance_v2.file-server.id
+  fixed_ip    = openstack_compute_instance_v2.file-server.network.0.fixed_ip_v4
+}
+
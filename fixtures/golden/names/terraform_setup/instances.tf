@@ -0,0 +1,28 @@
+resource "openstack_compute_instance_v2" "file-server" {
+  name         = "file-server"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.default.rendered
+
+  network {
+    port = openstack_networking_port_v2.file-server_0.id
+  }
+
+  network {
+    port = openstack_networking_port_v2.file-server_1.id
+  }
+}
+
+resource "openstack_compute_instance_v2" "openstack_client" {
+  name         = "openstack_client"
+  image_id     = data.openstack_images_image_v2.image.id
+  flavor_id    = data.openstack_compute_flavor_v2.vm_flavor.id
+  config_drive = "true"
+  user_data    = data.template_cloudinit_config.openstack_client.rendered
+
+  network {
+    port = openstack_networking_port_v2.openstack_client_0.id
+  }
+}
+
@@ -0,0 +1,8 @@
+data "openstack_images_image_v2" "image" {
+  name = var.image
+}
+
+data "openstack_compute_flavor_v2" "vm_flavor" {
+  name = var.vm_flavor
+}
+
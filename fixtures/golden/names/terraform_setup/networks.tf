@@ -0,0 +1,18 @@
+resource "openstack_networking_network_v2" "solution-management" {
+  name           = "solution-management"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
+resource "openstack_networking_network_v2" "file-share" {
+  name           = "file-share"
+  admin_state_up = "true"
+
+  value_specs = {
+    port_security_enabled = "false"
+  }
+}
+
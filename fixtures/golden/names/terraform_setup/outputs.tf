@@ -0,0 +1,4 @@
+output "file-server" {
+  value = openstack_networking_floatingip_v2.file-server.address
+}
+
@@ -0,0 +1,30 @@
+resource "openstack_networking_port_v2" "file-server_0" {
+  name       = "file-server_0"
+  network_id = openstack_networking_network_v2.solution-management.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.solution-management.id
+    ip_address = "192.168.2.5"
+  }
+}
+
+resource "openstack_networking_port_v2" "file-server_1" {
+  name       = "file-server_1"
+  network_id = openstack_networking_network_v2.file-share.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.file-share.id
+    ip_address = "169.254.0.1"
+  }
+}
+
+resource "openstack_networking_port_v2" "openstack_client_0" {
+  name       = "openstack_client_0"
+  network_id = openstack_networking_network_v2.file-share.id
+
+  fixed_ip {
+    subnet_id  = openstack_networking_subnet_v2.file-share.id
+    ip_address = "169.254.0.2"
+  }
+}
+
@@ -0,0 +1,19 @@
+resource "openstack_networking_subnet_v2" "solution-management" {
+  name            = "solution-management"
+  network_id      = openstack_networking_network_v2.solution-management.id
+  cidr            = "192.168.2.0/24"
+  ip_version      = "4"
+  enable_dhcp     = "true"
+  no_gateway      = "false"
+  dns_nameservers = ["172.20.0.100", "172.20.0.101"]
+}
+
+resource "openstack_networking_subnet_v2" "file-share" {
+  name        = "file-share"
+  network_id  = openstack_networking_network_v2.file-share.id
+  cidr        = "169.254.0.0/16"
+  ip_version  = "4"
+  enable_dhcp = "false"
+  no_gateway  = "true"
+}
+
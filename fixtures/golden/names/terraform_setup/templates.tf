@@ -0,0 +1,15 @@
+data "template_file" "default" {
+  template = file("${path.module}/default.tpl")
+}
+
+data "template_file" "openstack_client" {
+  template = file("${path.module}/static_eth0.tpl")
+
+  vars = {
+    ip-address    = openstack_networking_port_v2.openstack_client_0.all_fixed_ips[0]
+    prefix-length = element(split("/", openstack_networking_subnet_v2.file-share.cidr), 1)
+    gateway-ip    = openstack_networking_port_v2.file-server_1.all_fixed_ips[0]
+    nameserver    = "172.20.0.100"
+  }
+}
+
@@ -0,0 +1,494 @@
+#!/usr/bin/python3
+import argparse
+import gzip
+import hashlib
+import json
+import lzma
+import pathlib
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import solution_store
+import unl2terraform
+
+REPO_DIRECTORY = pathlib.Path(__file__).resolve().parent
+LABS_DIRECTORY = REPO_DIRECTORY / "fixtures" / "labs"
+GOLDEN_DIRECTORY = REPO_DIRECTORY / "fixtures" / "golden"
+OUTPUT_DIRECTORIES = ["terraform_setup", "network_setup"]
+
+# Checked-in labs, compared file by file against a full copy of their output
+FIXTURE_RUNS = [
+    {"name": "basic", "unl_file": "basic.unl", "ipv6_cidr": None},
+    {"name": "basic-dual-stack", "unl_file": "basic.unl", "ipv6_cidr": "fd00:10::/64"},
+    {"name": "basic-templatefile", "unl_file": "basic.unl", "ipv6_cidr": None, "cloud_init_mode": "templatefile"},
+    {"name": "configs", "unl_file": "configs.unl", "ipv6_cidr": None},
+    {"name": "basic-sharded", "unl_file": "basic.unl", "ipv6_cidr": "fd00:10::/64", "shard_count": 2},
+    {"name": "basic-replicas", "unl_file": "basic.unl", "ipv6_cidr": "fd00:10::/64", "replicas": 3},
+    # Names the old regex took for Terraform expressions and left unquoted
+    {"name": "names", "unl_file": "names.unl", "ipv6_cidr": None},
+]
+
+# Generated labs of the given node count, compared against a sha256 manifest
+# of their output. Budgets are (seconds, peak MiB) per phase, about three
+# times what each phase measured when they were set, with a little more room
+# for phases of a few milliseconds. Memory is what tracemalloc sees, except
+# for the parse, where it is how far RSS rises.
+BUDGETS = {
+    200: {
+        "parse": (0.01, 3),
+        "plan": (0.05, 5),
+        "write_terraform": (0.1, 3),
+        "write_ansible": (0.05, 1),
+    },
+    2000: {
+        "parse": (0.05, 20),
+        "plan": (0.75, 50),
+        "write_terraform": (1.0, 25),
+        "write_ansible": (0.35, 1),
+    },
+}
+# Generated labs are written to memory when the host allows it, so the write
+# budgets measure the tool and not how fast a disk takes 2000 small files
+GENERATED_WORK_DIRECTORY = pathlib.Path("/dev/shm")
+
+# Fixture labs are smaller than the sample estimate_output renders, so their
+# estimate has to be exact. Generated labs may be off by this fraction of a
+# file's size.
+ESTIMATE_TOLERANCE = 0.05
+
+# Node count of the lab used to compare input types. It has to be large
+# enough for the parse to rise above the interpreter's own peak RSS.
+INPUT_SIZE = 20000
+
+# Node count of the lab saved to a solution store, the most one saved port
+# row may take and the most an opened store may hold in memory. Saving after
+# one port edit should write that row alone.
+STORE_SIZE = 2000
+PORT_ROW_BYTES = 4096
+STORE_OPEN_MIB = 1
+
+# Parses one input in a fresh interpreter and prints how far RSS rose above
+# its starting point during parse_unl, in KiB, and a digest of the parsed
+# tree. RSS is used since most of the parse happens inside libxml2 where
+# tracemalloc can't see. ru_maxrss is no good here since a child inherits
+# its parent's peak, so the peak is reset through /proc (Linux only).
+MEASURE_PARSE = """
+import hashlib, pathlib, sys
+from lxml import etree
+import unl2terraform
+
+def status(field):
+    for line in open("/proc/self/status"):
+        if line.startswith(field + ":"):
+            return int(line.split()[1])
+
+open("/proc/self/clear_refs", "w").write("5")
+before = status("VmRSS")
+root = unl2terraform.parse_unl(pathlib.Path(sys.argv[1]))
+print(status("VmHWM") - before, hashlib.sha256(etree.tostring(root)).hexdigest())
+"""
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Compare conversion output against golden copies and check performance budgets")
+    parser.add_argument("--update", action="store_true", help="Rewrite the golden copies from the current output")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(BUDGETS), help="Generated lab sizes to check")
+    parser.add_argument("-s", "--scale", type=float, default=1.0, help="Multiply every time budget by this factor for slower hosts")
+    return parser.parse_args()
+
+
+def generate_unl(node_count):
+    """
+    Build a lab with three interfaces per node. Every tenth node has eth0 on
+    the management network and there is one lab network per twenty nodes.
+    """
+    network_count = max(2, node_count // 20)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
+        f'<lab name="generated-{node_count}" version="1" scripttimeout="300" lock="0">',
+        "  <topology>",
+        "    <nodes>",
+    ]
+    for index in range(node_count):
+        template = "128T" if index % 4 == 0 else "linux"
+        eth0_network = 1 if index % 10 == 0 else 2 + index % network_count
+        lines.append(f'      <node id="{index + 1}" name="node-{index}" type="qemu" template="{template}" ethernet="3">')
+        lines.append(f'        <interface id="0" name="eth0" type="ethernet" network_id="{eth0_network}"/>')
+        lines.append(f'        <interface id="1" name="eth1" type="ethernet" network_id="{2 + (index + 1) % network_count}"/>')
+        lines.append(f'        <interface id="2" name="eth2" type="ethernet" network_id="{2 + (index + 7) % network_count}"/>')
+        lines.append("      </node>")
+    lines += ["    </nodes>", "    <networks>"]
+    lines.append('      <network id="1" type="pnet0" name="solution-management"/>')
+    for index in range(network_count):
+        lines.append(f'      <network id="{index + 2}" type="bridge" name="network-{index}"/>')
+    lines += ["    </networks>", "  </topology>", "</lab>"]
+    return "\n".join(lines) + "\n"
+
+
+def apply_standard_edits(solution, cloud_init_mode=None, shard_count=0, replicas=0):
+    """
+    The edits a user would make before writing: the first port of every lab
+    subnet is its gateway and the first instance on the management network
+    gets a floating IP.
+    """
+    if cloud_init_mode:
+        solution.cloud_init_mode = cloud_init_mode
+    solution.shard_count = shard_count
+    solution.replicas = replicas
+    for subnet in solution.subnets:
+        if subnet.subnet_name != solution.management_network_name and subnet.ports:
+            subnet.gateway_port_name = subnet.ports[0].name
+    for instance in solution.instances:
+        port0, _ = solution.get_port_by_name(instance.port_names[0])
+        if port0.subnet_name == solution.management_network_name:
+            instance.floating_ip = True
+            break
+
+
+def convert(unl_file, output_directory, ipv6_cidr=None, trace_memory=False, cloud_init_mode=None, shard_count=0, replicas=0):
+    """
+    Run every conversion phase and return {phase: (seconds, peak MiB)}. Peak
+    memory is only measured when trace_memory is set since tracing slows
+    every phase down. The parse is measured by how far RSS rises, since
+    tracemalloc can't see the tree libxml2 builds.
+    """
+    results = {}
+    state = {}
+    config_directory = output_directory / OUTPUT_DIRECTORIES[1] / "files"
+    phases = [
+        ("parse", lambda: state.update(unl_xml=unl2terraform.parse_unl(unl_file, config_directory))),
+        ("plan", lambda: state.update(solution=unl2terraform.plan_solution(state["unl_xml"], output_directory, ipv6_cidr))),
+        ("edit", lambda: apply_standard_edits(state["solution"], cloud_init_mode, shard_count, replicas)),
+        ("write_terraform", lambda: state["solution"].write_terraform()),
+        ("write_ansible", lambda: state["solution"].write_ansible()),
+    ]
+    for phase, run in phases:
+        measure_rss = trace_memory and phase == "parse"
+        if measure_rss:
+            rss_start = reset_peak_rss()
+        elif trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        peak = 0
+        if measure_rss:
+            peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 1024
+        elif trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+        results[phase] = (seconds, peak)
+    return results
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS that getrusage() reports to the current RSS, and
+    return it in KiB. Linux only.
+    """
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def output_files(output_directory):
+    files = {}
+    for directory in OUTPUT_DIRECTORIES:
+        for path in sorted((output_directory / directory).rglob("*")):
+            if path.is_file():
+                files[path.relative_to(output_directory).as_posix()] = path
+    return files
+
+
+def compare_trees(golden_directory, output_directory):
+    golden = output_files(golden_directory)
+    output = output_files(output_directory)
+    problems = [f"missing {name}" for name in golden if name not in output]
+    problems += [f"unexpected {name}" for name in output if name not in golden]
+    problems += [
+        f"differs {name}" for name in golden
+        if name in output and golden[name].read_bytes() != output[name].read_bytes()
+    ]
+    return problems
+
+
+def manifest(output_directory):
+    return {
+        name: hashlib.sha256(path.read_bytes()).hexdigest()
+        for name, path in output_files(output_directory).items()
+    }
+
+
+def compare_manifests(golden, output):
+    problems = [f"missing {name}" for name in golden if name not in output]
+    problems += [f"unexpected {name}" for name in output if name not in golden]
+    problems += [f"differs {name}" for name in golden if name in output and golden[name] != output[name]]
+    return problems
+
+
+def check_fixtures(args):
+    failed = False
+    for run in FIXTURE_RUNS:
+        golden_directory = GOLDEN_DIRECTORY / run["name"]
+        with tempfile.TemporaryDirectory() as output_directory:
+            output_directory = pathlib.Path(output_directory)
+            convert(
+                LABS_DIRECTORY / run["unl_file"], output_directory, run["ipv6_cidr"],
+                cloud_init_mode=run.get("cloud_init_mode"), shard_count=run.get("shard_count", 0),
+                replicas=run.get("replicas", 0),
+            )
+            if args.update:
+                shutil.rmtree(golden_directory, ignore_errors=True)
+                for directory in OUTPUT_DIRECTORIES:
+                    shutil.copytree(output_directory / directory, golden_directory / directory)
+                print(f"{run['name']}: golden copy updated")
+                continue
+            problems = compare_trees(golden_directory, output_directory)
+        for problem in problems:
+            print(f"{run['name']}: {problem}")
+        print(f"{run['name']}: {'FAILED' if problems else 'ok'}")
+        failed = failed or bool(problems)
+    return failed
+
+
+def check_generated(args):
+    failed = False
+    for size in args.sizes:
+        name = f"generated-{size}"
+        golden_file = GOLDEN_DIRECTORY / f"{name}.json"
+        work_parent = GENERATED_WORK_DIRECTORY if GENERATED_WORK_DIRECTORY.is_dir() else None
+        with tempfile.TemporaryDirectory(dir=work_parent) as work_directory:
+            work_directory = pathlib.Path(work_directory)
+            unl_file = work_directory / f"{name}.unl"
+            unl_file.write_text(generate_unl(size))
+            timing_directory = work_directory / "timing"
+            memory_directory = work_directory / "memory"
+            timing_directory.mkdir()
+            memory_directory.mkdir()
+            # Memory first, while the heap has no freed space from an
+            # earlier parse that would hide how far RSS rises
+            memory = convert(unl_file, memory_directory, trace_memory=True)
+            timings = convert(unl_file, timing_directory)
+            output = manifest(timing_directory)
+
+        if args.update:
+            golden_file.write_text(json.dumps(output, indent=2, sort_keys=True) + "\n")
+            print(f"{name}: golden manifest updated")
+        else:
+            problems = compare_manifests(json.loads(golden_file.read_text()), output)
+            for problem in problems:
+                print(f"{name}: {problem}")
+            failed = failed or bool(problems)
+
+        for phase, (seconds, _) in timings.items():
+            peak = memory[phase][1]
+            budget = BUDGETS.get(size, {}).get(phase)
+            status = ""
+            if budget is not None:
+                seconds_budget = budget[0] * args.scale
+                over = seconds > seconds_budget or peak > budget[1]
+                status = f" (budget {seconds_budget:.2f}s, {budget[1]} MiB) {'OVER BUDGET' if over else 'ok'}"
+                failed = failed or over
+            print(f"{name} {phase}: {seconds:.3f}s, {peak:.1f} MiB{status}")
+    return failed
+
+
+def estimate_problems(estimate, output_directory, startup_configs, tolerance):
+    written = {}
+    for name, path in output_files(output_directory).items():
+        if path.parent.name == "files" and path.suffix == ".cfg" and path.stem in startup_configs:
+            continue
+        name = pathlib.PurePosixPath(name)
+        key = name
+        if name not in estimate:
+            # The variables of every host or group are estimated as one entry
+            key = next((key for key in estimate if "*" in key.name and name.match(str(key))), name)
+        written[key] = written.get(key, 0) + path.stat().st_size
+    problems = [f"not estimated {key}" for key in written if key not in estimate]
+    problems += [f"estimated but not written {key}" for key in estimate if key not in written]
+    problems += [
+        f"estimated {estimate[key]} bytes for {key}, wrote {size}" for key, size in written.items()
+        if key in estimate and abs(estimate[key] - size) > tolerance * size
+    ]
+    return problems
+
+
+def check_estimates(args):
+    """
+    Compare what estimate_output, and so --dry-run, predicts with the files
+    a conversion writes: the golden copies of the fixture runs and a fresh
+    write of each generated lab
+    """
+    failed = False
+    for run in FIXTURE_RUNS:
+        golden_directory = GOLDEN_DIRECTORY / run["name"]
+        solution = unl2terraform.plan_solution(
+            unl2terraform.parse_unl(LABS_DIRECTORY / run["unl_file"]), golden_directory, run["ipv6_cidr"])
+        apply_standard_edits(solution, run.get("cloud_init_mode"), run.get("shard_count", 0), run.get("replicas", 0))
+        problems = estimate_problems(solution.estimate_output(), golden_directory, solution.startup_configs, 0)
+        for problem in problems:
+            print(f"{run['name']} estimate: {problem}")
+        print(f"{run['name']} estimate: {'FAILED' if problems else 'ok'}")
+        failed = failed or bool(problems)
+
+    for size in args.sizes:
+        name = f"generated-{size}"
+        work_parent = GENERATED_WORK_DIRECTORY if GENERATED_WORK_DIRECTORY.is_dir() else None
+        with tempfile.TemporaryDirectory(dir=work_parent) as work_directory:
+            work_directory = pathlib.Path(work_directory)
+            unl_file = work_directory / f"{name}.unl"
+            unl_file.write_text(generate_unl(size))
+            output_directory = work_directory / "output"
+            output_directory.mkdir()
+            solution = unl2terraform.plan_solution(unl2terraform.parse_unl(unl_file), output_directory)
+            apply_standard_edits(solution)
+            estimate = solution.estimate_output()
+            solution.write_terraform()
+            solution.write_ansible()
+            problems = estimate_problems(estimate, output_directory, solution.startup_configs, ESTIMATE_TOLERANCE)
+        for problem in problems:
+            print(f"{name} estimate: {problem}")
+        print(f"{name} estimate within {ESTIMATE_TOLERANCE:.0%}: {'FAILED' if problems else 'ok'}")
+        failed = failed or bool(problems)
+    return failed
+
+
+def check_inputs():
+    """
+    Parse a generated lab as a plain, gzip and xz file and from stdin,
+    report the peak memory of each and check they parse the same
+    """
+    size = INPUT_SIZE
+    with tempfile.TemporaryDirectory() as work_directory:
+        work_directory = pathlib.Path(work_directory)
+        text = generate_unl(size).encode()
+        inputs = {
+            "plain": work_directory / "lab.unl",
+            "gzip": work_directory / "lab.unl.gz",
+            "xz": work_directory / "lab.unl.xz",
+        }
+        inputs["plain"].write_bytes(text)
+        inputs["gzip"].write_bytes(gzip.compress(text))
+        inputs["xz"].write_bytes(lzma.compress(text))
+
+        digests = set()
+        for input_type, path in [*inputs.items(), ("stdin", inputs["plain"])]:
+            with open(path, "rb") as stdin:
+                result = subprocess.run(
+                    [sys.executable, "-c", MEASURE_PARSE, "-" if input_type == "stdin" else str(path)],
+                    stdin=stdin, capture_output=True, text=True, cwd=REPO_DIRECTORY, check=True,
+                )
+            peak, digest = result.stdout.split()
+            digests.add(digest)
+            print(f"generated-{size} parse {input_type}: {int(peak) / 1024:.1f} MiB")
+
+    if len(digests) > 1:
+        print(f"generated-{size}: input types parse to different trees")
+        return True
+    return False
+
+
+def store_rows(store):
+    return {
+        (table, name): (digest, size)
+        for table in solution_store.TABLES
+        for name, digest, size in store.connection.execute(f"SELECT name, digest, length(data) FROM {table}")
+    }
+
+
+def check_store():
+    """
+    Save a generated lab to a solution store and open it. The opened
+    solution should hold little in memory, write the same output as the
+    solution it was saved from, and after one port edit through its history
+    commit that port's row and nothing else.
+    """
+    name = f"generated-{STORE_SIZE}"
+    with tempfile.TemporaryDirectory(dir=GENERATED_WORK_DIRECTORY) as work_directory:
+        work_directory = pathlib.Path(work_directory)
+        unl_file = work_directory / f"{name}.unl"
+        unl_file.write_text(generate_unl(STORE_SIZE))
+        store_file = work_directory / f"{name}.db"
+        output_directories = [work_directory / "memory", work_directory / "store"]
+        for output_directory in output_directories:
+            output_directory.mkdir()
+        solution = unl2terraform.plan_solution(unl2terraform.parse_unl(unl_file), output_directories[0])
+        apply_standard_edits(solution)
+        solution_store.save(solution, store_file)
+
+        tracemalloc.start()
+        stored_solution = solution_store.SolutionStore(store_file).open()
+        held = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        before = store_rows(stored_solution.store)
+        subnet = stored_solution.subnets[-1]
+        port = subnet.ports[0]
+        stored_solution.history.record(f"address of {port.name}", port)
+        address = next(subnet.available_addresses())
+        port.update_address(address, subnet.ip_version)
+        written = solution_store.save(stored_solution, store_file)
+        after = store_rows(stored_solution.store)
+
+        stored_solution.output_directory = output_directories[1]
+        memory_port, _ = solution.get_port_by_name(port.name)
+        memory_port.update_address(address, subnet.ip_version)
+        for output_solution in [solution, stored_solution]:
+            output_solution.write_terraform()
+            output_solution.write_ansible()
+        problems = compare_trees(*output_directories)
+        stored_solution.store.close()
+
+    changed = sorted(row for row in after if before.get(row) != after[row])
+    sizes = [after[row][1] for row in changed]
+    failed = written != 1 or changed != [("ports", port.name)] or any(size > PORT_ROW_BYTES for size in sizes)
+    rows = ", ".join(f"{table} {row_name} {size} bytes" for (table, row_name), size in zip(changed, sizes))
+    print(f"{name} store save after one port edit: wrote {written} ({rows}) {'FAILED' if failed else 'ok'}")
+    print(f"{name} store opened: {held:.2f} MiB held {'FAILED' if held > STORE_OPEN_MIB else 'ok'}")
+    for problem in problems:
+        print(f"  {problem}")
+    print(f"{name} output written from the store: {'FAILED' if problems else 'ok'}")
+    return failed or held > STORE_OPEN_MIB or bool(problems)
+
+
+def check_format():
+    """
+    Run terraform fmt -check over the golden terraform trees, which the
+    fixture comparison keeps identical to the current output. Skipped when
+    terraform is not installed.
+    """
+    terraform = shutil.which("terraform")
+    if terraform is None:
+        print("terraform fmt: skipped, terraform not found")
+        return False
+    failed = False
+    for run in FIXTURE_RUNS:
+        result = subprocess.run(
+            [terraform, "fmt", "-check", "-recursive", "-diff", str(GOLDEN_DIRECTORY / run["name"] / OUTPUT_DIRECTORIES[0])],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(result.stdout + result.stderr, end="")
+        print(f"{run['name']} terraform fmt: {'FAILED' if result.returncode else 'ok'}")
+        failed = failed or result.returncode != 0
+    return failed
+
+
+def main(args):
+    failed = check_fixtures(args)
+    failed = check_format() or failed
+    failed = check_generated(args) or failed
+    failed = check_estimates(args) or failed
+    failed = check_store() or failed
+    failed = check_inputs() or failed
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = process_args()
+    main(args)
@@ -1,7 +1,6 @@
 import abc
 import attr
-import ipaddress
-import re
+import itertools
 
 BLOCK_TYPE_DATA = "data"
 BLOCK_TYPE_OUTPUT = "output"
@@ -9,8 +8,129 @@ BLOCK_TYPE_PROVIDER = "provider"
 BLOCK_TYPE_RESOURCE = "resource"
 BLOCK_TYPE_VARIABLE = "variable"
 
-#When we match this for the value of an attribute we don't quote the whole string
-NO_QUOTES_ATTR_RE = re.compile("(^file.*$|^var\..*$|^openstack_.*$|^data\..*$|^element\(.*$)")
+class Expression(str):
+    """
+    A Terraform expression such as a variable or resource reference, rendered
+    as is. Plain str argument values are literals and get quoted.
+    """
+
+class Reference(Expression):
+    """
+    A reference to an attribute of another block, like
+    openstack_networking_port_v2.NAME.id. Its parts are kept so a shard can
+    point it at the core stack's outputs, see HclObject.map_references.
+    """
+
+    def __new__(cls, resource_type, name, attribute, index=None):
+        address = f"{resource_type}.{name}" if index is None else f"{resource_type}.{name}[{index}]"
+        reference = super().__new__(cls, f"{address}.{attribute}")
+        reference.resource_type = resource_type
+        reference.name = name
+        reference.attribute = attribute
+        reference.index = index
+        return reference
+
+    def __getnewargs__(self):
+        return self.resource_type, self.name, self.attribute, self.index
+
+    def at(self, index):
+        """
+        The same reference to one instance of a block with a count
+        """
+        return Reference(self.resource_type, self.name, self.attribute, index)
+
+class Compound(Expression):
+    """
+    An expression with other values in it, like a function call on a
+    Reference. template is a str.format() template with a {} for each value,
+    which is rendered in its place.
+    """
+
+    def __new__(cls, template, *values):
+        compound = super().__new__(cls, template.format(*(render_value(value) for value in values)))
+        compound.template = template
+        compound.values = values
+        return compound
+
+    def __getnewargs__(self):
+        return (self.template, *self.values)
+
+def map_references(value, function):
+    """
+    value with every Reference in it, also those inside a Compound, replaced
+    by function(reference)
+    """
+    if isinstance(value, Reference):
+        return function(value)
+    if isinstance(value, Compound):
+        return Compound(value.template, *(map_references(part, function) for part in value.values))
+    return value
+
+def _map_arguments(arguments, function):
+    if arguments is None:
+        return None
+    return {argument: map_references(value, function) for argument, value in arguments.items()}
+
+# Suffix for the name of the IPv6 subnet of a dual-stack network
+IPV6_SUBNET_SUFFIX = "_v6"
+
+def address_bits(ip_version):
+    return 128 if ip_version == 6 else 32
+
+def parse_address(text):
+    if ":" in text:
+        import socket
+
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+    octets = text.split(".")
+    return (int(octets[0]) << 24) | (int(octets[1]) << 16) | (int(octets[2]) << 8) | int(octets[3])
+
+def format_address(address, ip_version=4):
+    if ip_version == 6:
+        import socket
+
+        return socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, "big"))
+    return f"{address >> 24}.{(address >> 16) & 255}.{(address >> 8) & 255}.{address & 255}"
+
+def parse_cidr(text):
+    """
+    Parse a CIDR string into (network address, prefix length, ip version)
+    integers. Host bits are cleared, like ipaddress.ip_network(strict=False).
+    """
+    address, _, prefix = text.partition("/")
+    ip_version = 6 if ":" in address else 4
+    prefix_length = int(prefix) if prefix else address_bits(ip_version)
+    host_bits = address_bits(ip_version) - prefix_length
+    return (parse_address(address) >> host_bits) << host_bits, prefix_length, ip_version
+
+def format_cidr(network_address, prefix_length, ip_version=4):
+    return f"{format_address(network_address, ip_version)}/{prefix_length}"
+
+def last_address(network_address, prefix_length, ip_version=4):
+    return network_address | ((1 << (address_bits(ip_version) - prefix_length)) - 1)
+
+def host_range(network_address, prefix_length, enable_dhcp=False, ip_version=4):
+    """
+    First and last assignable address of a network, skipping the network and
+    broadcast (or last IPv6) address and the four addresses OpenStack takes
+    for DHCP
+    """
+    first_host = network_address + 1
+    if enable_dhcp:
+        first_host += 4
+    return first_host, last_address(network_address, prefix_length, ip_version) - 1
+
+def free_addresses(first_host, last_host, used):
+    """
+    Yield the addresses from first_host to last_host that are not in used.
+    Only as much of the range is walked as the caller consumes, so this is
+    safe for an IPv6 /64.
+    """
+    address = first_host
+    while address <= last_host:
+        if address not in used:
+            yield address
+        address += 1
 
 def _list_to_string(ll):
     text = ""
@@ -18,42 +138,70 @@ def _list_to_string(ll):
         text += f"\"{item}\", "
     text += f"\"{ll[-1]}\""
     return text
-        
+
+def _render_literal(value):
+    return f"\"{value}\""
+
+def _render_bool(value):
+    return f"\"{str(value).lower()}\""
+
+def _render_list(value):
+    return f"[{_list_to_string(value)}]"
+
+# Argument values are rendered according to the type they were given in create()
+_VALUE_RENDERERS = {
+    Expression: str,
+    Reference: str,
+    Compound: str,
+    bool: _render_bool,
+    list: _render_list,
+}
+
+def render_value(value):
+    return _VALUE_RENDERERS.get(type(value), _render_literal)(value)
+
+# Output follows terraform fmt, so a generated tree is left as is by
+# terraform fmt -check: two space indents, and the = signs of a run of
+# single-line arguments lined up one space after the longest name
+INDENT = "  "
+
+def render_arguments(arguments, depth):
+    if not arguments:
+        return ""
+    width = max(len(argument) for argument in arguments)
+    indent = INDENT * depth
+    return "".join(
+        f"{indent}{argument.ljust(width)} = {render_value(value)}\n"
+        for argument, value in arguments.items()
+    )
+
 @attr.s
 class HclMetaArgument(abc.ABC):
     name = attr.ib()
     arguments = attr.ib(factory=dict)
     def render(self):
-        text = f"    {self.name} = " + "{\n"
-        for argument, value in self.arguments.items():
-            if isinstance(value, bool):
-                value = str(value).lower()
-            if NO_QUOTES_ATTR_RE.match(value):
-                text += f"        {argument} = {value}" + "\n"
-            else:
-                text += f"        {argument} = \"{value}\"" + "\n"
-        text += "    }\n"
+        text = f"{INDENT}{self.name} = " + "{\n"
+        text += render_arguments(self.arguments, 2)
+        text += f"{INDENT}" + "}\n"
         return text
 
+    def map_references(self, function):
+        return attr.evolve(self, arguments=_map_arguments(self.arguments, function))
+
 
 @attr.s
 class HclAttribute(abc.ABC):
     type = attr.ib()
     arguments = attr.ib(factory=dict)
     def render(self):
-        text = f"    {self.type} " + "{\n"
-        for argument, value in self.arguments.items():
-            if not value:
-                continue
-            if isinstance(value, bool):
-                value = str(value).lower()
-            if NO_QUOTES_ATTR_RE.match(value):
-                text += f"        {argument} = {value}\n"
-            else:
-                text += f"        {argument} = \"{value}\"" + "\n"
-        text += "    }\n"
+        text = f"{INDENT}{self.type} " + "{\n"
+        text += render_arguments({argument: value for argument, value in self.arguments.items() if value}, 2)
+        text += f"{INDENT}" + "}\n"
         return text
 
+    def map_references(self, function):
+        return attr.evolve(self, arguments=_map_arguments(self.arguments, function))
+
 
 @attr.s
 class HclObject(abc.ABC):
@@ -68,30 +216,110 @@ class HclObject(abc.ABC):
             text = f'{self.block_type} "{self.block_label}" "{self.block_name}"' + " {\n"
         else:
             text = f'{self.block_type} "{self.block_name}"' + " {\n"
+        body = ""
         if self.arguments is not None:
-            for argument, value in self.arguments.items():
-                if value is None:
-                    continue
-                if isinstance(value, bool):
-                    value = str(value).lower()
-                if isinstance(value, list):
-                    text += f"    {argument} = [{_list_to_string(value)}]" + "\n"
-                else:
-                    if NO_QUOTES_ATTR_RE.match(value):
-                        text += f"    {argument} = {value}" + "\n"
-                    else:
-                        text += f"    {argument} = \"{value}\"" + "\n"
-        if self.meta_arguments is not None:
-            for meta_argument in self.meta_arguments:
-                text += "\n"
-                text += meta_argument.render()
-        if self.attributes is not None:
-            for attribute in self.attributes:
-                text += "\n"
-                text += attribute.render()
-        text += "}\n"
+            arguments = {argument: value for argument, value in self.arguments.items() if value is not None}
+            # A count goes first, set apart from the block's own arguments
+            if "count" in arguments:
+                body += render_arguments({"count": arguments.pop("count")}, 1) + "\n"
+            body += render_arguments(arguments, 1)
+        # Nested blocks are set apart by a blank line, except at the top of the block
+        for nested in (self.meta_arguments or []) + (self.attributes or []):
+            if body:
+                body += "\n"
+            body += nested.render()
+        text += body + "}\n"
         return text
 
+    def map_references(self, function):
+        """
+        Copy of the block with every Reference in its arguments and nested
+        blocks replaced by function(reference)
+        """
+        return attr.evolve(
+            self,
+            arguments=_map_arguments(self.arguments, function),
+            meta_arguments=None if self.meta_arguments is None else [
+                nested.map_references(function) for nested in self.meta_arguments
+            ],
+            attributes=None if self.attributes is None else [
+                nested.map_references(function) for nested in self.attributes
+            ],
+        )
+
+
+def parse_value(text):
+    if text.startswith('"') and text.endswith('"'):
+        return text[1:-1]
+    if text.startswith("["):
+        return [item.strip()[1:-1] for item in text[1:-1].split(",")]
+    return Expression(text)
+
+def parse(text):
+    """
+    Parse HCL produced by the render methods in this module back into
+    HclObject blocks holding HclMetaArgument and HclAttribute instances.
+    Only that subset of HCL is understood: one argument per line and at most
+    one level of nesting.
+    """
+    blocks = []
+    block = None
+    nested = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if block is None:
+            header = line.split('"')
+            labels = header[1::2]
+            block = HclObject(
+                block_type=header[0].strip(),
+                block_label=labels[0] if len(labels) == 2 else None,
+                block_name=labels[-1],
+                arguments={},
+                meta_arguments=[],
+                attributes=[],
+            )
+        elif line == "}":
+            if nested is not None:
+                nested = None
+            else:
+                blocks.append(block)
+                block = None
+        elif line.endswith("{"):
+            if line.endswith("= {"):
+                nested = HclMetaArgument(name=line[:-3].strip(), arguments={})
+                block.meta_arguments.append(nested)
+            else:
+                nested = HclAttribute(type=line[:-1].strip(), arguments={})
+                block.attributes.append(nested)
+        else:
+            argument, _, value = line.partition(" = ")
+            (block if nested is None else nested).arguments[argument.rstrip()] = parse_value(value)
+    return blocks
+
+def reference_name(expression):
+    """
+    Name of the resource in a reference like openstack_networking_port_v2.NAME.id
+    or data.template_file.NAME.rendered, also with an index after NAME
+    """
+    if expression.startswith("data.terraform_remote_state."):
+        # An output of another stack like ...outputs.subnet_ids["NAME"]
+        return expression.split('"')[1]
+    parts = expression.split(".")
+    name = parts[2] if parts[0] == "data" else parts[1]
+    return name.partition("[")[0]
+
+def lookup_name(value):
+    """
+    Name of the data source that looks up an image or flavor: the variable
+    name for var.NAME, otherwise the literal with non-word characters
+    replaced
+    """
+    if isinstance(value, Expression) and value.startswith("var."):
+        return value[len("var."):]
+    return "".join(character if character.isalnum() or character in "_-" else "_" for character in value)
+
 
 @attr.s
 class HclVariable(HclObject):
@@ -109,16 +337,43 @@ class HclVariable(HclObject):
 @attr.s
 class HclOutputFloatingip(HclObject):
     @classmethod
-    def create(cls, name, flip_name):
+    def create(cls, name, flip_name, index=None):
         return cls(
             block_type=BLOCK_TYPE_OUTPUT,
             block_label=None,
             block_name=name,
             arguments={
-                "value": f"${{openstack_networking_floatingip_v2.{flip_name}.address}}",
+                "value": Reference("openstack_networking_floatingip_v2", flip_name, "address", index),
             }
         )
 
+@attr.s
+class HclOutputMap(HclObject):
+    @classmethod
+    def create(cls, name, values):
+        return cls(
+            block_type=BLOCK_TYPE_OUTPUT,
+            block_label=None,
+            block_name=name,
+            arguments={},
+            meta_arguments=[HclMetaArgument(
+                name="value",
+                arguments={f'"{key}"': value for key, value in values.items()},
+            )],
+        )
+
+@attr.s
+class DataTerraformRemoteState(HclObject):
+    @classmethod
+    def create(cls, name, state_path):
+        return cls(
+            block_type=BLOCK_TYPE_DATA,
+            block_label="terraform_remote_state",
+            block_name=name,
+            arguments={"backend": "local"},
+            meta_arguments=[HclMetaArgument(name="config", arguments={"path": state_path})],
+        )
+
 @attr.s
 class ProviderOpenstack(HclObject):
     @classmethod
@@ -128,11 +383,11 @@ class ProviderOpenstack(HclObject):
             block_label=None,
             block_name="openstack",
             arguments={
-                "auth_url": "var.openstack_auth_url",
-                "domain_name": "var.openstack_domain_name",
-                "region": "var.openstack_region",
-                "tenant_name": "var.openstack_project_name",
-                "user_name": "var.openstack_user",
+                "auth_url": Expression("var.openstack_auth_url"),
+                "domain_name": Expression("var.openstack_domain_name"),
+                "region": Expression("var.openstack_region"),
+                "tenant_name": Expression("var.openstack_project_name"),
+                "user_name": Expression("var.openstack_user"),
             }
         )
 
@@ -147,7 +402,7 @@ class ResourceOpenstackNetworkingRouterV2(HclObject):
             block_name=name,
             arguments={
                 "name": name,
-                "external_network_id": f"data.openstack_networking_network_v2.{external_network_name}.id"
+                "external_network_id": Reference("data.openstack_networking_network_v2", external_network_name, "id")
             },
         )
 
@@ -161,8 +416,8 @@ class ResourceOpenstackNetworkingRouterInterfaceV2(HclObject):
             block_label="openstack_networking_router_interface_v2",
             block_name=name,
             arguments={
-                "router_id": f"openstack_networking_router_v2.{router_name}.id",
-                "subnet_id": f"openstack_networking_subnet_v2.{subnet_name}.id",
+                "router_id": Reference("openstack_networking_router_v2", router_name, "id"),
+                "subnet_id": Reference("openstack_networking_subnet_v2", subnet_name, "id"),
             }
         )
 
@@ -214,14 +469,51 @@ class DataOpenstackNetworkingNetworkV2(HclObject):
         )
 
 
+@attr.s
+class DataOpenstackImagesImageV2(HclObject):
+    @classmethod
+    def create(cls, image_name):
+        return cls(
+            block_type=BLOCK_TYPE_DATA,
+            block_label="openstack_images_image_v2",
+            block_name=lookup_name(image_name),
+            arguments={
+                "name": image_name,
+            },
+        )
+
+
+@attr.s
+class DataOpenstackComputeFlavorV2(HclObject):
+    @classmethod
+    def create(cls, flavor_name):
+        return cls(
+            block_type=BLOCK_TYPE_DATA,
+            block_label="openstack_compute_flavor_v2",
+            block_name=lookup_name(flavor_name),
+            arguments={
+                "name": flavor_name,
+            },
+        )
+
+
 @attr.s
 class ResourceOpenstackNetworkingSubnetV2(HclObject):
     subnet_name = attr.ib(default=None)
     network_id = attr.ib(default=None)
-    cidr = attr.ib(default=None)
+    network_address = attr.ib(default=None)
+    prefix_length = attr.ib(default=None)
+    ip_version = attr.ib(default=4)
     ports = attr.ib(default=[])
     gateway_port_name = attr.ib(default=None)
     enable_dhcp = attr.ib(default=False)
+    # IPv6 prefix of a dual-stack network, rendered as a second subnet
+    ipv6_network_address = attr.ib(default=None)
+    ipv6_prefix_length = attr.ib(default=None)
+    # ipaddress network object built on first use of self.network
+    _network = attr.ib(default=None, repr=False, eq=False)
+    # The solution's AddressIndex, told whenever the address ranges change
+    address_index = attr.ib(default=None, repr=False, eq=False)
 
     @classmethod
     def create(
@@ -229,52 +521,143 @@ class ResourceOpenstackNetworkingSubnetV2(HclObject):
         name,
         network_id,
         cidr="169.254.0.0/16",
-        ip_version="4",
+        ip_version=None,
         enable_dhcp=False,
         no_gateway=True,
         dns_nameservers=None,
+        ipv6_cidr=None,
     ):
+        network_address, prefix_length, cidr_version = parse_cidr(cidr)
+        ipv6_network_address, ipv6_prefix_length = None, None
+        if ipv6_cidr is not None:
+            ipv6_network_address, ipv6_prefix_length, _ = parse_cidr(ipv6_cidr)
         return cls(
             block_type=BLOCK_TYPE_RESOURCE,
             block_label="openstack_networking_subnet_v2",
             block_name=name,
             arguments={
                 "name": name,
-                "network_id": f"openstack_networking_network_v2.{name}.id",
-                "cidr": cidr,
-                "ip_version": ip_version,
+                "network_id": Reference("openstack_networking_network_v2", name, "id"),
+                "cidr": None,
+                "ip_version": ip_version or str(cidr_version),
                 "enable_dhcp": enable_dhcp,
                 "no_gateway": no_gateway,
                 "dns_nameservers": dns_nameservers,
             },
             subnet_name=name,
             network_id=network_id,
-            cidr=cidr,
+            network_address=network_address,
+            prefix_length=prefix_length,
+            ip_version=cidr_version,
             enable_dhcp=enable_dhcp,
+            ipv6_network_address=ipv6_network_address,
+            ipv6_prefix_length=ipv6_prefix_length,
             # Without this all ports get added to all networks
             ports=[],
         )
 
+    @property
+    def cidr(self):
+        return format_cidr(self.network_address, self.prefix_length, self.ip_version)
+
+    @property
+    def dual_stack(self):
+        return self.ipv6_network_address is not None
+
+    @property
+    def ipv6_subnet_name(self):
+        return f"{self.subnet_name}{IPV6_SUBNET_SUFFIX}"
+
+    @property
+    def ipv6_cidr(self):
+        return format_cidr(self.ipv6_network_address, self.ipv6_prefix_length, 6)
+
+    @property
+    def broadcast_address(self):
+        return last_address(self.network_address, self.prefix_length, self.ip_version)
+
+    @property
+    def network(self):
+        if self._network is None:
+            import ipaddress
+
+            self._network = ipaddress.ip_network(self.cidr)
+        return self._network
+
+    def contains(self, address):
+        return self.network_address <= address <= self.broadcast_address
+
+    def contains_ipv6(self, address):
+        return self.ipv6_network_address <= address <= last_address(
+            self.ipv6_network_address, self.ipv6_prefix_length, 6
+        )
+
+    def blocks(self):
+        """
+        The subnet's block, followed by the block of its IPv6 half when the
+        network is dual-stack
+        """
+        self.arguments["cidr"] = self.cidr
+        blocks = [HclObject(
+            block_type=self.block_type,
+            block_label=self.block_label,
+            block_name=self.block_name,
+            arguments=dict(self.arguments),
+        )]
+        if self.dual_stack:
+            blocks.append(HclObject(
+                block_type=self.block_type,
+                block_label=self.block_label,
+                block_name=self.ipv6_subnet_name,
+                arguments={
+                    **self.arguments,
+                    "name": self.ipv6_subnet_name,
+                    "cidr": self.ipv6_cidr,
+                    "ip_version": "6",
+                },
+            ))
+        return blocks
+
+    def render(self):
+        return "\n".join(block.render() for block in self.blocks())
+
     def update_cidr(self, new_cidr):
-        self.cidr = new_cidr
-        self.arguments['cidr'] = new_cidr
+        self.network_address, self.prefix_length, self.ip_version = parse_cidr(new_cidr)
+        self.arguments["ip_version"] = str(self.ip_version)
+        self._network = None
+        self.ranges_changed()
+
+    def update_ipv6_cidr(self, new_cidr):
+        if new_cidr is None:
+            self.ipv6_network_address, self.ipv6_prefix_length = None, None
+        else:
+            self.ipv6_network_address, self.ipv6_prefix_length, _ = parse_cidr(new_cidr)
+        self.ranges_changed()
+
+    def ranges_changed(self):
+        if self.address_index is not None:
+            self.address_index.invalidate()
 
     def update_port(self, index, port):
         self.ports[index] = port
 
     def available_addresses(self):
-        all_hosts = list(ipaddress.ip_network(self.cidr))
-        # Remove network and broadcast address
-        all_hosts = all_hosts[1:-1]
-        if self.enable_dhcp:
-            all_hosts = all_hosts[4:]
+        first_host, last_host = host_range(self.network_address, self.prefix_length, self.enable_dhcp, self.ip_version)
+        return free_addresses(first_host, last_host, {port.address for port in self.ports})
 
-        for port in self.ports:
-            port_address = ipaddress.ip_address(port.address)
-            if port_address in all_hosts:
-              all_hosts.remove(port_address)
+    def available_ipv6_addresses(self):
+        first_host, last_host = host_range(self.ipv6_network_address, self.ipv6_prefix_length, ip_version=6)
+        return free_addresses(first_host, last_host, {port.ipv6_address for port in self.ports})
 
-        return all_hosts
+    def allocate_addresses(self, count):
+        """
+        The next count free addresses, fewer if the subnet runs out. Nothing is
+        reserved; the caller assigns them to the ports it adds.
+        """
+        return list(itertools.islice(self.available_addresses(), count))
+
+    def allocate_ipv6_addresses(self, count):
+        return list(itertools.islice(self.available_ipv6_addresses(), count))
 
 @attr.s
 class ResourceOpenstackNetworkingPortV2(HclObject):
@@ -282,19 +665,34 @@ class ResourceOpenstackNetworkingPortV2(HclObject):
     subnet_name = attr.ib(default=None)
     address = attr.ib(default=None)
     instance = attr.ib(default=None)
+    ip_version = attr.ib(default=4)
+    # Second address of a port on a dual-stack network
+    ipv6_address = attr.ib(default=None)
+    @attr.s
     class FixedIP(HclAttribute):
+        address = attr.ib(default=None)
+        ip_version = attr.ib(default=4)
+
         @classmethod
-        def create(cls, subnet, address):
+        def create(cls, subnet, address, ip_version=4):
             return cls(
                 type="fixed_ip",
                 arguments={
-                    "subnet_id": f"openstack_networking_subnet_v2.{subnet}.id",
-                    "ip_address": address,
+                    "subnet_id": Reference("openstack_networking_subnet_v2", subnet, "id"),
+                    "ip_address": None,
                 },
+                address=address,
+                ip_version=ip_version,
             )
 
-        def update_address(self, new_address):
-            self.arguments["ip_address"] = new_address
+        def render(self):
+            self.arguments["ip_address"] = format_address(self.address, self.ip_version)
+            return super().render()
+
+        def update_address(self, new_address, ip_version=None):
+            self.address = new_address
+            if ip_version is not None:
+                self.ip_version = ip_version
 
     @classmethod
     def create(
@@ -303,42 +701,81 @@ class ResourceOpenstackNetworkingPortV2(HclObject):
         subnet_name,
         address,
         instance,
+        ip_version=4,
+        ipv6_address=None,
     ):
+        attributes = [
+            ResourceOpenstackNetworkingPortV2.FixedIP.create(
+                subnet=subnet_name,
+                address=address,
+                ip_version=ip_version,
+            )
+        ]
+        if ipv6_address is not None:
+            attributes.append(ResourceOpenstackNetworkingPortV2.FixedIP.create(
+                subnet=f"{subnet_name}{IPV6_SUBNET_SUFFIX}",
+                address=ipv6_address,
+                ip_version=6,
+            ))
         return cls(
             block_type=BLOCK_TYPE_RESOURCE,
             block_label="openstack_networking_port_v2",
             block_name=name,
             arguments={
                 "name": name,
-                "network_id": f"openstack_networking_network_v2.{subnet_name}.id"
+                "network_id": Reference("openstack_networking_network_v2", subnet_name, "id")
             },
-            attributes=[
-                ResourceOpenstackNetworkingPortV2.FixedIP.create(
-                    subnet=subnet_name,
-                    address=address,
-                )
-            ],
+            attributes=attributes,
             name=name,
             subnet_name=subnet_name,
             address=address,
             instance=instance,
+            ip_version=ip_version,
+            ipv6_address=ipv6_address,
         )
 
-    def update_address(self, new_address):
+    @property
+    def address_string(self):
+        return format_address(self.address, self.ip_version)
+
+    @property
+    def ipv6_address_string(self):
+        return format_address(self.ipv6_address, 6)
+
+    def update_address(self, new_address, ip_version=None):
         self.address = new_address
-        self.attributes[0].update_address(new_address)
+        if ip_version is not None:
+            self.ip_version = ip_version
+        self.attributes[0].update_address(new_address, ip_version)
+
+    def update_ipv6_address(self, new_address):
+        self.ipv6_address = new_address
+        if new_address is None:
+            del self.attributes[1:]
+        elif len(self.attributes) > 1:
+            self.attributes[1].update_address(new_address)
+        else:
+            self.attributes.append(ResourceOpenstackNetworkingPortV2.FixedIP.create(
+                subnet=f"{self.subnet_name}{IPV6_SUBNET_SUFFIX}",
+                address=new_address,
+                ip_version=6,
+            ))
 
 @attr.s
 class ResourceOpenstackComputeInstanceV2(HclObject):
     name = attr.ib(default=None)
     port_names = attr.ib(default=None)
     floating_ip = attr.ib(default=False)
+    # Looked up by name once per stack, see DataOpenstackImagesImageV2 and
+    # DataOpenstackComputeFlavorV2; the instance refers to their ids
+    image_name = attr.ib(default=None)
+    flavor_name = attr.ib(default=None)
     class Network(HclAttribute):
         @classmethod
         def create(cls, port_name):
             return cls(
                 type="network",
-                arguments={"port": f"openstack_networking_port_v2.{port_name}.id"},
+                arguments={"port": Reference("openstack_networking_port_v2", port_name, "id")},
             )
 
     @classmethod
@@ -346,8 +783,8 @@ class ResourceOpenstackComputeInstanceV2(HclObject):
         cls,
         name,
         port_names,
-        image_name="var.image",
-        flavor_name="var.vm_flavor",
+        image_name=Expression("var.image"),
+        flavor_name=Expression("var.vm_flavor"),
         user_data="default",
     ):
         return cls(
@@ -356,10 +793,10 @@ class ResourceOpenstackComputeInstanceV2(HclObject):
             block_name=name,
             arguments={
                 "name": name,
-                "image_name": image_name,
-                "flavor_name": flavor_name,
+                "image_id": Reference("data.openstack_images_image_v2", lookup_name(image_name), "id"),
+                "flavor_id": Reference("data.openstack_compute_flavor_v2", lookup_name(flavor_name), "id"),
                 "config_drive": True,
-                "user_data": f"data.template_cloudinit_config.{user_data}.rendered",
+                "user_data": Reference("data.template_cloudinit_config", user_data, "rendered"),
             },
             attributes=[
                 ResourceOpenstackComputeInstanceV2.Network.create(
@@ -368,6 +805,8 @@ class ResourceOpenstackComputeInstanceV2(HclObject):
             ],
             name=name,
             port_names=port_names,
+            image_name=image_name,
+            flavor_name=flavor_name,
         )
 
 
@@ -388,7 +827,7 @@ class DataTemplateFile(HclObject):
             block_label="template_file",
             block_name=name,
             arguments={
-                "template": f"file(\"${{path.module}}/{template_file}\")",
+                "template": Expression(f"file(\"${{path.module}}/{template_file}\")"),
             },
             attributes=[
                 DataTemplateFile.Vars.create(vars)
@@ -396,7 +835,7 @@ class DataTemplateFile(HclObject):
         )
 
     def set_gateway_port(self, port_name):
-        self.attributes[0].arguments["gateway-ip"] = f"openstack_networking_port_v2.{port_name}.all_fixed_ips[0]"
+        self.attributes[0].arguments["gateway-ip"] = Reference("openstack_networking_port_v2", port_name, "all_fixed_ips[0]")
 
 @attr.s
 class DataTemplateCloudinitConfig(HclObject):
@@ -407,7 +846,7 @@ class DataTemplateCloudinitConfig(HclObject):
                 type="part",
                 arguments={
                     "content_type": "text/cloud-config",
-                    "content": f"data.template_file.{template_name}.rendered",
+                    "content": Reference("data.template_file", template_name, "rendered"),
                 }
             )
 
@@ -428,6 +867,21 @@ class DataTemplateCloudinitConfig(HclObject):
             ],
         )
 
+def cloud_config_user_data(template_file, vars=None):
+    """
+    user_data expression that renders template_file with the built-in file()
+    or templatefile() functions instead of template provider data sources.
+    The #cloud-config header stands in for the text/cloud-config content
+    type that template_cloudinit_config set.
+    """
+    template_path = f"\"${{{{path.module}}}}/{template_file}\""
+    if vars:
+        vars_template = ", ".join(f"\"{name}\" = {{}}" for name in vars)
+        content = f"templatefile({template_path}, {{{{ {vars_template} }}}})"
+    else:
+        content = f"file({template_path})"
+    return Compound(f"format(\"#cloud-config\\n%s\", {content})", *(vars or {}).values())
+
 @attr.s
 class ResourceOpenstackNetworkingFloatingipV2(HclObject):
     @classmethod
@@ -437,7 +891,7 @@ class ResourceOpenstackNetworkingFloatingipV2(HclObject):
             block_label="openstack_networking_floatingip_v2",
             block_name=name,
             arguments={
-                "pool": "var.external_network",
+                "pool": Expression("var.external_network"),
             },
         )
 
@@ -450,8 +904,8 @@ class ResourceOpenstackComputeFloatingipAssociateV2(HclObject):
             block_label="openstack_compute_floatingip_associate_v2",
             block_name=name,
             arguments={
-                "floating_ip": f"openstack_networking_floatingip_v2.{flip_name}.address",
-                "instance_id": f"openstack_compute_instance_v2.{instance_name}.id",
-                "fixed_ip": f"openstack_compute_instance_v2.{instance_name}.network.0.fixed_ip_v4",
+                "floating_ip": Reference("openstack_networking_floatingip_v2", flip_name, "address"),
+                "instance_id": Reference("openstack_compute_instance_v2", instance_name, "id"),
+                "fixed_ip": Reference("openstack_compute_instance_v2", instance_name, "network.0.fixed_ip_v4"),
             }
         )
@@ -0,0 +1,125 @@
+import attr
+import hashlib
+import os
+import pathlib
+import pickle
+import shutil
+
+# The tool has no release version, so the source of the modules that parse
+# and plan a lab stands in for it. Any change to them invalidates the cache.
+TOOL_MODULES = ["hcl.py", "terraform.py", "unl2terraform.py", "parse_cache.py", "startup_configs.py"]
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def default_cache_directory():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "unl2terraform"
+
+
+def tool_version():
+    digest = hashlib.sha256()
+    source_directory = pathlib.Path(__file__).resolve().parent
+    for module in TOOL_MODULES:
+        digest.update((source_directory / module).read_bytes())
+    return digest.hexdigest()
+
+
+@attr.s
+class ParseCache:
+    """
+    On-disk cache of planned solutions, keyed by the content hash of the UNL
+    file, the tool version and the planning options. Entries are pickles
+    whose modification time records the last use; once the cache grows past
+    max_size the least recently used entries are removed. The decoded
+    startup configs of a lab are kept in a directory next to its entry and
+    copied out on a hit, so the UNL file doesn't have to be parsed again.
+    """
+
+    directory = attr.ib(converter=pathlib.Path)
+    max_size = attr.ib(default=DEFAULT_CACHE_SIZE)
+
+    def key(self, unl_file, *options):
+        digest = hashlib.sha256()
+        digest.update(tool_version().encode())
+        digest.update(repr(options).encode())
+        with open(unl_file, "rb") as unl:
+            for chunk in iter(lambda: unl.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return self.directory / f"{key}.pickle"
+
+    def configs_path(self, key):
+        return self.directory / f"{key}.configs"
+
+    def get(self, key, config_directory=None):
+        """
+        The cached solution for key, or None. Its startup configs are copied
+        into config_directory.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as entry:
+                solution = pickle.load(entry)
+            if solution.startup_configs and config_directory is not None:
+                config_directory.mkdir(parents=True, exist_ok=True)
+                for name in solution.startup_configs:
+                    shutil.copyfile(self.configs_path(key) / f"{name}.cfg", config_directory / f"{name}.cfg")
+        except FileNotFoundError:
+            if path.exists():
+                # The configs went missing, drop the entry so it is written again
+                path.unlink(missing_ok=True)
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Written by an incompatible version or cut short, treat as a miss
+            path.unlink(missing_ok=True)
+            shutil.rmtree(self.configs_path(key), ignore_errors=True)
+            return None
+        os.utime(path)
+        return solution
+
+    def put(self, key, solution, config_directory=None):
+        """
+        Cache solution under key, along with the startup configs parsing it
+        wrote to config_directory
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.entry_path(key)
+        temporary_suffix = f".{os.getpid()}.tmp"
+        if solution.startup_configs and config_directory is not None:
+            # In place before the entry, which is only used with its configs
+            configs_path = self.configs_path(key)
+            temporary_configs_path = configs_path.with_name(configs_path.name + temporary_suffix)
+            temporary_configs_path.mkdir(exist_ok=True)
+            for name in solution.startup_configs:
+                shutil.copyfile(config_directory / f"{name}.cfg", temporary_configs_path / f"{name}.cfg")
+            shutil.rmtree(configs_path, ignore_errors=True)
+            temporary_configs_path.replace(configs_path)
+        temporary_path = path.with_name(path.name + temporary_suffix)
+        with open(temporary_path, "wb") as entry:
+            pickle.dump(solution, entry, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary_path.replace(path)
+        self.evict()
+
+    def _size(self, key):
+        try:
+            return sum(config.stat().st_size for config in self.configs_path(key).iterdir())
+        except FileNotFoundError:
+            return 0
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.pickle"):
+            try:
+                entries.append((path.stat(), path))
+            except FileNotFoundError:
+                continue
+        sizes = {path: stat.st_size + self._size(path.stem) for stat, path in entries}
+        total = sum(sizes.values())
+        for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            shutil.rmtree(self.configs_path(path.stem), ignore_errors=True)
+            total -= sizes[path]
@@ -0,0 +1,84 @@
+import hashlib
+import re
+
+# Addresses like openstack_networking_port_v2.NAME or data.template_file.NAME
+# in the text of a block
+REFERENCE = re.compile(r"\b(?:data\.)?(?:openstack|template|terraform)_\w+\.[\w-]+")
+# Output of another stack read through remote state, like
+# data.terraform_remote_state.core.outputs.subnet_ids["NAME"]
+REMOTE_STATE_REFERENCE = re.compile(r'data\.terraform_remote_state\.\w+\.outputs\.(\w+)\["([\w-]+)"\]')
+
+
+def split_blocks(text):
+    """
+    Yield the address and text of every resource and data block in HCL
+    rendered by hcl.HclObject, which starts each block at the first column
+    and closes it with a } of its own
+    """
+    for block_text in text.split("\n}\n"):
+        block_text = block_text.lstrip("\n")
+        header = block_text[:block_text.find("\n")].split('"')
+        if len(header) < 5:
+            continue
+        block_type = header[0].strip()
+        if block_type == "resource":
+            yield f"{header[1]}.{header[3]}", block_text
+        elif block_type == "data":
+            yield f"data.{header[1]}.{header[3]}", block_text
+
+
+def read_stack(directory):
+    """
+    Digest of every resource and data block in the .tf files of a root
+    module, keyed by address
+    """
+    return {
+        address: hashlib.sha1(block_text.encode()).hexdigest()
+        for path in sorted(directory.glob("*.tf"))
+        for address, block_text in split_blocks(path.read_text())
+    }
+
+
+def read_references(directory, remote_outputs=None):
+    """
+    Map every address to the blocks of a root module that refer to it. A
+    remote state output counts as a reference to the resource behind it,
+    remote_outputs giving the resource type of each output.
+    """
+    referenced_by = {}
+    for path in sorted(directory.glob("*.tf")):
+        for address, block_text in split_blocks(path.read_text()):
+            referenced = set(REFERENCE.findall(block_text))
+            for output, name in REMOTE_STATE_REFERENCE.findall(block_text):
+                if remote_outputs and output in remote_outputs:
+                    referenced.add(f"{remote_outputs[output]}.{name}")
+            referenced.discard(address)
+            for reference in referenced:
+                referenced_by.setdefault(reference, []).append(address)
+    return referenced_by
+
+
+def diff(previous, digests):
+    """
+    Sorted changed, added and removed addresses between two digest maps
+    """
+    changed = sorted(address for address, digest in digests.items() if previous.get(address, digest) != digest)
+    added = sorted(digests.keys() - previous.keys())
+    removed = sorted(previous.keys() - digests.keys())
+    return changed, added, removed
+
+
+def dependents(referenced_by, addresses):
+    """
+    The addresses that refer to one of addresses, directly or through other
+    blocks. Terraform adds the dependencies of a target by itself, but not
+    what depends on it, such as the ports of a subnet whose cidr changed.
+    """
+    found = set()
+    pending = list(addresses)
+    while pending:
+        for dependent in referenced_by.get(pending.pop(), []):
+            if dependent not in found:
+                found.add(dependent)
+                pending.append(dependent)
+    return found
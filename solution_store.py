@@ -0,0 +1,397 @@
+import attr
+import collections.abc
+import hashlib
+import io
+import pathlib
+import pickle
+import sqlite3
+import weakref
+
+import hcl
+import terraform
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+# Saving to a new file with one of these suffixes creates a store
+STORE_SUFFIXES = [".db", ".sqlite"]
+
+# Every table holds one pickled object per row, with the extra columns listed
+# here indexed. They are the attributes the lookups query by.
+TABLES = {
+    "solution": [],
+    "networks": [],
+    "subnets": ["network_id"],
+    "ports": ["subnet_name", "instance"],
+    "instances": [],
+}
+
+# Table and name attribute of the objects stored one per row
+ROW_TYPES = {
+    hcl.ResourceOpenstackNetworkingNetworkV2: ("networks", "block_name"),
+    hcl.ResourceOpenstackNetworkingSubnetV2: ("subnets", "subnet_name"),
+    hcl.ResourceOpenstackNetworkingPortV2: ("ports", "name"),
+    hcl.ResourceOpenstackComputeInstanceV2: ("instances", "name"),
+}
+
+# Solution attributes stored in their own tables or rebuilt on load. The edit
+# history is not kept; it refers to the objects of the session that made it.
+SEPARATE_ATTRIBUTES = {
+    "networks", "subnets", "instances", "subnet_index", "port_index", "instance_index", "address_index", "history", "store",
+}
+
+
+def is_store(path):
+    try:
+        with open(path, "rb") as store_file:
+            return store_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def solution_state(solution):
+    return {name: value for name, value in vars(solution).items() if name not in SEPARATE_ATTRIBUTES}
+
+
+def save(solution, path):
+    """
+    Save solution to the store at path and return the number of rows written.
+    A solution opened from that same store only commits what was edited.
+    """
+    if isinstance(solution, StoredSolution) and solution.store.path.resolve() == pathlib.Path(path).resolve():
+        return solution.store.commit(solution)
+    store = SolutionStore(path)
+    try:
+        return store.save(solution)
+    finally:
+        store.close()
+
+
+class RowPickler(pickle.Pickler):
+    """
+    Pickler whose bytes only depend on the values pickled, so a row read back
+    and saved unchanged keeps its digest. The memo is off, since which
+    strings happen to be shared changes on a round trip, and sets are
+    written sorted rather than in an order that depends on the hash seed.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.fast = True
+
+    def reducer_override(self, obj):
+        if type(obj) is set:
+            return set, (sorted(obj, key=repr),)
+        return NotImplemented
+
+
+@attr.s
+class SolutionStore:
+    """
+    SQLite file holding a solution as one row per network, subnet, port and
+    instance. open() returns a StoredSolution that reads rows as it needs
+    them, load() reads every row back into a TerraformSolution.
+    save() compares a digest of every row with what the file holds and
+    commits only the rows that changed. commit() does the same for the rows
+    edited since the store was opened.
+    """
+
+    path = attr.ib(converter=pathlib.Path)
+    _connection = attr.ib(default=None, repr=False)
+    # The object of every row in use, so a row read twice is the same object
+    _objects = attr.ib(factory=weakref.WeakValueDictionary, repr=False)
+    # Objects an edit was recorded for, held until the session ends
+    _edited = attr.ib(factory=dict, repr=False)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            for table, columns in TABLES.items():
+                extra = "".join(f", {column} TEXT" for column in columns)
+                self._connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    f"(name TEXT PRIMARY KEY, position INTEGER, digest TEXT, data BLOB{extra})"
+                )
+                for column in columns:
+                    self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+            self._connection.commit()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _rows(self, solution):
+        yield "solution", "solution", 0, solution_state(solution)
+        for position, network in enumerate(solution.networks):
+            yield "networks", network.block_name, position, network
+        for position, subnet in enumerate(solution.subnets):
+            yield "subnets", subnet.subnet_name, position, subnet
+            for index, port in enumerate(subnet.ports):
+                yield "ports", port.name, index, port
+        for position, instance in enumerate(solution.instances):
+            yield "instances", instance.name, position, instance
+
+    def _encode(self, table, value):
+        columns = tuple(getattr(value, column) for column in TABLES[table])
+        if table == "subnets":
+            value = attr.evolve(value, ports=[], network=None, address_index=None)
+        data = io.BytesIO()
+        RowPickler(data).dump(value)
+        data = data.getvalue()
+        return hashlib.sha1(data).hexdigest(), data, columns
+
+    def _write(self, table, name, position, digest, data, columns):
+        placeholders = ", ?" * len(TABLES[table])
+        extra = "".join(f", {column}" for column in TABLES[table])
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {table} (name, position, digest, data{extra}) VALUES (?, ?, ?, ?{placeholders})",
+            (name, position, digest, data, *columns),
+        )
+
+    def save(self, solution):
+        """
+        Write solution to the store and return the number of rows written
+        """
+        stored = {
+            table: {name: (position, digest) for name, position, digest in
+                    self.connection.execute(f"SELECT name, position, digest FROM {table}")}
+            for table in TABLES
+        }
+        written = 0
+        with self.connection:
+            for table, name, position, value in self._rows(solution):
+                digest, data, columns = self._encode(table, value)
+                if stored[table].pop(name, None) == (position, digest):
+                    continue
+                self._write(table, name, position, digest, data, columns)
+                written += 1
+            for table, removed in stored.items():
+                self.connection.executemany(f"DELETE FROM {table} WHERE name = ?", [(name,) for name in removed])
+                written += len(removed)
+        return written
+
+    def track(self, value):
+        """
+        Hold value until the session ends and write it on every commit,
+        call this before editing a row object
+        """
+        table, name_attribute = ROW_TYPES[type(value)]
+        self._edited[table, getattr(value, name_attribute)] = value
+
+    def commit(self, solution):
+        """
+        Write the solution state and the edited rows of solution, opened from
+        this store, and return the number of rows written
+        """
+        written = 0
+        with self.connection:
+            rows = [("solution", "solution", solution_state(solution)), *((*key, value) for key, value in self._edited.items())]
+            for table, name, value in rows:
+                digest, data, columns = self._encode(table, value)
+                position, stored_digest = self.connection.execute(
+                    f"SELECT position, digest FROM {table} WHERE name = ?", (name,)
+                ).fetchone()
+                if stored_digest != digest:
+                    self._write(table, name, position, digest, data, columns)
+                    written += 1
+        return written
+
+    def _object(self, table, name, data):
+        value = self._objects.get((table, name))
+        if value is None:
+            value = pickle.loads(data)
+            if table == "subnets":
+                value.ports = StoredRows(self, "ports", "subnet_name", name)
+            self._objects[table, name] = value
+        return value
+
+    def rows(self, table, condition=None, parameters=(), limit=-1, offset=0):
+        """
+        Objects of the rows of table matching condition, in position order,
+        read as the caller iterates
+        """
+        where = f"WHERE {condition} " if condition else ""
+        cursor = self.connection.execute(
+            f"SELECT name, data FROM {table} {where}ORDER BY position LIMIT ? OFFSET ?", (*parameters, limit, offset)
+        )
+        for name, data in cursor:
+            yield self._object(table, name, data)
+
+    def find(self, table, condition, parameters):
+        """
+        Object and position of the first row of table matching condition, or None
+        """
+        row = self.connection.execute(
+            f"SELECT name, data, position FROM {table} WHERE {condition} ORDER BY position LIMIT 1", parameters
+        ).fetchone()
+        if row is not None:
+            return self._object(table, row[0], row[1]), row[2]
+
+    def _load_rows(self, query):
+        return [pickle.loads(data) for data, in self.connection.execute(query)]
+
+    def _solution(self, cls):
+        solution_state = self._load_rows("SELECT data FROM solution")[0]
+        solution = cls(solution_state.pop("provider"), solution_state.pop("output_directory"))
+        for name, value in solution_state.items():
+            setattr(solution, name, value)
+        return solution
+
+    def load(self):
+        solution = self._solution(terraform.TerraformSolution)
+        solution.networks = self._load_rows("SELECT data FROM networks ORDER BY position")
+        solution.subnets = self._load_rows("SELECT data FROM subnets ORDER BY position")
+        subnets = {subnet.subnet_name: subnet for subnet in solution.subnets}
+        for port in self._load_rows("SELECT data FROM ports ORDER BY subnet_name, position"):
+            subnets[port.subnet_name].ports.append(port)
+        solution.instances = self._load_rows("SELECT data FROM instances ORDER BY position")
+        solution.build_indexes()
+        return solution
+
+    def open(self):
+        solution = self._solution(StoredSolution)
+        solution.store = self
+        solution.history = StoredEditHistory(store=self)
+        solution.networks = StoredRows(self, "networks")
+        solution.subnets = StoredRows(self, "subnets")
+        solution.instances = StoredRows(self, "instances")
+        solution.build_indexes()
+        return solution
+
+
+@attr.s
+class StoredRows(collections.abc.Sequence):
+    """
+    The rows of one table in position order, or with column set only those
+    whose column holds value, like the ports of one subnet. Nothing is kept
+    in memory; every use queries the store. Rows can only be replaced by
+    their own object, edited in place.
+    """
+    store = attr.ib()
+    table = attr.ib()
+    column = attr.ib(default=None)
+    value = attr.ib(default=None)
+
+    def _condition(self, condition=None, parameters=()):
+        conditions = [condition] if condition else []
+        if self.column is not None:
+            conditions.append(f"{self.column} = ?")
+            parameters = (*parameters, self.value)
+        return " AND ".join(conditions), parameters
+
+    def __len__(self):
+        condition, parameters = self._condition()
+        where = f" WHERE {condition}" if condition else ""
+        return self.store.connection.execute(f"SELECT COUNT(*) FROM {self.table}{where}", parameters).fetchone()[0]
+
+    def __iter__(self):
+        return self.store.rows(self.table, *self._condition())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            rows = list(self.store.rows(self.table, *self._condition(), limit=max(0, stop - start), offset=start))
+            return rows[::step]
+        if index < 0:
+            index += len(self)
+        found = self.store.find(self.table, *self._condition("position = ?", (index,))) if index >= 0 else None
+        if found is None:
+            raise IndexError(f"{self.table} index out of range")
+        return found[0]
+
+    def __setitem__(self, index, value):
+        self.store.track(value)
+
+    def index(self, value):
+        name_attribute = ROW_TYPES[type(value)][1]
+        found = self.store.find(self.table, *self._condition("name = ?", (getattr(value, name_attribute),)))
+        if found is None:
+            raise ValueError(f"{getattr(value, name_attribute)} is not in {self.table}")
+        return found[1]
+
+
+@attr.s
+class StoredNameIndex:
+    """
+    NameIndex over the names of one table, answered by queries on its
+    primary key
+    """
+    store = attr.ib()
+    table = attr.ib()
+
+    def get(self, name):
+        found = self.store.find(self.table, "name = ?", (name,))
+        if found is not None:
+            return found[0]
+
+    def search(self, text):
+        """
+        Return the matching names, those starting with text first and then
+        those containing it, each group in sorted order
+        """
+        query = f"SELECT name FROM {self.table} WHERE {{}} ORDER BY name"
+        # Names starting with text sort from text up to text with its last character incremented
+        after_prefix = text[:-1] + chr(ord(text[-1]) + 1)
+        matches = [name for name, in self.store.connection.execute(query.format("name >= ? AND name < ?"), (text, after_prefix))]
+        matches += [name for name, in self.store.connection.execute(query.format("instr(name, ?) > 1"), (text,))]
+        return matches
+
+
+@attr.s
+class StoredEditHistory(terraform.EditHistory):
+    """
+    EditHistory that has the store keep every object it records an edit
+    for, so the next commit writes it
+    """
+    store = attr.ib(default=None)
+
+    def record(self, description, *objects):
+        for obj in objects:
+            self.store.track(obj)
+        super().record(description, *objects)
+
+
+@attr.s
+class StoredSolution(terraform.TerraformSolution):
+    """
+    Solution whose networks, subnets, ports and instances stay in the store.
+    The collections read rows as they are iterated and the lookups are
+    indexed queries. Only the subnet address ranges and the edited rows are
+    held in memory.
+    """
+    store = attr.ib(default=None, repr=False)
+
+    def build_indexes(self):
+        self.subnet_index = StoredNameIndex(self.store, "subnets")
+        self.port_index = StoredNameIndex(self.store, "ports")
+        self.instance_index = StoredNameIndex(self.store, "instances")
+        self.address_index = terraform.AddressIndex()
+        for subnet in self.subnets:
+            self.address_index.add(subnet)
+
+    def get_subnet_by_id(self, network_id):
+        found = self.store.find("subnets", "network_id = ?", (network_id,))
+        if found is not None:
+            return found[0]
+        return self.solution_management_subnet
+
+    def get_port_by_name(self, port_name):
+        return self.store.find("ports", "name = ?", (port_name,))
+
+    def instance_ports(self, instance):
+        ports = {port.name: port for port in self.store.rows("ports", "instance = ?", (instance.name,))}
+        return [ports[port_name] for port_name in instance.port_names]
+
+    def in_memory(self):
+        """
+        A TerraformSolution holding every row, for saving to a pickle
+        """
+        solution = terraform.TerraformSolution(self.provider, self.output_directory)
+        for name, value in solution_state(self).items():
+            setattr(solution, name, value)
+        solution.networks = list(self.networks)
+        solution.subnets = [attr.evolve(subnet, ports=list(subnet.ports)) for subnet in self.subnets]
+        solution.instances = list(self.instances)
+        solution.build_indexes()
+        return solution
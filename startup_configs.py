@@ -0,0 +1,115 @@
+import base64
+import binascii
+import os
+import pathlib
+
+from lxml import etree
+
+# Bytes handed to the parser at a time, which bounds the config text held
+FEED_SIZE = 64 * 1024
+
+
+class StartupConfigTarget:
+    """
+    lxml parser target that decodes the base64 node configs under
+    <objects><configs> into one file per node as the text arrives, so no
+    config is ever held in memory whole. Everything else goes to a
+    TreeBuilder when build_tree is set, which gives the usual element tree
+    with empty config elements. Without a files_directory the configs are
+    only checked.
+    """
+
+    def __init__(self, files_directory, build_tree=True):
+        self.files_directory = pathlib.Path(files_directory) if files_directory is not None else None
+        self.builder = etree.TreeBuilder() if build_tree else None
+        self.node_names = {}
+        # Config id -> partial file, renamed after the node once parsing is done
+        self.partial_files = {}
+        self.in_configs = False
+        self.config_id = None
+        self.config_file = None
+        self.pending = ""
+        self.error = None
+        self.depth = 0
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if tag == "node":
+            self.node_names[attrib.get("id")] = attrib.get("name")
+        elif tag == "configs":
+            self.in_configs = True
+        elif tag == "config" and self.in_configs:
+            self.config_id = attrib.get("id")
+            self.pending = ""
+            if self.files_directory is None:
+                self.config_file = open(os.devnull, "wb")
+            else:
+                self.files_directory.mkdir(parents=True, exist_ok=True)
+                path = self.files_directory / f".config-{self.config_id}.partial"
+                self.partial_files[self.config_id] = path
+                self.config_file = open(path, "wb")
+        if self.builder is not None:
+            self.builder.start(tag, attrib)
+
+    def data(self, data):
+        if self.config_file is None:
+            if self.builder is not None:
+                self.builder.data(data)
+            return
+        text = self.pending + "".join(data.split())
+        whole = len(text) - len(text) % 4
+        self._write(text[:whole])
+        self.pending = text[whole:]
+
+    def end(self, tag):
+        self.depth -= 1
+        if tag == "config" and self.config_file is not None:
+            if self.pending:
+                self._write(self.pending + "=" * (-len(self.pending) % 4))
+            self.config_file.close()
+            self.config_file = None
+        elif tag == "configs":
+            self.in_configs = False
+        if self.builder is not None:
+            return self.builder.end(tag)
+
+    def _write(self, text):
+        # Raising here would be replaced by the parser's own error, so it is
+        # kept for close() and the rest of the config is skipped
+        if self.error is not None:
+            return
+        try:
+            self.config_file.write(base64.b64decode(text, validate=True))
+        except binascii.Error:
+            self.error = f"Startup config {self.config_id} is not valid base64"
+
+    def close(self):
+        if self.config_file is not None:
+            self.config_file.close()
+        if self.error is not None or self.depth:
+            for path in self.partial_files.values():
+                path.unlink(missing_ok=True)
+            if self.error is not None:
+                raise ValueError(self.error)
+            # Cut short by a syntax error, which the parser reports itself
+            return None
+        for config_id, path in self.partial_files.items():
+            name = self.node_names.get(config_id) or f"node-{config_id}"
+            path.replace(self.files_directory / f"{name}.cfg")
+        if self.builder is not None:
+            return self.builder.close()
+
+
+def parse(chunks, files_directory, build_tree=True):
+    """
+    Feed chunks of a UNL file to the parser, writing the node configs to
+    files_directory, if any. Returns the root element when build_tree is set.
+    """
+    parser = etree.XMLParser(target=StartupConfigTarget(files_directory, build_tree))
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def stream_chunks(stream):
+    return iter(lambda: stream.read(FEED_SIZE), b"")
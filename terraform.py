@@ -1,15 +1,62 @@
+# json, heapq, random and resource_manifest are only needed to read or write
+# a lab, so they are imported where they are used and loading a saved
+# solution stays fast; see bench_startup.py.
 import attr
+import bisect
+import copy
 import hcl
 import pathlib
+import re
 
 TERRAFORM_OPENSTACK_PLUGIN_VERSION = "1.46.0"
+
+# How instances get their cloud-init user data: a template_file and a
+# template_cloudinit_config data source per instance, or the built-in
+# templatefile() function, which needs no template provider
+CLOUD_INIT_DATA_SOURCES = "data-sources"
+CLOUD_INIT_TEMPLATEFILE = "templatefile"
+CLOUD_INIT_MODES = [CLOUD_INIT_DATA_SOURCES, CLOUD_INIT_TEMPLATEFILE]
+
+# A sharded lab is written as a core stack in terraform_setup, holding the
+# networks, subnets, solution management router and floating IPs, and one
+# root module per shard of instances with their ports and cloud-init. Shards
+# only read the core stack's state, so they can be planned and applied in
+# parallel once it exists.
+CORE_STACK = "core"
+# Core resource attributes used by shards, exported as one map per attribute
+CORE_OUTPUTS = {
+    ("openstack_networking_network_v2", "id"): "network_ids",
+    ("openstack_networking_subnet_v2", "id"): "subnet_ids",
+    ("openstack_networking_subnet_v2", "cidr"): "subnet_cidrs",
+    ("openstack_networking_floatingip_v2", "address"): "floating_ip_addresses",
+}
+
+# A replicated lab is written once, with a count of one copy per pod on
+# every block of the lab's own networks and instances. The pods share the
+# solution management network, the default cloud-init and the image and
+# flavor lookups. Each pod takes its own range of management addresses.
+POD_RESOURCE_TYPES = {
+    "openstack_networking_network_v2",
+    "openstack_networking_subnet_v2",
+    "openstack_networking_port_v2",
+    "openstack_compute_instance_v2",
+    "openstack_networking_floatingip_v2",
+    "openstack_compute_floatingip_associate_v2",
+    "data.template_file",
+    "data.template_cloudinit_config",
+}
+POD_PREFIX = "pod-"
+# Address of a replicated port on the solution management network, giving
+# its host number in the first pod
+POD_ADDRESS = re.compile(r"cidrhost\([^,]+, (\d+) \+")
+
 TERRAFORM_CONFIG = f"""terraform {{
-    required_providers {{
-        openstack = {{
-            source = "terraform-provider-openstack/openstack"
-            version = "{TERRAFORM_OPENSTACK_PLUGIN_VERSION}"
-        }}
+  required_providers {{
+    openstack = {{
+      source  = "terraform-provider-openstack/openstack"
+      version = "{TERRAFORM_OPENSTACK_PLUGIN_VERSION}"
     }}
+  }}
 }}
 """
 
@@ -122,8 +169,22 @@ remote_user = root
 host_key_checking = False
 
 timeout=60
+
+forks = {forks}
+
+[ssh_connection]
+# 128T nodes log in as t128 and become root through sudo. Pipelining
+# assumes their image doesn't set requiretty in sudoers; if become fails
+# with "sorry, you must have a tty to run sudo", set this to False.
+pipelining = True
+ssh_args = -o ControlMaster=auto -o ControlPersist={control_persist}s
 """
 
+# Ansible's own default fork count, kept for small labs
+MIN_FORKS = 5
+# Each fork is a process on the control host with its own SSH connection
+MAX_FORKS = 50
+
 TERRAFORM_PY_START = '''#!/usr/bin/env python3.6
 ###############################################################################
 # Copyright (c) 2018 128 Technology, Inc.
@@ -197,19 +258,31 @@ NETWORK_SETUP_YML = """---
   hosts: jumper, traffic-generator
   tags: connectivity
   gather_facts: no
-  serial: 1
   tasks:
-    - name: Remove previous known host
-      local_action: known_hosts state=absent name={{ ansible_host }}
+    - name: Remove previous known hosts
+      delegate_to: localhost
+      run_once: yes
+      changed_when: no
+      shell: |
+        test -f ~/.ssh/known_hosts || exit 0
+        for host in {% for host in ansible_play_hosts_all %}{{ hostvars[host].ansible_host | default(host) }} {% endfor %}; do
+          ssh-keygen -q -f ~/.ssh/known_hosts -R "$host" > /dev/null 2>&1 || true
+        done
 
 - name: SSH known host cleanup
   hosts: all
   tags: publicly-routable
   gather_facts: no
-  serial: 1
   tasks:
-    - name: Remove previous known host
-      local_action: known_hosts state=absent name={{ ansible_host }} path=~/.ssh/ansible_known_hosts
+    - name: Remove previous known hosts
+      delegate_to: localhost
+      run_once: yes
+      changed_when: no
+      shell: |
+        test -f ~/.ssh/ansible_known_hosts || exit 0
+        for host in {% for host in ansible_play_hosts_all %}{{ hostvars[host].ansible_host | default(host) }} {% endfor %}; do
+          ssh-keygen -q -f ~/.ssh/ansible_known_hosts -R "$host" > /dev/null 2>&1 || true
+        done
 
 - name: Jumper provisioning
   hosts: jumper
@@ -264,6 +337,215 @@ DEPLOY_128T_YML = """---
     - 128T-manually-configured
 """
 
+GROUP_VARS = {
+    "all.yml": (
+        "ansible_ssh_pass: exit33\n"
+        "global_nameserver: 172.20.0.100\n"
+    ),
+    "publicly-routable.yml": (
+        "ansible_ssh_common_args: \"-o UserKnownHostsFile=~/dev/null -o ProxyJump=\\\"root@{{ hostvars['jumper']['ansible_host'] }}\\\"\"\n"
+    ),
+    "128T-routers.yml": (
+        "t128_node_role: combo\n"
+        "\n"
+        "t128_router_name: 128t-router\n"
+        "t128_node_name: 128t-node\n"
+    ),
+    "128T-nodes.yml": (
+        "ansible_ssh_user: t128\n"
+        "ansible_become: yes\n"
+        "ansible_become_password: exit33\n"
+        "t128_management_ip: '127.0.0.1'\n"
+        "t128_needs_reboot: true\n"
+        "preloaded_image: 1\n"
+        "\n"
+        "t128_conductor_ips:\n"
+        "- IMPLEMENT_THIS\n"
+    ),
+    "128T-conductors.yml": (
+        "t128_node_role: conductor\n"
+        "t128_import_config_file: conductor\n"
+        "t128_router_name: conductor\n"
+    ),
+}
+
+HOSTS_GROUPS = "\n[128T-conductors]\n\n[128T-routers]\n\n[128T-nodes:children]\n128T-routers\n128T-conductors\n\n[publicly-routable:children]\n128T-nodes\n"
+
+@attr.s
+class NameIndex:
+    """
+    Map names to objects with prefix and substring search. The sorted name
+    list is only rebuilt on the first search after names were added.
+    """
+    entries = attr.ib(factory=dict)
+    _sorted_names = attr.ib(default=None, repr=False)
+
+    def add(self, name, value):
+        if name not in self.entries:
+            self._sorted_names = None
+        self.entries[name] = value
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def search(self, text):
+        """
+        Return the matching names, those starting with text first and then
+        those containing it, each group in sorted order
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.entries)
+        names = self._sorted_names
+        matches = []
+        for index in range(bisect.bisect_left(names, text), len(names)):
+            if not names[index].startswith(text):
+                break
+            matches.append(names[index])
+        matches += [name for name in names if text in name and not name.startswith(text)]
+        return matches
+
+
+@attr.s
+class AddressIndex:
+    """
+    Address ranges of every subnet, IPv6 prefixes of dual-stack subnets
+    included, sorted by start address for bisect lookups. Subnets may
+    overlap, so each entry also carries the highest end address of itself
+    and the entries before it, which bounds the scan back from the bisect
+    point. Like NameIndex the sorted lists are only rebuilt on the first
+    lookup after a subnet's ranges changed.
+    """
+    subnets = attr.ib(factory=list)
+    _entries = attr.ib(default=None, repr=False)
+    _starts = attr.ib(default=None, repr=False)
+    _max_ends = attr.ib(default=None, repr=False)
+
+    def add(self, subnet):
+        self.subnets.append(subnet)
+        subnet.address_index = self
+        self.invalidate()
+
+    def invalidate(self):
+        self._entries = None
+
+    def _build(self):
+        entries = []
+        for subnet in self.subnets:
+            entries.append((subnet.ip_version, subnet.network_address, subnet.broadcast_address, subnet.prefix_length, subnet))
+            if subnet.dual_stack:
+                ipv6_end = hcl.last_address(subnet.ipv6_network_address, subnet.ipv6_prefix_length, 6)
+                entries.append((6, subnet.ipv6_network_address, ipv6_end, subnet.ipv6_prefix_length, subnet))
+        entries.sort(key=lambda entry: entry[:2])
+        self._starts = [entry[:2] for entry in entries]
+        self._max_ends = []
+        for index, (ip_version, _, end, _, _) in enumerate(entries):
+            if index and entries[index - 1][0] == ip_version:
+                end = max(end, self._max_ends[-1])
+            self._max_ends.append(end)
+        self._entries = entries
+
+    def _overlapping_entries(self, ip_version, first, last):
+        if self._entries is None:
+            self._build()
+        found = []
+        index = bisect.bisect_right(self._starts, (ip_version, last)) - 1
+        while index >= 0 and self._starts[index][0] == ip_version and self._max_ends[index] >= first:
+            if self._entries[index][2] >= first:
+                found.append(self._entries[index])
+            index -= 1
+        return found
+
+    def overlapping(self, ip_version, first, last):
+        """
+        Subnets with a range overlapping first to last
+        """
+        return [entry[4] for entry in self._overlapping_entries(ip_version, first, last)]
+
+    def containing(self, address, ip_version):
+        return self.overlapping(ip_version, address, address)
+
+    def owner(self, address, ip_version):
+        """
+        The most specific subnet containing address, or None
+        """
+        entries = self._overlapping_entries(ip_version, address, address)
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: entry[3])[4]
+
+
+@attr.s
+class RenumberPlan:
+    """
+    New network and port addresses for a set of subnets, computed by
+    TerraformSolution.plan_renumber and applied with apply_renumber
+    """
+    # (subnet, new network address, new prefix length, new ip version, {port name: new address})
+    changes = attr.ib(factory=list)
+    # Ports that could not keep their host offset in the new network
+    compacted = attr.ib(factory=list)
+    collisions = attr.ib(factory=list)
+
+
+def _copy_state(obj):
+    # A subnet's ports list is shared with the copy, ports are recorded on their own
+    memo = {}
+    if isinstance(obj, hcl.ResourceOpenstackNetworkingSubnetV2):
+        memo[id(obj.ports)] = obj.ports
+        memo[id(obj.address_index)] = obj.address_index
+    return copy.deepcopy(vars(obj), memo)
+
+
+@attr.s
+class EditHistory:
+    """
+    Undo and redo for interactive edits. Each entry holds copies of only the
+    subnets, ports or instances one edit changed, so the memory used grows
+    with the edits made and not with the size of the lab.
+    """
+    undo_entries = attr.ib(factory=list)
+    redo_entries = attr.ib(factory=list)
+    # Checkpoint name -> number of undo entries when it was taken
+    checkpoints = attr.ib(factory=dict)
+
+    def record(self, description, *objects):
+        """
+        Save the state of objects, call this right before changing them
+        """
+        self.checkpoints = {
+            name: position for name, position in self.checkpoints.items() if position <= len(self.undo_entries)
+        }
+        self.undo_entries.append((description, [(obj, _copy_state(obj)) for obj in objects]))
+        self.redo_entries = []
+
+    def _swap(self, from_entries, to_entries):
+        description, states = from_entries.pop()
+        to_entries.append((description, [(obj, _copy_state(obj)) for obj, _ in states]))
+        for obj, state in states:
+            vars(obj).update(state)
+            if isinstance(obj, hcl.ResourceOpenstackNetworkingSubnetV2):
+                obj.ranges_changed()
+        return description
+
+    def undo(self):
+        if self.undo_entries:
+            return self._swap(self.undo_entries, self.redo_entries)
+
+    def redo(self):
+        if self.redo_entries:
+            return self._swap(self.redo_entries, self.undo_entries)
+
+    def save_checkpoint(self, name):
+        self.checkpoints[name] = len(self.undo_entries)
+
+    def restore_checkpoint(self, name):
+        position = self.checkpoints[name]
+        while len(self.undo_entries) > position:
+            self.undo()
+        while len(self.undo_entries) < position and self.redo_entries:
+            self.redo()
+
+
 @attr.s
 class TerraformSolution:
 
@@ -281,18 +563,201 @@ class TerraformSolution:
     SOLUTION_MANAGEMENT_FILE = "solution-management.tf"
     FLOATING_IPS_FILE = "floating-ips.tf"
     OUTPUTS_FILE = "outputs.tf"
+    LOOKUPS_FILE = "lookups.tf"
     DEFAULT_TEMPLATE_FILE = "default.tpl"
     STATIC_ETH0_TEMPLATE_FILE = "static_eth0.tpl"
     PASS_READER_FILE = "pass-openrc.sh"
+    SHARD_DIRECTORY_PREFIX = "shard-"
+    SHARD_OUTPUTS_FILE = "shard-outputs.tf"
+    REMOTE_STATE_FILE = "remote-state.tf"
+    RUN_ORDER_FILE = "run-order.json"
+    RESOURCE_MANIFEST_FILE = "resource-manifest.json"
+    CHANGES_FILE = "changes.json"
+    # Files written for each root module
+    STACK_FILES = [PORTS_FILE, TEMPLATES_FILE, CLOUD_INIT_FILE, LOOKUPS_FILE, INSTANCES_FILE, FLOATING_IPS_FILE, OUTPUTS_FILE]
 
     provider = attr.ib()
     output_directory = attr.ib()
-    variables = attr.ib(default=[])
-    networks = attr.ib(default=[])
-    subnets = attr.ib(default=[])
-    instances = attr.ib(default=[])
-    templates = attr.ib(default=[])
-    cloud_inits = attr.ib(default=[])
+    # Without factories every solution in a process would share these lists
+    variables = attr.ib(factory=list)
+    networks = attr.ib(factory=list)
+    subnets = attr.ib(factory=list)
+    instances = attr.ib(factory=list)
+    templates = attr.ib(factory=list)
+    cloud_inits = attr.ib(factory=list)
+    subnet_index = attr.ib(factory=NameIndex)
+    port_index = attr.ib(factory=NameIndex)
+    instance_index = attr.ib(factory=NameIndex)
+    address_index = attr.ib(factory=AddressIndex)
+    history = attr.ib(factory=EditHistory)
+    cloud_init_mode = attr.ib(default=CLOUD_INIT_DATA_SOURCES)
+    # Names of the instances with a startup config under the Ansible files directory
+    startup_configs = attr.ib(factory=set)
+    # Number of instance shards written next to the core stack, 0 for a single root module
+    shard_count = attr.ib(default=0)
+    # Instance name -> shard number, kept so rewriting a lab doesn't move instances between states
+    instance_shards = attr.ib(factory=dict)
+    # Number of pods the lab is replicated into, 0 to write it once as is
+    replicas = attr.ib(default=0)
+
+    @classmethod
+    def read_terraform(cls, output_directory):
+        """
+        Rebuild a solution from the terraform_setup directory written by
+        write_terraform, including its shards. Gateways are taken from the
+        cloud-init templates and from the Ansible host_vars when those exist.
+        """
+        import json
+
+        terraform_directory = pathlib.Path(output_directory) / cls.TERRAFORM_DIRECTORY
+        shards = []
+        run_order_path = terraform_directory / cls.RUN_ORDER_FILE
+        if run_order_path.exists():
+            shards = json.loads(run_order_path.read_text())["apply"][1]
+
+        def read(filename, stacks=None):
+            blocks = []
+            for stack in stacks or ["", *shards]:
+                path = terraform_directory / stack / filename
+                if path.exists():
+                    blocks += hcl.parse(path.read_text())
+            return blocks
+
+        solution = cls(hcl.ProviderOpenstack.create(), output_directory)
+        solution.shard_count = len(shards)
+        for variable in read(cls.VARIABLES_FILE, [""]):
+            solution.variables.append(hcl.HclVariable.create(variable.block_name, **variable.arguments))
+
+        management_name = None
+        for block in read(cls.SOLUTION_MANAGEMENT_FILE):
+            if block.block_label == "openstack_networking_router_v2":
+                management_name = block.block_name
+
+        for block in read(cls.SUBNETS_FILE):
+            arguments = block.arguments
+            network_name = hcl.reference_name(arguments["network_id"])
+            if network_name != block.block_name:
+                # The IPv6 half of a dual-stack network
+                solution.get_subnet_by_name(network_name).update_ipv6_cidr(arguments["cidr"])
+            elif block.block_name == management_name:
+                solution.setup_solution_management(
+                    None,
+                    management_name,
+                    arguments["cidr"],
+                    arguments.get("dns_nameservers"),
+                )
+            else:
+                solution.networks.append(hcl.ResourceOpenstackNetworkingNetworkV2.create(
+                    name=block.block_name,
+                    network_id=None,
+                ))
+                solution.add_subnet(hcl.ResourceOpenstackNetworkingSubnetV2.create(
+                    name=block.block_name,
+                    network_id=None,
+                    cidr=arguments["cidr"],
+                    enable_dhcp=arguments["enable_dhcp"] == "true",
+                    no_gateway=arguments["no_gateway"] == "true",
+                    dns_nameservers=arguments.get("dns_nameservers"),
+                ))
+
+        for block in read(cls.PORTS_FILE):
+            fixed_ips = block.attributes
+            subnet = solution.get_subnet_by_name(hcl.reference_name(fixed_ips[0].arguments["subnet_id"]))
+            address = fixed_ips[0].arguments["ip_address"]
+            pod_address = POD_ADDRESS.match(address)
+            if pod_address:
+                address = hcl.format_address(subnet.network_address + int(pod_address.group(1)))
+            solution.add_port(subnet, hcl.ResourceOpenstackNetworkingPortV2.create(
+                name=block.block_name,
+                subnet_name=subnet.subnet_name,
+                address=hcl.parse_address(address),
+                instance=None,
+                ip_version=6 if ":" in address else 4,
+                ipv6_address=hcl.parse_address(fixed_ips[1].arguments["ip_address"]) if len(fixed_ips) > 1 else None,
+            ))
+
+        lookups = {
+            (block.block_label, block.block_name): block.arguments["name"]
+            for block in read(cls.LOOKUPS_FILE)
+        }
+        instance_blocks = [(None, block) for block in read(cls.INSTANCES_FILE, [""])]
+        for number, shard in enumerate(shards, 1):
+            instance_blocks += [(number, block) for block in read(cls.INSTANCES_FILE, [shard])]
+        for shard_number, block in instance_blocks:
+            if shard_number is not None:
+                solution.instance_shards[block.block_name] = shard_number
+            if "count" in block.arguments:
+                solution.replicas = int(block.arguments["count"])
+            port_names = [hcl.reference_name(network.arguments["port"]) for network in block.attributes]
+            for port_name in port_names:
+                port, _ = solution.get_port_by_name(port_name)
+                port.instance = block.block_name
+            user_data = block.arguments["user_data"]
+            if user_data.startswith("format("):
+                solution.cloud_init_mode = CLOUD_INIT_TEMPLATEFILE
+                user_data = cls.DEFAULT_TEMPLATE_NAME if cls.DEFAULT_TEMPLATE_FILE in user_data else block.block_name
+            else:
+                user_data = hcl.reference_name(user_data)
+            arguments = block.arguments
+            if "image_id" in arguments:
+                image_name = lookups["openstack_images_image_v2", hcl.reference_name(arguments["image_id"])]
+                flavor_name = lookups["openstack_compute_flavor_v2", hcl.reference_name(arguments["flavor_id"])]
+            else:
+                # Written before the lookups, with the names on every instance
+                image_name = arguments["image_name"]
+                flavor_name = arguments["flavor_name"]
+            solution.add_instance(hcl.ResourceOpenstackComputeInstanceV2.create(
+                block.block_name,
+                port_names,
+                image_name=image_name,
+                flavor_name=flavor_name,
+                user_data=user_data,
+            ))
+
+        for block in read(cls.FLOATING_IPS_FILE):
+            if block.block_label == "openstack_networking_floatingip_v2":
+                solution.get_instance_by_name(block.block_name).floating_ip = True
+
+        for block in read(cls.TEMPLATES_FILE):
+            for meta_argument in block.meta_arguments:
+                gateway_ip = meta_argument.arguments.get("gateway-ip")
+                if gateway_ip and not isinstance(gateway_ip, hcl.Expression):
+                    # A shard refers to a gateway port in another shard by its address
+                    port0, _ = solution.get_port_by_name(solution.get_instance_by_name(block.block_name).port_names[0])
+                    address = hcl.parse_address(gateway_ip)
+                    gateway_port = next((
+                        (port, index) for index, port in enumerate(solution.get_subnet_by_name(port0.subnet_name).ports)
+                        if port.address == address
+                    ), None)
+                else:
+                    # Templates written before a gateway was selected refer to a port named None
+                    gateway_port = solution.get_port_by_name(hcl.reference_name(gateway_ip)) if gateway_ip else None
+                if gateway_port is not None:
+                    solution.get_subnet_by_name(gateway_port[0].subnet_name).gateway_port_name = gateway_port[0].name
+
+        solution.read_ansible_gateways()
+        solution.startup_configs = {
+            config_file.stem for config_file in
+            (pathlib.Path(output_directory) / cls.ANSIBLE_DIRECTORY / "files").glob("*.cfg")
+        }
+        return solution
+
+    def read_ansible_gateways(self):
+        inventory_directory = pathlib.Path(self.output_directory) / self.ANSIBLE_DIRECTORY / "inventory"
+        # A replicated lab keeps the variables of each instance in its group
+        vars_files = [*inventory_directory.glob("host_vars/*.yml"), *inventory_directory.glob("group_vars/*.yml")]
+        for host_vars_file in vars_files:
+            subnet = None
+            for line in host_vars_file.read_text().splitlines():
+                if line.startswith("- ifname: "):
+                    subnet = self.subnet_index.get(line.partition("#")[2])
+                    gateway_key = "  gateway: " if subnet is None or subnet.ip_version == 4 else "  gateway6: "
+                elif subnet is not None and subnet.gateway_port_name is None and line.startswith(gateway_key):
+                    gateway_address = hcl.parse_address(line.partition(": ")[2])
+                    for port in subnet.ports:
+                        if port.address == gateway_address:
+                            subnet.gateway_port_name = port.name
+                            break
 
     def setup_solution_management(
         self,
@@ -304,7 +769,7 @@ class TerraformSolution:
         self.management_network_name = management_name
         self.external_network = hcl.DataOpenstackNetworkingNetworkV2.create(
             "external-network",
-            "var.external_network",
+            hcl.Expression("var.external_network"),
             management_network_id,
         )
 
@@ -327,7 +792,7 @@ class TerraformSolution:
             dns_nameservers=dns_servers
         )
         # The first four addresses of this network are allocated to OpenStack
-        self.subnets.append(management_subnet)
+        self.add_subnet(management_subnet)
 
         self.solution_management_router_interface = hcl.ResourceOpenstackNetworkingRouterInterfaceV2.create(
             management_name,
@@ -335,6 +800,32 @@ class TerraformSolution:
             management_name
         )
 
+    def add_subnet(self, subnet):
+        self.subnets.append(subnet)
+        self.subnet_index.add(subnet.subnet_name, subnet)
+        self.address_index.add(subnet)
+
+    def add_port(self, subnet, port):
+        subnet.ports.append(port)
+        self.port_index.add(port.name, (subnet, len(subnet.ports) - 1))
+
+    def add_instance(self, instance):
+        self.instances.append(instance)
+        self.instance_index.add(instance.name, instance)
+
+    def build_indexes(self):
+        self.subnet_index = NameIndex()
+        self.port_index = NameIndex()
+        self.instance_index = NameIndex()
+        self.address_index = AddressIndex()
+        for subnet in self.subnets:
+            self.subnet_index.add(subnet.subnet_name, subnet)
+            self.address_index.add(subnet)
+            for index, port in enumerate(subnet.ports):
+                self.port_index.add(port.name, (subnet, index))
+        for instance in self.instances:
+            self.instance_index.add(instance.name, instance)
+
     def get_subnet_by_id(self, network_id):
         for subnet in self.subnets:
             if subnet.network_id == network_id:
@@ -342,23 +833,133 @@ class TerraformSolution:
         return self.solution_management_subnet
 
     def get_subnet_by_name(self, subnet_name):
-        for subnet in self.subnets:
-            if subnet.subnet_name == subnet_name:
-                return subnet
+        subnet = self.subnet_index.get(subnet_name)
+        if subnet is not None:
+            return subnet
         return self.solution_management_subnet
 
     def get_port_by_name(self, port_name):
+        entry = self.port_index.get(port_name)
+        if entry is not None:
+            subnet, index = entry
+            return subnet.ports[index], index
+
+    def get_instance_by_name(self, instance_name):
+        return self.instance_index.get(instance_name)
+
+    def instance_ports(self, instance):
+        return [self.get_port_by_name(port_name)[0] for port_name in instance.port_names]
+
+    def in_management_network(self, address, ip_version, subnet=None):
+        """
+        Whether address falls in the management network while belonging to a
+        different subnet
+        """
+        if subnet is not None and subnet.subnet_name == self.management_network_name:
+            return False
+        return any(
+            other.subnet_name == self.management_network_name
+            for other in self.address_index.containing(address, ip_version)
+        )
+
+    def plan_renumber(self, cidr_map, subnet_names=None):
+        """
+        Map subnets from the old CIDRs in cidr_map to the new ones. Only subnets
+        in subnet_names are considered when it is given. Ports keep their
+        offset from the network address where it still fits in the new
+        network, the others are packed into the lowest free addresses.
+        """
+        new_networks = {hcl.parse_cidr(old): hcl.parse_cidr(new) for old, new in cidr_map.items()}
+        plan = RenumberPlan()
         for subnet in self.subnets:
-            for index, port in enumerate(subnet.ports):
-                if port.name == port_name:
-                    return port, index
+            if subnet_names is not None and subnet.subnet_name not in subnet_names:
+                continue
+            new_network = new_networks.get((subnet.network_address, subnet.prefix_length, subnet.ip_version))
+            if new_network is None:
+                continue
+
+            network_address, prefix_length, ip_version = new_network
+            if subnet.subnet_name != self.management_network_name and any(
+                other.subnet_name == self.management_network_name for other in self.address_index.overlapping(
+                    ip_version, network_address, hcl.last_address(network_address, prefix_length, ip_version))
+            ):
+                plan.collisions.append(
+                    f"Subnet {subnet.subnet_name} would overlap the management network as {hcl.format_cidr(network_address, prefix_length, ip_version)}"
+                )
+            first_host, last_host = hcl.host_range(network_address, prefix_length, subnet.enable_dhcp, ip_version)
+            port_addresses = {}
+            used = set()
+            pending = []
+            for port in subnet.ports:
+                address = network_address + port.address - subnet.network_address
+                if first_host <= address <= last_host and address not in used:
+                    port_addresses[port.name] = address
+                    used.add(address)
+                else:
+                    pending.append(port)
+
+            address = first_host
+            for port in pending:
+                while address in used:
+                    address += 1
+                if address > last_host:
+                    plan.collisions.append(
+                        f"Subnet {subnet.subnet_name} has {len(subnet.ports)} ports which do not fit in {hcl.format_cidr(network_address, prefix_length, ip_version)}"
+                    )
+                    break
+                port_addresses[port.name] = address
+                used.add(address)
+                plan.compacted.append(port.name)
+
+            plan.changes.append((subnet, network_address, prefix_length, ip_version, port_addresses))
+        return plan
+
+    def apply_renumber(self, plan):
+        for subnet, network_address, prefix_length, ip_version, port_addresses in plan.changes:
+            subnet.update_cidr(hcl.format_cidr(network_address, prefix_length, ip_version))
+            for port in subnet.ports:
+                port.update_address(port_addresses[port.name], ip_version)
+
+    def set_ipv6_prefix(self, subnet, ipv6_cidr):
+        """
+        Make subnet dual-stack with the given IPv6 prefix, or single stack again
+        when ipv6_cidr is None. Ports keep their IPv6 host offset where it fits
+        in the new prefix and get the next free address otherwise.
+        """
+        old_network_address = subnet.ipv6_network_address
+        subnet.update_ipv6_cidr(ipv6_cidr)
+        if ipv6_cidr is None:
+            for port in subnet.ports:
+                port.update_ipv6_address(None)
+            return None
+
+        first_host, last_host = hcl.host_range(subnet.ipv6_network_address, subnet.ipv6_prefix_length, ip_version=6)
+        used = set()
+        pending = []
+        for port in subnet.ports:
+            if port.ipv6_address is None or old_network_address is None:
+                pending.append(port)
+                continue
+            address = subnet.ipv6_network_address + port.ipv6_address - old_network_address
+            if first_host <= address <= last_host and address not in used:
+                port.update_ipv6_address(address)
+                used.add(address)
+            else:
+                pending.append(port)
+
+        free_addresses = hcl.free_addresses(first_host, last_host, used)
+        for port in pending:
+            port.update_ipv6_address(next(free_addresses, None))
+
+    def write_terraform(self, asset_store=None):
+        import json
 
-    def write_terraform(self):
         terraform_directory = pathlib.Path(self.output_directory) / self.TERRAFORM_DIRECTORY
         terraform_directory.mkdir(exist_ok=True)
-        (terraform_directory / self.PASS_READER_FILE).write_text(PASS_READER_SCRIPT)
-        (terraform_directory / self.DEFAULT_TEMPLATE_FILE).write_text(DHCP_TEMPLATE)
-        (terraform_directory / self.STATIC_ETH0_TEMPLATE_FILE).write_text(STATIC_ETH0_TEMPLATE)
+        shards = self.assign_shards()
+        for shard in shards:
+            (terraform_directory / shard).mkdir(exist_ok=True)
+        self.write_static_files(self.TERRAFORM_DIRECTORY, asset_store)
 
         provider_text = TERRAFORM_CONFIG + "\n"
         provider_text += self.provider.render()
@@ -377,84 +978,559 @@ class TerraformSolution:
 
         network_text = ""
         for network in self.networks:
-            network_text += network.render() + "\n"
+            network_text += self.for_pods(network).render() + "\n"
 
         (terraform_directory / self.NETWORKS_FILE).write_text(network_text)
 
+        # Ports no instance uses stay in the core stack of a sharded lab.
+        # Instances are kept by name, each shard's are looked up when it is written.
+        shard_instance_names = {shard: [] for shard in shards}
+        shard_port_names = {shard: set() for shard in shards}
+        for instance in self.instances:
+            shard = self.shard_of(instance.name)
+            if shard is not None:
+                shard_instance_names[shard].append(instance.name)
+                shard_port_names[shard].update(instance.port_names)
+        core_references = {}
+        references = {shard: self.reference_core(shard_port_names[shard], core_references) for shard in shards}
+
         subnet_text = ""
-        port_text = ""
+        port_texts = {shard: [] for shard in [None, *shards]}
+        pod_stride = self.pod_stride() if self.replicas else 0
         for subnet in self.subnets:
-            subnet_text += subnet.render() + "\n"
+            subnet_text += self.render_subnet(subnet) + "\n"
 
             for port in subnet.ports:
-                port_text += port.render() + "\n"
+                shard = self.shard_of(port.instance)
+                port_texts[shard].append(self.render_port(port, pod_stride, references.get(shard)) + "\n")
 
         (terraform_directory / self.SUBNETS_FILE).write_text(subnet_text)
-        (terraform_directory / self.PORTS_FILE).write_text(port_text)
-
-        template_text = hcl.DataTemplateFile.create(
-            self.DEFAULT_TEMPLATE_NAME,
-            self.DEFAULT_TEMPLATE_FILE,
-        ).render() + "\n"
 
-        cloud_init_text = hcl.DataTemplateCloudinitConfig.create(
-            self.DEFAULT_TEMPLATE_NAME,
-            self.DEFAULT_TEMPLATE_NAME,
-        ).render() + "\n"
+        if not shards:
+            self.write_stack(terraform_directory, self.instances, "".join(port_texts[None]))
+            (terraform_directory / self.SHARD_OUTPUTS_FILE).unlink(missing_ok=True)
+            (terraform_directory / self.RUN_ORDER_FILE).unlink(missing_ok=True)
+            self.clear_stale_shards(terraform_directory, shards)
+            return self.write_change_manifest(terraform_directory, shards)
 
-        instance_text = ""
         floating_ips_text = ""
         outputs_text = ""
-
-        nw0 = None
         for instance in self.instances:
-            port0, _ = self.get_port_by_name(instance.port_names[0])
-            if port0.subnet_name != self.management_network_name:
-                gateway_port = self.get_subnet_by_name(port0.subnet_name).gateway_port_name
-                template_text += hcl.DataTemplateFile.create(
-                    instance.name,
-                    self.STATIC_ETH0_TEMPLATE_FILE,
-                    vars={
-                        "ip-address": f"openstack_networking_port_v2.{instance.name}_0.all_fixed_ips[0]",
-                        "prefix-length": f'element(split("/",openstack_networking_subnet_v2.{port0.subnet_name}.cidr),1)',
-                        "gateway-ip": f"openstack_networking_port_v2.{gateway_port}.all_fixed_ips[0]",
-                        "nameserver": "172.20.0.100",
-                    }
-                ).render() + "\n"
-
-                cloud_init_text += hcl.DataTemplateCloudinitConfig.create(
-                    instance.name,
-                    instance.name,
-                ).render() + "\n"
-                 
-            instance_text += instance.render() + "\n"
             if instance.floating_ip:
                 floating_ips_text += hcl.ResourceOpenstackNetworkingFloatingipV2.create(instance.name).render() + "\n"
-                floating_ips_text += hcl.ResourceOpenstackComputeFloatingipAssociateV2.create(
-                    instance.name,
-                    instance.name,
-                    instance.name,
-                ).render() + "\n"
-
-                outputs_text += hcl.HclOutputFloatingip.create(
-                    instance.name,
-                    instance.name,
-                ).render() + "\n"
-
-        (terraform_directory / self.TEMPLATES_FILE).write_text(template_text)
-        (terraform_directory / self.CLOUD_INIT_FILE).write_text(cloud_init_text)
-        (terraform_directory / self.INSTANCES_FILE).write_text(instance_text)
+                outputs_text += hcl.HclOutputFloatingip.create(instance.name, instance.name).render() + "\n"
+
+        for shard in shards:
+            shard_directory = terraform_directory / shard
+            (shard_directory / self.PROVIDER_FILE).write_text(provider_text)
+            (shard_directory / self.VARIABLES_FILE).write_text(var_text)
+            (shard_directory / self.REMOTE_STATE_FILE).write_text(
+                hcl.DataTerraformRemoteState.create(CORE_STACK, "../terraform.tfstate").render()
+            )
+            instances = [self.get_instance_by_name(name) for name in shard_instance_names[shard]]
+            self.write_stack(shard_directory, instances, "".join(port_texts[shard]), references[shard])
+
+        if port_texts[None]:
+            (terraform_directory / self.PORTS_FILE).write_text("".join(port_texts[None]))
+        else:
+            (terraform_directory / self.PORTS_FILE).unlink(missing_ok=True)
+        for filename in [self.TEMPLATES_FILE, self.CLOUD_INIT_FILE, self.LOOKUPS_FILE, self.INSTANCES_FILE]:
+            (terraform_directory / filename).unlink(missing_ok=True)
         (terraform_directory / self.FLOATING_IPS_FILE).write_text(floating_ips_text)
         (terraform_directory / self.OUTPUTS_FILE).write_text(outputs_text)
+        shard_outputs_text = ""
+        for output, values in sorted(core_references.items()):
+            shard_outputs_text += hcl.HclOutputMap.create(output, dict(sorted(values.items()))).render() + "\n"
+        (terraform_directory / self.SHARD_OUTPUTS_FILE).write_text(shard_outputs_text)
+        (terraform_directory / self.RUN_ORDER_FILE).write_text(json.dumps(_run_order(shards), indent=2) + "\n")
+        self.clear_stale_shards(terraform_directory, shards)
+        return self.write_change_manifest(terraform_directory, shards)
+
+    def write_change_manifest(self, terraform_directory, shards):
+        """
+        Fingerprint every resource and data block of each stack by address
+        and compare them with the manifest of the previous write. The changed,
+        added and removed addresses of every stack with changes are written to
+        CHANGES_FILE, with -target arguments covering them and everything that
+        depends on them, including shard blocks that read a changed core
+        resource. Returns the number of changed, added and removed addresses.
+        """
+        import json
+        import resource_manifest
+
+        manifest_path = terraform_directory / self.RESOURCE_MANIFEST_FILE
+        previous = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        remote_outputs = {output: resource_type for (resource_type, _), output in CORE_OUTPUTS.items()}
+        stale_stacks = sorted(previous.keys() - {".", *shards})
+        manifest = {}
+        changes = {}
+        core_targets = set()
+        for stack in [".", *shards, *stale_stacks]:
+            digests = {}
+            if stack not in stale_stacks:
+                digests = manifest[stack] = resource_manifest.read_stack(terraform_directory / stack)
+            changed, added, removed = resource_manifest.diff(previous.get(stack, {}), digests)
+            targets = {*changed, *added}
+            # Blocks are only searched for references when something is left to find
+            if (changed or core_targets) and len(targets) < len(digests):
+                referenced_by = resource_manifest.read_references(terraform_directory / stack, remote_outputs)
+                targets |= resource_manifest.dependents(referenced_by, targets | core_targets)
+            if stack == ".":
+                core_targets = targets
+            if targets or removed:
+                changes[stack] = {
+                    "changed": changed,
+                    "added": added,
+                    "removed": removed,
+                    "targets": [f"-target={address}" for address in sorted(targets | set(removed))],
+                }
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+        (terraform_directory / self.CHANGES_FILE).write_text(json.dumps(changes, indent=2) + "\n")
+        return sum(len(stack_changes[kind]) for stack_changes in changes.values() for kind in ("changed", "added", "removed"))
+
+    def write_stack(self, directory, instances, port_text, reference=None):
+        """
+        Write the ports, cloud-init and instances of one root module. When
+        reference is given the module is a shard: its blocks have their
+        references mapped by it, see reference_core, and floating IPs are only
+        associated.
+        """
+        template_text = ""
+        cloud_init_text = ""
+        if self.cloud_init_mode == CLOUD_INIT_DATA_SOURCES:
+            template_text = hcl.DataTemplateFile.create(
+                self.DEFAULT_TEMPLATE_NAME,
+                self.DEFAULT_TEMPLATE_FILE,
+            ).render() + "\n"
+
+            cloud_init_text = hcl.DataTemplateCloudinitConfig.create(
+                self.DEFAULT_TEMPLATE_NAME,
+                self.DEFAULT_TEMPLATE_NAME,
+            ).render() + "\n"
 
-    def write_ansible(self):
-        ansible_directory = pathlib.Path(self.output_directory) / self.ANSIBLE_DIRECTORY
-        ansible_directory.mkdir(exist_ok=True)
-        (ansible_directory / "ansible.cfg").write_text(ANSIBLE_CFG)
+        instance_text = ""
+        floating_ips_text = ""
+        outputs_text = ""
+
+        for instance in instances:
+            instance_template_text, instance_cloud_init_text = self.render_instance_templates(instance, reference)
+            template_text += instance_template_text
+            cloud_init_text += instance_cloud_init_text
+            instance_text += self.render_instance(instance, reference)
+            if instance.floating_ip:
+                if reference is not None:
+                    floating_ips_text += self.render_floating_ip_association(instance, reference)
+                    continue
+                instance_floating_ip_text, instance_output_text = self.render_floating_ip(instance)
+                floating_ips_text += instance_floating_ip_text
+                outputs_text += instance_output_text
+
+        texts = {
+            self.PORTS_FILE: port_text,
+            self.LOOKUPS_FILE: self.render_lookups(instances),
+            self.INSTANCES_FILE: instance_text,
+            self.FLOATING_IPS_FILE: floating_ips_text,
+            self.OUTPUTS_FILE: outputs_text,
+        }
+        if self.cloud_init_mode == CLOUD_INIT_DATA_SOURCES:
+            texts[self.TEMPLATES_FILE] = template_text
+            texts[self.CLOUD_INIT_FILE] = cloud_init_text
+        else:
+            # Left over data sources would still pull in the template provider
+            (directory / self.TEMPLATES_FILE).unlink(missing_ok=True)
+            (directory / self.CLOUD_INIT_FILE).unlink(missing_ok=True)
+        if reference is not None:
+            # Shards export nothing, the floating IP outputs are in the core stack
+            del texts[self.OUTPUTS_FILE]
+            (directory / self.OUTPUTS_FILE).unlink(missing_ok=True)
+        for filename, text in texts.items():
+            (directory / filename).write_text(text)
+
+    def reference_core(self, local_ports, core_references):
+        """
+        Function for HclObject.map_references that points a shard's
+        references to core stack resources at the core stack's remote state
+        outputs, recording each one used in core_references. A gateway port
+        outside local_ports can't be referred to at all, so its fixed address
+        is used instead.
+        """
+        def reference(target):
+            if target.resource_type == "openstack_networking_port_v2":
+                port = self.get_port_by_name(target.name) if target.name not in local_ports else None
+                if port is None or target.attribute != "all_fixed_ips[0]":
+                    return target
+                return port[0].address_string
+            output = CORE_OUTPUTS.get((target.resource_type, target.attribute))
+            if output is None:
+                return target
+            core_references.setdefault(output, {})[target.name] = target
+            return hcl.Expression(f'data.terraform_remote_state.{CORE_STACK}.outputs.{output}["{target.name}"]')
+
+        return reference
+
+    def shard_names(self):
+        return [f"{self.SHARD_DIRECTORY_PREFIX}{number}" for number in range(1, self.shard_count + 1)]
+
+    def shard_of(self, instance_name):
+        """
+        Shard directory of an instance, None for the core stack when the lab
+        isn't sharded or nothing is attached to the port the name came from
+        """
+        if not self.shard_count or instance_name not in self.instance_shards:
+            return None
+        return f"{self.SHARD_DIRECTORY_PREFIX}{self.instance_shards[instance_name]}"
+
+    def assign_shards(self):
+        """
+        Put every instance without a shard into the one with the least
+        instances and ports so far, largest instances first. Instances keep
+        the shard they were given, since moving one would destroy and
+        recreate it. Returns the shard directory names.
+        """
+        import heapq
+
+        self.instance_shards = {
+            instance.name: self.instance_shards[instance.name] for instance in self.instances
+            if 0 < self.instance_shards.get(instance.name, 0) <= self.shard_count
+        }
+        if not self.shard_count:
+            return []
+
+        weights = {instance.name: 1 + len(instance.port_names) for instance in self.instances}
+        loads = [[0, number] for number in range(1, self.shard_count + 1)]
+        for name, number in self.instance_shards.items():
+            loads[number - 1][0] += weights[name]
+        heapq.heapify(loads)
+        unassigned = [instance.name for instance in self.instances if instance.name not in self.instance_shards]
+        for name in sorted(unassigned, key=lambda name: -weights[name]):
+            load = heapq.heappop(loads)
+            self.instance_shards[name] = load[1]
+            load[0] += weights[name]
+            heapq.heappush(loads, load)
+        return self.shard_names()
+
+    def clear_stale_shards(self, terraform_directory, shards):
+        """
+        Remove the generated files of shard directories no longer in use. The
+        directories are kept since they may hold state that still has to be
+        destroyed.
+        """
+        for shard_directory in terraform_directory.glob(f"{self.SHARD_DIRECTORY_PREFIX}*"):
+            if shard_directory.name in shards or not shard_directory.is_dir():
+                continue
+            for filename in [self.PROVIDER_FILE, self.VARIABLES_FILE, self.REMOTE_STATE_FILE, *self.STACK_FILES]:
+                (shard_directory / filename).unlink(missing_ok=True)
+
+    def pod_names(self):
+        return [f"{POD_PREFIX}{number}" for number in range(1, self.replicas + 1)]
+
+    def pod_hosts(self):
+        """
+        Inventory host name and instance of every copy of every instance,
+        pod by pod
+        """
+        if not self.replicas:
+            return ((instance.name, instance) for instance in self.instances)
+        return ((f"{pod}-{instance.name}", instance) for pod in self.pod_names() for instance in self.instances)
+
+    def pod_stride(self):
+        """
+        Number of solution management addresses each pod takes, from the
+        lowest to the highest address of the lab's ports on that network.
+        Pod n has the addresses of the first pod moved up n strides.
+        """
+        addresses = [port.address for port in self.get_subnet_by_name(self.management_network_name).ports]
+        return max(addresses) - min(addresses) + 1 if addresses else 0
+
+    def pod_capacity(self):
+        """
+        How many pods fit in the solution management network, None when the
+        lab has no ports on it
+        """
+        subnet = self.get_subnet_by_name(self.management_network_name)
+        stride = self.pod_stride()
+        if not stride:
+            return None
+        _, last_host = hcl.host_range(subnet.network_address, subnet.prefix_length, subnet.enable_dhcp, subnet.ip_version)
+        return (last_host - min(port.address for port in subnet.ports) + 1) // stride
+
+    def shared_by_pods(self, name):
+        return name in (
+            self.management_network_name,
+            f"{self.management_network_name}{hcl.IPV6_SUBNET_SUFFIX}",
+            self.DEFAULT_TEMPLATE_NAME,
+        )
 
-        (ansible_directory / "network-setup.yml").write_text(NETWORK_SETUP_YML)
-        (ansible_directory / "deploy-128t.yml").write_text(DEPLOY_128T_YML)
+    def for_pods(self, block):
+        """
+        Copy of block with one instance per pod: a count, a pod prefix on its
+        name and references to the same pod's copy of other per-pod blocks.
+        Shared blocks, and every block of a lab that isn't replicated, are
+        returned as is.
+        """
+        if not self.replicas or self.shared_by_pods(block.block_name):
+            return block
+        block = block.map_references(self.reference_pod)
+        arguments = {"count": hcl.Expression(str(self.replicas)), **block.arguments}
+        if "name" in arguments:
+            arguments["name"] = hcl.Expression(f'"{POD_PREFIX}${{count.index + 1}}-{arguments["name"]}"')
+        return attr.evolve(block, arguments=arguments)
+
+    def reference_pod(self, reference):
+        if reference.resource_type not in POD_RESOURCE_TYPES or self.shared_by_pods(reference.name):
+            return reference
+        return reference.at("count.index")
+
+    def render_subnet(self, subnet):
+        return "\n".join(self.for_pods(block).render() for block in subnet.blocks())
+
+    def render_port(self, port, pod_stride=0, reference=None):
+        """
+        Port text, with the address of a replicated port on the solution
+        management network moved along by pod_stride for each pod
+        """
+        if reference is not None:
+            port = port.map_references(reference)
+        if self.replicas and port.subnet_name == self.management_network_name:
+            subnet = self.get_subnet_by_name(port.subnet_name)
+            fixed_ip = port.attributes[0]
+            pod_address = hcl.Compound(
+                f"cidrhost({{}}, {port.address - subnet.network_address} + count.index * {pod_stride})",
+                hcl.Reference("openstack_networking_subnet_v2", subnet.subnet_name, "cidr"),
+            )
+            port = attr.evolve(port, attributes=[
+                hcl.HclAttribute(fixed_ip.type, {**fixed_ip.arguments, "ip_address": pod_address}),
+                *port.attributes[1:],
+            ])
+        return self.for_pods(port).render()
+
+    def instance_template(self, instance):
+        """
+        Template file and its variables for an instance. Instances with eth0
+        on the management network use the DHCP template, which has none.
+        """
+        port0, _ = self.get_port_by_name(instance.port_names[0])
+        if port0.subnet_name == self.management_network_name:
+            return self.DEFAULT_TEMPLATE_FILE, None
+        gateway_port = self.get_subnet_by_name(port0.subnet_name).gateway_port_name
+        return self.STATIC_ETH0_TEMPLATE_FILE, {
+            "ip-address": hcl.Reference("openstack_networking_port_v2", f"{instance.name}_0", "all_fixed_ips[0]"),
+            "prefix-length": hcl.Compound(
+                'element(split("/", {}), 1)', hcl.Reference("openstack_networking_subnet_v2", port0.subnet_name, "cidr")
+            ),
+            "gateway-ip": hcl.Reference("openstack_networking_port_v2", gateway_port, "all_fixed_ips[0]"),
+            "nameserver": "172.20.0.100",
+        }
+
+    def render_instance_templates(self, instance, reference=None):
+        """
+        Template and cloud-init data source text for an instance whose eth0 is
+        not on the management network, empty strings otherwise
+        """
+        template_file, vars = self.instance_template(instance)
+        if vars is None or self.cloud_init_mode != CLOUD_INIT_DATA_SOURCES:
+            return "", ""
+        template = hcl.DataTemplateFile.create(
+            instance.name,
+            template_file,
+            vars=vars,
+        )
+        if reference is not None:
+            template = template.map_references(reference)
+        template_text = self.for_pods(template).render() + "\n"
+
+        cloud_init_text = self.for_pods(hcl.DataTemplateCloudinitConfig.create(
+            instance.name,
+            instance.name,
+        )).render() + "\n"
+        return template_text, cloud_init_text
+
+    def lookups(self, instances):
+        """
+        One image and one flavor data source for each distinct value the
+        instances use, so the provider resolves a name once per stack rather
+        than once per instance
+        """
+        images = {hcl.lookup_name(instance.image_name): instance.image_name for instance in instances}
+        flavors = {hcl.lookup_name(instance.flavor_name): instance.flavor_name for instance in instances}
+        return [
+            *(hcl.DataOpenstackImagesImageV2.create(image_name) for image_name in images.values()),
+            *(hcl.DataOpenstackComputeFlavorV2.create(flavor_name) for flavor_name in flavors.values()),
+        ]
+
+    def render_lookups(self, instances):
+        return "".join(lookup.render() + "\n" for lookup in self.lookups(instances))
+
+    def render_instance(self, instance, reference=None):
+        if self.cloud_init_mode == CLOUD_INIT_TEMPLATEFILE:
+            instance = attr.evolve(instance, arguments={
+                **instance.arguments,
+                "user_data": hcl.cloud_config_user_data(*self.instance_template(instance)),
+            })
+        if reference is not None:
+            instance = instance.map_references(reference)
+        return self.for_pods(instance).render() + "\n"
+
+    def render_floating_ip(self, instance):
+        floating_ips_text = self.for_pods(hcl.ResourceOpenstackNetworkingFloatingipV2.create(instance.name)).render() + "\n"
+        floating_ips_text += self.render_floating_ip_association(instance)
+
+        if not self.replicas:
+            outputs_text = hcl.HclOutputFloatingip.create(
+                instance.name,
+                instance.name,
+            ).render() + "\n"
+            return floating_ips_text, outputs_text
+        # One output per pod, named like the pod's host in the inventory
+        outputs_text = ""
+        for index, pod in enumerate(self.pod_names()):
+            outputs_text += hcl.HclOutputFloatingip.create(
+                f"{pod}-{instance.name}",
+                instance.name,
+                index,
+            ).render() + "\n"
+        return floating_ips_text, outputs_text
+
+    def render_floating_ip_association(self, instance, reference=None):
+        association = hcl.ResourceOpenstackComputeFloatingipAssociateV2.create(
+            instance.name,
+            instance.name,
+            instance.name,
+        )
+        if reference is not None:
+            association = association.map_references(reference)
+        return self.for_pods(association).render() + "\n"
+
+    def static_files(self):
+        """
+        Files whose contents are the same for every lab, keyed by their path
+        relative to the output directory
+        """
+        terraform_directory = pathlib.PurePosixPath(self.TERRAFORM_DIRECTORY)
+        ansible_directory = pathlib.PurePosixPath(self.ANSIBLE_DIRECTORY)
+        files = {
+            terraform_directory / self.PASS_READER_FILE: PASS_READER_SCRIPT,
+            terraform_directory / self.DEFAULT_TEMPLATE_FILE: DHCP_TEMPLATE,
+            terraform_directory / self.STATIC_ETH0_TEMPLATE_FILE: STATIC_ETH0_TEMPLATE,
+            ansible_directory / "network-setup.yml": NETWORK_SETUP_YML,
+            ansible_directory / "deploy-128t.yml": DEPLOY_128T_YML,
+        }
+        for shard in self.shard_names():
+            # Templates are read relative to the module that uses them
+            files[terraform_directory / shard / self.DEFAULT_TEMPLATE_FILE] = DHCP_TEMPLATE
+            files[terraform_directory / shard / self.STATIC_ETH0_TEMPLATE_FILE] = STATIC_ETH0_TEMPLATE
+        for name, text in GROUP_VARS.items():
+            files[ansible_directory / "inventory" / "group_vars" / name] = text
+        return files
+
+    def write_static_files(self, directory, asset_store=None):
+        """
+        Write the static files under directory, linking them from asset_store
+        when one is given. An existing file is replaced rather than written
+        through since it may be a link into the store.
+        """
+        if asset_store is not None:
+            asset_store.register_lab(self.output_directory)
+        for path, text in self.static_files().items():
+            if path.parts[0] != directory:
+                continue
+            destination = pathlib.Path(self.output_directory) / path
+            if asset_store is not None:
+                asset_store.link(text, destination)
+            else:
+                destination.unlink(missing_ok=True)
+                destination.write_text(text)
+
+    def render_host_vars(self, instance):
+        host_vars_text = ""
+        i = 0
+        for port in self.instance_ports(instance):
+            if i==0:
+                if not instance.floating_ip:
+                    host_vars_text += f"ansible_host: {port.address_string}\n\n"
+                host_vars_text = "interfaces:\n"
+            subnet = self.get_subnet_by_name(port.subnet_name)
+            if not subnet.subnet_name == self.management_network_name:
+                gateway_port = None
+                if subnet.gateway_port_name is not None:
+                    gateway_port, _ = self.get_port_by_name(subnet.gateway_port_name)
+                host_vars_text += f"- ifname: eth{i} #{port.subnet_name}\n"
+                if subnet.ip_version == 4:
+                    host_vars_text += f"  inet4: {port.address_string}\n"
+                    host_vars_text += f"  prefix: {subnet.prefix_length}\n"
+                    if gateway_port is not None:
+                        host_vars_text += f"  gateway: {gateway_port.address_string}\n"
+                else:
+                    host_vars_text += f"  inet6: {port.address_string}\n"
+                    host_vars_text += f"  prefix6: {subnet.prefix_length}\n"
+                    if gateway_port is not None:
+                        host_vars_text += f"  gateway6: {gateway_port.address_string}\n"
+                if subnet.dual_stack and port.ipv6_address is not None:
+                    host_vars_text += f"  inet6: {port.ipv6_address_string}\n"
+                    host_vars_text += f"  prefix6: {subnet.ipv6_prefix_length}\n"
+                    if gateway_port is not None and gateway_port.ipv6_address is not None:
+                        host_vars_text += f"  gateway6: {gateway_port.ipv6_address_string}\n"
+            i += 1
+        if instance.name in self.startup_configs:
+            host_vars_text += f"startup_config: files/{instance.name}.cfg\n"
+        return host_vars_text
+
+    def render_pod_groups(self):
+        """
+        Inventory groups of a replicated lab: one per instance holding its
+        copies, so plays for an instance run in every pod, and one per pod
+        """
+        if not self.replicas:
+            return ""
+        groups_text = ""
+        for instance in self.instances:
+            groups_text += f"\n[{instance.name}]\n"
+            groups_text += "".join(f"{pod}-{instance.name}\n" for pod in self.pod_names())
+        for pod in self.pod_names():
+            groups_text += f"\n[{pod}]\n"
+            groups_text += "".join(f"{pod}-{instance.name}\n" for instance in self.instances)
+        return groups_text
+
+    def render_ansible_cfg(self):
+        """
+        ansible.cfg with forks and SSH connection reuse sized for the number
+        of instances. A connection has to outlive a whole
+        pass of the forks over the lab to be reused by the next task.
+        """
+        instance_count = len(self.instances) * max(self.replicas, 1)
+        forks = min(max(instance_count, MIN_FORKS), MAX_FORKS)
+        passes = -(-instance_count // forks)
+        return ANSIBLE_CFG.format(
+            forks=forks,
+            control_persist=min(60 * max(passes, 1), 1800),
+        )
 
+    def render_terraform_py(self, floating_ips):
+        terraform_py_text = TERRAFORM_PY_START
+        terraform_py_text += f"            self._dut_names = {floating_ips}\n"
+        terraform_py_text += TERRAFORM_PY_MIDDLE1
+        terraform_py_text += f'                "__terraform_dependent": {floating_ips},\n'
+        terraform_py_text += TERRAFORM_PY_MIDDLE2
+        for instance in floating_ips[:-1]:
+            terraform_py_text += f'                        "{instance}" : {{{{\n'
+            terraform_py_text += f'                            "ansible_host" : {{{instance.replace("-", "_")}}}\n'
+            terraform_py_text += "                        }},\n"
+        terraform_py_text += f'                        "{floating_ips[-1]}" : {{{{\n'
+        terraform_py_text += f'                            "ansible_host" : {{{floating_ips[-1].replace("-", "_")}}}\n'
+        terraform_py_text += "                        }}\n"
+        terraform_py_text += TERRAFORM_PY_MIDDLE3
+
+        for index, instance in enumerate(floating_ips[:-1]):
+            terraform_py_text += f"            {instance.replace('-', '_')}=self._output[self._dut_names[{index}]],\n"
+
+        terraform_py_text += f"            {floating_ips[-1].replace('-', '_')}=self._output[self._dut_names[{len(floating_ips) - 1}]])\n"
+
+        terraform_py_text += TERRAFORM_PY_END
+        return terraform_py_text
+
+    def write_ansible(self, asset_store=None):
+        ansible_directory = pathlib.Path(self.output_directory) / self.ANSIBLE_DIRECTORY
+        ansible_directory.mkdir(exist_ok=True)
         (ansible_directory / "files").mkdir(exist_ok=True)
         inventory_directory = ansible_directory / "inventory"
         inventory_directory.mkdir(exist_ok=True)
@@ -463,91 +1539,224 @@ class TerraformSolution:
         host_vars_directory = inventory_directory / "host_vars"
         host_vars_directory.mkdir(exist_ok=True)
 
-        (group_vars_directory / "all.yml").write_text(
-            "ansible_ssh_pass: exit33\n" + \
-            "global_nameserver: 172.20.0.100\n"
-        )
-
-        (group_vars_directory / "publicly-routable.yml").write_text(
-            "ansible_ssh_common_args: \"-o UserKnownHostsFile=~/dev/null -o ProxyJump=\\\"root@{{ hostvars['jumper']['ansible_host'] }}\\\"\"\n"
-        )
-
-        (group_vars_directory / "128T-routers.yml").write_text(
-            "t128_node_role: combo\n" + \
-            "\n" + \
-            "t128_router_name: 128t-router\n"
-            "t128_node_name: 128t-node\n"
-        )
+        self.write_static_files(self.ANSIBLE_DIRECTORY, asset_store)
+        # Not a static file any more, but older labs may have it linked from an asset store
+        (ansible_directory / "ansible.cfg").unlink(missing_ok=True)
+        (ansible_directory / "ansible.cfg").write_text(self.render_ansible_cfg())
 
-        (group_vars_directory / "128T-nodes.yml").write_text(
-            "ansible_ssh_user: t128\n" + \
-            "ansible_become: yes\n" + \
-            "ansible_become_password: exit33\n" + \
-            "t128_management_ip: '127.0.0.1'\n" + \
-            "t128_needs_reboot: true\n" + \
-            "preloaded_image: 1\n" + \
-            "\n" + \
-            "t128_conductor_ips:\n"
-            "- IMPLEMENT_THIS\n"
-        )
-
-        (group_vars_directory / "128T-conductors.yml").write_text(
-            "t128_node_role: conductor\n" + \
-            "t128_import_config_file: conductor\n" + \
-            "t128_router_name: conductor\n"
-        )
+        if self.replicas:
+            # The copies of an instance share its variables through their group
+            for instance in self.instances:
+                (group_vars_directory / f"{instance.name}.yml").write_text(self.render_host_vars(instance))
 
         hosts_text = ""
         floating_ips = []
-        for instance in self.instances:
+        for host_name, instance in self.pod_hosts():
             if instance.floating_ip:
-                floating_ips.append(f"{instance.name}")
-            host_vars_text = ""
-            i = 0
-            for interface in instance.port_names:
-                port, _ = self.get_port_by_name(interface)
-                if i==0:
-                    if not instance.floating_ip:
-                        host_vars_text += f"ansible_host: {port.address}\n\n"
-                    host_vars_text = "interfaces:\n"
-                subnet = self.get_subnet_by_name(port.subnet_name)
-                if not subnet.subnet_name == self.management_network_name:
-                    host_vars_text += f"- ifname: eth{i} #{port.subnet_name}\n"
-                    host_vars_text += f"  inet4: {port.address}\n"
-                    host_vars_text += f"  prefix: {subnet.cidr.split('/')[1]}\n"
-                    if subnet.gateway_port_name is not None:
-                        gateway_port, _ = self.get_port_by_name(subnet.gateway_port_name)
-                        host_vars_text += f"  gateway: {gateway_port.address}\n"
-                i += 1
-            (host_vars_directory / f"{instance.name}.yml").write_text(host_vars_text)
-
-            hosts_text += f"{instance.name}\n"
-
-        hosts_text += "\n[128T-conductors]\n\n[128T-routers]\n\n[128T-nodes:children]\n128T-routers\n128T-conductors\n\n[publicly-routable:children]\n128T-nodes\n"
+                floating_ips.append(host_name)
+            if not self.replicas:
+                (host_vars_directory / f"{host_name}.yml").write_text(self.render_host_vars(instance))
+
+            hosts_text += f"{host_name}\n"
+
+        hosts_text += self.render_pod_groups()
+        hosts_text += HOSTS_GROUPS
         (inventory_directory / "hosts").write_text(hosts_text)
 
         if floating_ips:
-            terraform_py_text = TERRAFORM_PY_START
-            terraform_py_text += f"            self._dut_names = {floating_ips}\n"
-            terraform_py_text += TERRAFORM_PY_MIDDLE1
-            terraform_py_text += f'                "__terraform_dependent": {floating_ips},\n'
-            terraform_py_text += TERRAFORM_PY_MIDDLE2
-            for instance in floating_ips[:-1]:
-                terraform_py_text += f'                        "{instance}" : {{{{\n'
-                terraform_py_text += f'                            "ansible_host" : {{{instance.replace("-", "_")}}}\n'
-                terraform_py_text += "                        }},\n"
-            terraform_py_text += f'                        "{floating_ips[-1]}" : {{{{\n'
-            terraform_py_text += f'                            "ansible_host" : {{{floating_ips[-1].replace("-", "_")}}}\n'
-            terraform_py_text += "                        }}\n"
-            terraform_py_text += TERRAFORM_PY_MIDDLE3
-
-            for index, instance in enumerate(floating_ips[:1]):
-                terraform_py_text += f"            {instance.replace('-', '_')}=self._output[self._dut_names[{index}]],\n"
-
-            terraform_py_text += f"            {floating_ips[-1].replace('-', '_')}=self._output[self._dut_names[{len(floating_ips) - 1}]])\n"
-
-            terraform_py_text += TERRAFORM_PY_END
-
+            terraform_py_text = self.render_terraform_py(floating_ips)
             terraform_py_file = inventory_directory / "terraform.py"
             terraform_py_file.write_text(terraform_py_text)
             terraform_py_file.chmod(33277)
+
+    def estimate_output(self, sample_size=50):
+        """
+        Estimated size in bytes of every file write_terraform and write_ansible
+        would produce, keyed by path relative to the output directory. At most
+        sample_size items of each kind are rendered and the average scaled up
+        to the full count. host_vars files are added up into one entry. A
+        sharded lab has its instances assigned to shards as write_terraform
+        would, and the change manifest is sized as on a first write. It
+        follows the writers' layout; check_estimates in golden.py compares
+        the two.
+        """
+        import json
+
+        terraform_directory = pathlib.PurePosixPath(self.TERRAFORM_DIRECTORY)
+        inventory_directory = pathlib.PurePosixPath(self.ANSIBLE_DIRECTORY, "inventory")
+        shards = self.assign_shards()
+        stack_instances = {shard: [] for shard in [None, *shards]}
+        for instance in self.instances:
+            stack_instances[self.shard_of(instance.name)].append(instance)
+        stack_ports = {shard: [] for shard in [None, *shards]}
+        for subnet in self.subnets:
+            for port in subnet.ports:
+                stack_ports[self.shard_of(port.instance)].append(port)
+        pod_stride = self.pod_stride() if self.replicas else 0
+
+        estimate = {path: len(text) for path, text in self.static_files().items()}
+        provider_size = len(TERRAFORM_CONFIG) + 1 + len(self.provider.render())
+        variables_size = sum(len(variable.render()) + 1 for variable in self.variables)
+        estimate[terraform_directory / self.PROVIDER_FILE] = provider_size
+        estimate[terraform_directory / self.VARIABLES_FILE] = variables_size
+        estimate[terraform_directory / self.SOLUTION_MANAGEMENT_FILE] = (
+            len(self.external_network.render()) + 1
+            + len(self.solution_management_router.render()) + 1
+            + len(self.solution_management_router_interface.render())
+        )
+        estimate[terraform_directory / self.NETWORKS_FILE] = _sampled_size(
+            self.networks, lambda network: len(self.for_pods(network).render()) + 1, sample_size)
+        estimate[terraform_directory / self.SUBNETS_FILE] = _sampled_size(
+            self.subnets, lambda subnet: len(self.render_subnet(subnet)) + 1, sample_size)
+        addresses = {".": [
+            _address(block) for block in [
+                self.external_network,
+                self.solution_management_router,
+                self.solution_management_router_interface,
+                *self.networks,
+                *(block for subnet in self.subnets for block in subnet.blocks()),
+            ]
+        ]}
+
+        core_references = {}
+        for shard in [None, *shards]:
+            directory = terraform_directory / shard if shard else terraform_directory
+            instances = stack_instances[shard]
+            ports = stack_ports[shard]
+            stack_addresses = addresses.setdefault(shard or ".", [])
+            stack_addresses += [_address(port) for port in ports]
+            floating_instances = [instance for instance in instances if instance.floating_ip]
+            reference = None
+            if shard is not None:
+                local_ports = {port_name for instance in instances for port_name in instance.port_names}
+                reference = self.reference_core(local_ports, core_references)
+                remote_state = hcl.DataTerraformRemoteState.create(CORE_STACK, "../terraform.tfstate")
+                estimate[directory / self.PROVIDER_FILE] = provider_size
+                estimate[directory / self.VARIABLES_FILE] = variables_size
+                estimate[directory / self.REMOTE_STATE_FILE] = len(remote_state.render())
+                stack_addresses.append(_address(remote_state))
+                # Every core resource a shard refers to becomes a shard output,
+                # so all of its references are collected, not just the sample's
+                for port in ports:
+                    port.map_references(reference)
+                for instance in instances:
+                    for value in (self.instance_template(instance)[1] or {}).values():
+                        hcl.map_references(value, reference)
+                for instance in floating_instances:
+                    hcl.ResourceOpenstackComputeFloatingipAssociateV2.create(
+                        instance.name, instance.name, instance.name,
+                    ).map_references(reference)
+            if ports or not shards:
+                estimate[directory / self.PORTS_FILE] = _sampled_size(
+                    ports, lambda port: len(self.render_port(port, pod_stride, reference)) + 1, sample_size)
+            if shard is None and shards:
+                # The core stack of a sharded lab holds no instances
+                floating_instances = [instance for instance in self.instances if instance.floating_ip]
+                estimate[directory / self.FLOATING_IPS_FILE] = sum(
+                    len(hcl.ResourceOpenstackNetworkingFloatingipV2.create(instance.name).render()) + 1
+                    for instance in floating_instances
+                )
+                estimate[directory / self.OUTPUTS_FILE] = sum(
+                    len(hcl.HclOutputFloatingip.create(instance.name, instance.name).render()) + 1
+                    for instance in floating_instances
+                )
+                stack_addresses += [f"openstack_networking_floatingip_v2.{instance.name}" for instance in floating_instances]
+                continue
+
+            if self.cloud_init_mode == CLOUD_INIT_DATA_SOURCES:
+                template_instances = [instance for instance in instances if self.instance_template(instance)[1] is not None]
+                estimate[directory / self.TEMPLATES_FILE] = len(hcl.DataTemplateFile.create(
+                    self.DEFAULT_TEMPLATE_NAME,
+                    self.DEFAULT_TEMPLATE_FILE,
+                ).render()) + 1 + _sampled_size(
+                    template_instances, lambda instance: len(self.render_instance_templates(instance, reference)[0]), sample_size)
+                estimate[directory / self.CLOUD_INIT_FILE] = len(hcl.DataTemplateCloudinitConfig.create(
+                    self.DEFAULT_TEMPLATE_NAME,
+                    self.DEFAULT_TEMPLATE_NAME,
+                ).render()) + 1 + _sampled_size(
+                    template_instances, lambda instance: len(self.render_instance_templates(instance, reference)[1]), sample_size)
+                for name in [self.DEFAULT_TEMPLATE_NAME, *(instance.name for instance in template_instances)]:
+                    stack_addresses += [f"data.template_file.{name}", f"data.template_cloudinit_config.{name}"]
+            lookups = self.lookups(instances)
+            estimate[directory / self.LOOKUPS_FILE] = sum(len(lookup.render()) + 1 for lookup in lookups)
+            estimate[directory / self.INSTANCES_FILE] = _sampled_size(
+                instances, lambda instance: len(self.render_instance(instance, reference)), sample_size)
+            stack_addresses += [_address(lookup) for lookup in lookups]
+            stack_addresses += [f"openstack_compute_instance_v2.{instance.name}" for instance in instances]
+            stack_addresses += [
+                f"openstack_compute_floatingip_associate_v2.{instance.name}" for instance in floating_instances
+            ]
+            if shard is not None:
+                estimate[directory / self.FLOATING_IPS_FILE] = _sampled_size(
+                    floating_instances, lambda instance: len(self.render_floating_ip_association(instance, reference)), sample_size)
+                continue
+            estimate[directory / self.FLOATING_IPS_FILE] = _sampled_size(
+                floating_instances, lambda instance: len(self.render_floating_ip(instance)[0]), sample_size)
+            estimate[directory / self.OUTPUTS_FILE] = _sampled_size(
+                floating_instances, lambda instance: len(self.render_floating_ip(instance)[1]), sample_size)
+            stack_addresses += [f"openstack_networking_floatingip_v2.{instance.name}" for instance in floating_instances]
+
+        if shards:
+            estimate[terraform_directory / self.SHARD_OUTPUTS_FILE] = sum(
+                len(hcl.HclOutputMap.create(output, dict(sorted(values.items()))).render()) + 1
+                for output, values in core_references.items()
+            )
+            estimate[terraform_directory / self.RUN_ORDER_FILE] = len(json.dumps(_run_order(shards), indent=2)) + 1
+        # Digests are sha1 hex, and a first write adds and targets every address
+        estimate[terraform_directory / self.RESOURCE_MANIFEST_FILE] = len(json.dumps({
+            stack: {address: "0" * 40 for address in stack_addresses}
+            for stack, stack_addresses in addresses.items()
+        }, indent=2, sort_keys=True)) + 1
+        estimate[terraform_directory / self.CHANGES_FILE] = len(json.dumps({
+            stack: {
+                "changed": [],
+                "added": sorted(stack_addresses),
+                "removed": [],
+                "targets": [f"-target={address}" for address in sorted(stack_addresses)],
+            } for stack, stack_addresses in addresses.items() if stack_addresses
+        }, indent=2)) + 1
+
+        estimate[inventory_directory.parent / "ansible.cfg"] = len(self.render_ansible_cfg())
+        pod_hosts = list(self.pod_hosts())
+        vars_directory = "group_vars" if self.replicas else "host_vars"
+        estimate[inventory_directory / vars_directory / "*.yml"] = _sampled_size(
+            self.instances, lambda instance: len(self.render_host_vars(instance)), sample_size)
+        estimate[inventory_directory / "hosts"] = (
+            sum(len(host_name) + 1 for host_name, _ in pod_hosts) + len(self.render_pod_groups()) + len(HOSTS_GROUPS)
+        )
+        if any(instance.floating_ip for instance in self.instances):
+            estimate[inventory_directory / "terraform.py"] = len(
+                self.render_terraform_py([host_name for host_name, instance in pod_hosts if instance.floating_ip]))
+        return estimate
+
+
+def _address(block):
+    if block.block_type == hcl.BLOCK_TYPE_DATA:
+        return f"data.{block.block_label}.{block.block_name}"
+    return f"{block.block_label}.{block.block_name}"
+
+
+def _run_order(shards):
+    """
+    Order to apply and destroy the core stack and the shards of a lab in,
+    each entry a list of stacks that can run in parallel
+    """
+    return {
+        "apply": [["."], shards],
+        "destroy": [shards, ["."]],
+    }
+
+
+def _sampled_size(items, size, sample_size):
+    """
+    Sum of size(item) over items, measured on a random sample of at most
+    sample_size items when there are more. The seed is fixed so the estimate
+    is the same on every run; a regular stride would line up with labs that
+    put every n-th node on the management network.
+    """
+    import random
+
+    if len(items) <= sample_size:
+        return sum(size(item) for item in items)
+    sample = random.Random(0).sample(items, sample_size)
+    return round(sum(size(item) for item in sample) * len(items) / sample_size)
@@ -1,14 +1,10 @@
 #!/usr/bin/python3
+# Only lightweight modules are imported at startup. hcl, terraform, lxml,
+# ipaddress and pickle are imported by the functions that need them so that
+# --help and other short paths stay fast; see bench_startup.py.
 import argparse
-import hcl
-import ipaddress
 import pathlib
-import pickle
 import sys
-import terraform
-from lxml import etree
-
-import pdb
 
 DEFAULT_MANAGEMENT_CIDR = "192.168.2.0/24"
 DNS_SERVERS = ["172.20.0.100", "172.20.0.101"]
@@ -16,36 +12,116 @@ DEFAULT_NETWORK_CIDR = "169.254.0.0/16"
 
 T128_VERSION="128T-5.4.3-2.el7"
 
+# Number of entries shown per page in the interactive menus
+PAGE_SIZE = 20
+
 def process_args():
     parser = argparse.ArgumentParser(description="Read EVE-NG .unl file and convert to terraform")
-    parser.add_argument("-u", "--unl-file", help="EVE-NG format .unl file as source")
-    parser.add_argument("-s", "--solution-file", help="Saved file written by this tool")
+    parser.add_argument("-u", "--unl-file", help="EVE-NG format .unl file as source, optionally gzip, xz or zstd compressed, or - for stdin with --dry-run")
+    parser.add_argument("-s", "--solution-file", help="Saved file written by this tool, either a pickle or a .db SQLite store")
+    parser.add_argument("-r", "--resume-directory", help="Output directory previously written by this tool to read the solution back from")
     parser.add_argument("-o", "--output-directory", help="Directory to dump output terraform to")
+    parser.add_argument("--ipv6-cidr", help="IPv6 prefix added to every lab network to make it dual-stack")
+    parser.add_argument("--cloud-init", choices=["data-sources", "templatefile"], help="Render cloud-init through template provider data sources (the default for new labs) or the built-in templatefile() function")
+    parser.add_argument("--shards", type=int, help="Write instances to this many separate root modules next to a core stack of networks and subnets, 0 for one root module")
+    parser.add_argument("--replicas", type=int, help="Write this many copies of the lab as pods sharing the solution management network, 0 for one plain copy")
+    parser.add_argument("--asset-store", help="Directory of shared static files to link into the output instead of writing a copy per lab")
+    parser.add_argument("--collect-assets", action="store_true", help="Remove files from the asset store that no lab uses any more, then exit")
+    parser.add_argument("--cache-directory", help="Directory for cached parsed labs, default ~/.cache/unl2terraform")
+    parser.add_argument("--cache-size", type=int, default=256, help="Size limit of the parse cache in MiB, least recently used labs are removed first")
+    parser.add_argument("--no-cache", action="store_true", help="Always parse the UNL file instead of using the parse cache")
+    parser.add_argument("--lint", nargs="+", metavar="UNL_FILE", help="Check UNL files for problems that would break a conversion, then exit, - reads one from stdin")
+    parser.add_argument("--dry-run", action="store_true", help="Report counts, address utilization and estimated output size and memory of the --unl-file lab, then exit without writing anything")
     args = parser.parse_args()
 
-    if not args.unl_file and not args.solution_file:
-        parser.error("Either unl-file or solution-file option must be given")
-    if args.unl_file and not args.output_directory:
+    if args.lint:
+        return args
+    if args.collect_assets:
+        if not args.asset_store:
+            parser.error("Option --collect-assets needs --asset-store")
+        return args
+    if not args.unl_file and not args.solution_file and not args.resume_directory:
+        parser.error("One of the unl-file, solution-file or resume-directory options must be given")
+    if args.unl_file and not args.output_directory and not args.dry_run:
         parser.error("An output directory must also be specified")
+    if args.unl_file == "-" and not args.dry_run:
+        # The interactive menu reads its choices from stdin
+        parser.error("Option --unl-file - reads the lab from stdin, which only works with --dry-run")
+
+    if sum(1 for source in [args.unl_file, args.solution_file, args.resume_directory] if source) > 1:
+        parser.error("Options --unl-file, --solution-file and --resume-directory are mutually exclusive")
+    if args.dry_run and not args.unl_file:
+        parser.error("Option --dry-run only works with --unl-file")
+
+    if args.shards is not None and args.shards < 0:
+        parser.error("Option --shards must not be negative")
+    if args.replicas is not None and args.replicas < 0:
+        parser.error("Option --replicas must not be negative")
+    if args.shards and args.replicas:
+        parser.error("Options --shards and --replicas can't be used together")
+
+    if args.ipv6_cidr:
+        import ipaddress
 
-    if args.unl_file and args.solution_file:
-        parser.error("Options --unl-file and --solution-file are mutually exclusive")
+        try:
+            args.ipv6_cidr = str(ipaddress.IPv6Network(args.ipv6_cidr, strict=False))
+        except ValueError:
+            parser.error("Option --ipv6-cidr must be an IPv6 prefix")
 
     return args
 
 def main(args):
+    if args.lint:
+        lint(args.lint)
+        return
+    if args.collect_assets:
+        collect_assets(pathlib.Path(args.asset_store))
+        return
+    if args.unl_file and args.dry_run:
+        output_directory = None
+        if args.output_directory:
+            output_directory = pathlib.Path(args.output_directory)
+        dry_run(pathlib.Path(args.unl_file), output_directory, args.ipv6_cidr, args.cloud_init, args.shards, args.replicas)
+        return
     if args.unl_file:
         validate_output_directory(pathlib.Path(args.output_directory))
-        solution = load_unl(pathlib.Path(args.unl_file), pathlib.Path(args.output_directory))
+        cache = None
+        if not args.no_cache:
+            import parse_cache
+
+            cache = parse_cache.ParseCache(
+                args.cache_directory or parse_cache.default_cache_directory(),
+                args.cache_size * 1024 * 1024,
+            )
+        solution = load_unl(pathlib.Path(args.unl_file), pathlib.Path(args.output_directory), args.ipv6_cidr, cache)
     elif args.solution_file:
         output_directory = None
         if args.output_directory:
             output_directory = pathlib.Path(args.output_directory)
         solution = load_solution(pathlib.Path(args.solution_file), output_directory)
+    elif args.resume_directory:
+        output_directory = None
+        if args.output_directory:
+            output_directory = pathlib.Path(args.output_directory)
+        solution = resume_solution(pathlib.Path(args.resume_directory), output_directory)
     else:
         sys.exit("ERROR: No solution defined")
 
-    main_menu(solution)
+    if args.cloud_init:
+        solution.cloud_init_mode = args.cloud_init
+    if args.shards is not None:
+        solution.shard_count = args.shards
+    if args.replicas is not None:
+        solution.replicas = args.replicas
+    if solution.shard_count and solution.replicas:
+        sys.exit("ERROR: A sharded lab can't be replicated, write it with --shards 0 first")
+
+    asset_store = None
+    if args.asset_store:
+        import assets
+
+        asset_store = assets.AssetStore(args.asset_store)
+    main_menu(solution, asset_store)
 
 def validate_output_directory(output_directory):
     if not output_directory.exists():
@@ -54,34 +130,329 @@ def validate_output_directory(output_directory):
     if not output_directory.is_dir():
         sys.exit("ERROR: Specified output directory exists but is not a directory")
 
-def load_unl(unl_file, output_directory):
+def load_unl(unl_file, output_directory, ipv6_cidr=None, cache=None):
+    """
+    Parse and plan a UNL file. With a cache, a lab seen before with the same
+    contents and options is loaded from it without parsing the XML. stdin is
+    never cached. Node startup configs are written to the Ansible files
+    directory either way.
+    """
+    import terraform
+
+    config_directory = pathlib.Path(output_directory) / terraform.TerraformSolution.ANSIBLE_DIRECTORY / "files"
+    if cache is None or not unl_file.is_file():
+        return plan_solution(parse_unl(unl_file, config_directory), output_directory, ipv6_cidr)
+
+    key = cache.key(unl_file, ipv6_cidr)
+    solution = cache.get(key, config_directory)
+    if solution is None:
+        solution = plan_solution(parse_unl(unl_file, config_directory), output_directory, ipv6_cidr)
+        cache.put(key, solution, config_directory)
+    else:
+        solution.output_directory = output_directory
+        solution.build_indexes()
+    return solution
+
+def parse_unl(unl_file, config_directory=None, drop_configs=False):
+    """
+    Parse a UNL file, or stdin when unl_file is "-". gzip, xz and zstd input
+    is recognised by its magic bytes and decompressed while lxml reads it.
+    Plain files are memory-mapped and handed to lxml without being copied
+    into a Python string first.
+
+    With a config_directory, the base64 node startup configs are decoded
+    into it while the file is read, a chunk at a time, and left out of the
+    tree. With drop_configs instead, they are checked the same way but not
+    written anywhere. A plain file without configs still takes the faster
+    path.
+    """
+    import mmap
+    from lxml import etree
+    import startup_configs
+
+    stream_configs = config_directory is not None or drop_configs
+    # Startup configs may be longer than libxml2's 10 MB text node limit
+    parser = etree.XMLParser(huge_tree=True)
+    stream, mappable = open_unl(unl_file)
+    try:
+        if not mappable:
+            if not stream_configs:
+                return etree.parse(stream, parser).getroot()
+            return parse_startup_configs(startup_configs.stream_chunks(stream), config_directory)
+
+        with stream:
+            try:
+                contents = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                sys.exit("ERROR: Specified UNL file is empty")
+            with contents:
+                if not stream_configs or contents.find(b"<configs") == -1:
+                    return etree.fromstring(contents, parser)
+            # Read rather than mapped so large configs don't stay resident
+            return parse_startup_configs(startup_configs.stream_chunks(stream), config_directory)
+    except etree.XMLSyntaxError as error:
+        sys.exit(f"ERROR: Specified UNL file is not valid XML: {error}")
+
+def parse_startup_configs(chunks, config_directory):
+    import startup_configs
+
     try:
-        contents = unl_file.read_text()
-    except IsADirectoryError:
-        sys.exit("ERROR: Specified UNL file is a directory")
+        return startup_configs.parse(chunks, config_directory)
+    except ValueError as error:
+        sys.exit(f"ERROR: {error}")
 
-    unl_xml = etree.fromstring(str.encode(contents))
+def open_unl(unl_file):
+    """
+    Open a UNL file, or stdin for "-", decompressing it if needed. Returns
+    the binary stream and whether it is a plain file that can be mapped.
+    """
+    if str(unl_file) == "-":
+        stream = sys.stdin.buffer
+    else:
+        try:
+            stream = open(unl_file, "rb")
+        except IsADirectoryError:
+            sys.exit("ERROR: Specified UNL file is a directory")
+        except FileNotFoundError:
+            sys.exit("ERROR: Specified UNL file does not exist")
+
+    decompressed = open_decompressed(stream)
+    if decompressed is not None:
+        return decompressed, False
+    return stream, stream is not sys.stdin.buffer
+
+def lint_unl(unl_file):
+    """
+    Check a UNL file for the problems that would stop a conversion part way
+    and return them as a list of (line, message). The XML is streamed once
+    and every element is dropped after it is checked, so memory only grows
+    with the number of node, port and network names and the largest config.
+    """
+    from lxml import etree
+
+    problems = []
+    node_lines = {}
+    port_lines = {}
+    network_lines = {}
+    management_lines = []
+    # Interfaces may come before the networks they refer to
+    unresolved = {}
+
+    def lint_node(node):
+        name = node.get("name")
+        if not name:
+            problems.append((node.sourceline, "node has no name"))
+            return
+        # A duplicate's ports collide with the first node's, which the
+        # duplicate name already reports, but its interfaces are still checked
+        duplicate = name in node_lines
+        if duplicate:
+            problems.append((node.sourceline, f"duplicate node name {name}, first defined on line {node_lines[name]}"))
+        else:
+            node_lines[name] = node.sourceline
+        interface_ids = set()
+        for interface in node.iterchildren("interface"):
+            if_id = interface.get("id")
+            network_id = interface.get("network_id")
+            port_name = f"{name}_{if_id}"
+            if if_id in interface_ids:
+                problems.append((interface.sourceline, f"node {name} has more than one interface {if_id}"))
+            elif port_name in port_lines and not duplicate:
+                problems.append((interface.sourceline, f"port name {port_name} collides with the port on line {port_lines[port_name]}"))
+            interface_ids.add(if_id)
+            port_lines.setdefault(port_name, interface.sourceline)
+            if not network_id or network_id == "0":
+                problems.append((interface.sourceline, f"interface {if_id} of node {name} is not connected to a network"))
+            elif network_id not in network_lines:
+                unresolved.setdefault(network_id, []).append((interface.sourceline, name, if_id))
+        if "0" not in interface_ids:
+            problems.append((node.sourceline, f"node {name} has no interface 0"))
+
+    def lint_network(network):
+        network_id = network.get("id")
+        if not network.get("name"):
+            problems.append((network.sourceline, f"network {network_id} has no name"))
+        if network_id in network_lines:
+            problems.append((network.sourceline, f"duplicate network id {network_id}, first defined on line {network_lines[network_id]}"))
+        network_lines.setdefault(network_id, network.sourceline)
+        if network.get("type") == "pnet0":
+            if management_lines:
+                problems.append((network.sourceline, f"more than one pnet0 network, the first is on line {management_lines[0]}"))
+            management_lines.append(network.sourceline)
+
+    stream, _ = open_unl(unl_file)
+    try:
+        # Startup configs may be longer than libxml2's 10 MB text node limit
+        for _, element in etree.iterparse(stream, events=("end",), huge_tree=True):
+            parent = element.getparent()
+            if element.tag == "interface":
+                # Checked and dropped along with its node
+                continue
+            if element.tag == "node" and parent is not None and parent.tag == "nodes":
+                lint_node(element)
+            elif element.tag == "network" and parent is not None and parent.tag == "networks":
+                lint_network(element)
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del parent[0]
+    except etree.XMLSyntaxError as error:
+        problems.append((error.lineno, f"XML syntax error: {error.msg}"))
+        return sorted(problems, key=lambda problem: problem[0] or 0)
+
+    for network_id, interfaces in unresolved.items():
+        if network_id not in network_lines:
+            for line, name, if_id in interfaces:
+                problems.append((line, f"interface {if_id} of node {name} refers to network {network_id}, which does not exist"))
+    if not management_lines:
+        problems.append((None, "no pnet0 network to use as the solution management network"))
+    return sorted(problems, key=lambda problem: problem[0] or 0)
+
+def lint(unl_files):
+    failed = False
+    for unl_file in unl_files:
+        for line, message in lint_unl(pathlib.Path(unl_file)):
+            location = f"{unl_file}:{line}" if line else unl_file
+            print(f"{location}: {message}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+def open_decompressed(stream):
+    """
+    Return a file object decompressing stream if it starts with gzip, xz or
+    zstd magic bytes, otherwise None. Nothing is consumed from stream.
+    """
+    magic = stream.peek(6)[:6]
+    if magic.startswith(b"\x1f\x8b"):
+        import gzip
+
+        return gzip.GzipFile(fileobj=stream)
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        import lzma
+
+        return lzma.LZMAFile(stream)
+    if magic.startswith(b"\x28\xb5\x2f\xfd"):
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit("ERROR: Reading zstd compressed UNL files needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    return None
+
+def plan_solution(unl_xml, output_directory, ipv6_cidr=None):
+    import hcl
+    import terraform
 
     solution = terraform.TerraformSolution(hcl.ProviderOpenstack.create(), output_directory)
     setup_variables(solution)
-    handle_networks(unl_xml.xpath("/lab/topology/networks/network"), solution)
-    handle_nodes(unl_xml.xpath("/lab/topology/nodes/node"), solution)
+    handle_networks(unl_xml.xpath("/lab/topology/networks/network"), solution, ipv6_cidr)
+    nodes = unl_xml.xpath("/lab/topology/nodes/node")
+    handle_nodes(nodes, solution)
+    config_ids = set(unl_xml.xpath("/lab/objects/configs/config/@id"))
+    solution.startup_configs = {node.get("name") for node in nodes if node.get("id") in config_ids}
     return solution
 
 def load_solution(solution_file, output_directory):
-    solution = pickle.load(open(solution_file, 'rb'))
+    import pickle
+    import solution_store
+
+    if solution_store.is_store(solution_file):
+        # Rows are read from the store as they are needed, so it stays open
+        solution = solution_store.SolutionStore(solution_file).open()
+    else:
+        solution = pickle.load(open(solution_file, 'rb'))
+        solution.build_indexes()
     if output_directory is not None:
         solution.output_directory = output_directory
 
     validate_output_directory(solution.output_directory)
     return solution
 
-def main_menu(solution):
+def resume_solution(resume_directory, output_directory):
+    import terraform
+
+    if not (resume_directory / terraform.TerraformSolution.TERRAFORM_DIRECTORY).is_dir():
+        sys.exit(f"ERROR: No {terraform.TerraformSolution.TERRAFORM_DIRECTORY} directory found in {resume_directory}")
+    try:
+        solution = terraform.TerraformSolution.read_terraform(resume_directory)
+    except (AttributeError, IndexError, KeyError, ValueError, TypeError):
+        sys.exit(f"ERROR: Could not read the terraform files in {resume_directory}")
+    if output_directory is not None:
+        solution.output_directory = output_directory
+
+    validate_output_directory(pathlib.Path(solution.output_directory))
+    return solution
+
+def dry_run(unl_file, output_directory, ipv6_cidr=None, cloud_init_mode=None, shards=None, replicas=None):
+    """
+    Parse and plan a lab without rendering or writing it, then report what a
+    full conversion would produce. Peak memory is the resident size after
+    planning plus the terraform text that write_terraform holds at once.
+    """
+    import hcl
+    import resource
+    import terraform
+    import time
+
+    start = time.perf_counter()
+    solution = plan_solution(parse_unl(unl_file, drop_configs=True), output_directory, ipv6_cidr)
+    plan_seconds = time.perf_counter() - start
+    if cloud_init_mode:
+        solution.cloud_init_mode = cloud_init_mode
+    if shards:
+        solution.shard_count = shards
+    if replicas:
+        solution.replicas = replicas
+    estimate = solution.estimate_output()
+    planned_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    ports = [port for subnet in solution.subnets for port in subnet.ports]
+    template_data_sources = sum(1 for instance in solution.instances if solution.render_instance_templates(instance)[0])
+    if solution.cloud_init_mode == terraform.CLOUD_INIT_DATA_SOURCES:
+        template_data_sources += 1
+    print(f"Dry run of {unl_file}")
+    print(f"  networks: {len(solution.networks)}")
+    print(f"  subnets: {len(solution.subnets)} ({sum(1 for subnet in solution.subnets if subnet.dual_stack)} dual-stack)")
+    print(f"  ports: {len(ports)}")
+    print(f"  instances: {len(solution.instances)}")
+    print(f"  templates: {template_data_sources}")
+    print(f"  floating IPs: {sum(1 for instance in solution.instances if instance.floating_ip)}")
+    if solution.replicas:
+        capacity = solution.pod_capacity()
+        room = "" if capacity is None else f", room for {capacity} in the solution management network"
+        print(f"  pods: {solution.replicas}, counts above are per pod{room}")
+    if solution.shard_count:
+        print(f"  shards: {solution.shard_count}")
+
+    print("Address utilization:")
+    for subnet in solution.subnets:
+        first_host, last_host = hcl.host_range(subnet.network_address, subnet.prefix_length, subnet.enable_dhcp, subnet.ip_version)
+        usable = max(0, last_host - first_host + 1)
+        used = len(subnet.ports)
+        percent = 100 * used / usable if usable else 100
+        print(f"  {subnet.subnet_name} {subnet.cidr}: {used}/{usable} ({percent:.1f}%)")
+        if subnet.dual_stack:
+            print(f"  {subnet.ipv6_subnet_name} {subnet.ipv6_cidr}: {sum(1 for port in subnet.ports if port.ipv6_address is not None)} used")
+
+    print("Estimated output:")
+    for path, size in sorted(estimate.items()):
+        print(f"  {path}: {size} bytes")
+    print(f"  total: {sum(estimate.values())} bytes")
+
+    terraform_bytes = sum(size for path, size in estimate.items() if path.parts[0] == solution.TERRAFORM_DIRECTORY)
+    print(f"Estimated peak memory: {(planned_bytes + terraform_bytes) / (1024 * 1024):.1f} MiB")
+    print(f"Parse and plan took {plan_seconds:.2f}s")
+
+def main_menu(solution, asset_store=None):
     while True:
         print("UNL read successuflly. Main menu:")
         print("n) Show networks and modify CIDR blocks")
         print("i) List instances")
+        print("r) Renumber subnets in bulk")
         print("v) Validate networking")
+        print("u) Undo the last edit")
+        print("y) Redo the last undone edit")
+        print("k) Save a named checkpoint or go back to one")
         print("s) Save current solution object to a file")
         print("w) Write terraform files and exit")
         print("q) Quit without saving anything")
@@ -91,18 +462,73 @@ def main_menu(solution):
             show_networks(solution)
         elif choice == "i":
             show_instances(solution)
+        elif choice == "r":
+            bulk_renumber(solution)
         elif choice == "v":
             validate_networking(solution)
+        elif choice in ("u", "y"):
+            undo_redo(solution, choice)
+        elif choice == "k":
+            checkpoints(solution)
         elif choice == "s":
             save_solution(solution)
         elif choice == "w":
+            capacity = solution.pod_capacity() if solution.replicas else None
+            if capacity is not None and capacity < solution.replicas:
+                print(f"ERROR: Solution management network {solution.get_subnet_by_name(solution.management_network_name).cidr} "
+                      f"only has room for {capacity} pods, widen it from the networks menu to write {solution.replicas}")
+                continue
             break
         elif choice == "q":
             sys.exit(0)
 
     print(f"Writing terraform files to directory {solution.output_directory}!")
-    solution.write_terraform()
-    solution.write_ansible()
+    changes = solution.write_terraform(asset_store)
+    changes_path = pathlib.Path(solution.TERRAFORM_DIRECTORY, solution.CHANGES_FILE)
+    print(f"{changes} resource addresses changed since the last write, see {changes_path} for -target arguments")
+    solution.write_ansible(asset_store)
+
+def collect_assets(asset_store_directory):
+    import assets
+    import terraform
+
+    if not asset_store_directory.is_dir():
+        sys.exit("ERROR: Asset store directory does not exist")
+    asset_store = assets.AssetStore(asset_store_directory)
+    removed = asset_store.collect_garbage([
+        terraform.TerraformSolution.TERRAFORM_DIRECTORY,
+        terraform.TerraformSolution.ANSIBLE_DIRECTORY,
+    ])
+    for object_path in removed:
+        print(f"Removed unused asset {object_path.name}")
+    print(f"Removed {len(removed)} unused assets, {len(asset_store.labs())} labs still use the store")
+
+def undo_redo(solution, choice):
+    if choice == "u":
+        description = solution.history.undo()
+        print(f"Undid change to {description}" if description else "Nothing to undo")
+    else:
+        description = solution.history.redo()
+        print(f"Redid change to {description}" if description else "Nothing to redo")
+
+def checkpoints(solution):
+    names = list(solution.history.checkpoints)
+    print("\n")
+    print("Checkpoints:")
+    for i, name in enumerate(names, 1):
+        print(f"{i}) {name}")
+    print("\n")
+    choice = input("Enter a name to save a new checkpoint, the number of a checkpoint to go back to it, or 'x' to return: ")
+    if choice == "x" or not choice:
+        return None
+    try:
+        name = names[int(choice) - 1]
+    except (ValueError, IndexError):
+        solution.history.save_checkpoint(choice)
+        print(f"Saved checkpoint {choice}")
+    else:
+        solution.history.restore_checkpoint(name)
+        print(f"Went back to checkpoint {name}")
 
 def save_solution(solution):
     while True:
@@ -115,95 +541,149 @@ def save_solution(solution):
                     return None
                 else:
                     break
+        import pickle
+        import solution_store
+
+        if filename.suffix in solution_store.STORE_SUFFIXES or solution_store.is_store(filename):
+            written = solution_store.save(solution, filename)
+            print(f"Committed {written} changed rows to {filename}")
+            break
+
+        if isinstance(solution, solution_store.StoredSolution):
+            solution = solution.in_memory()
         with filename.open('wb') as fh:
             pickle.dump(solution, fh)
         break
             
         
+def page_items(items, page):
+    start = page * PAGE_SIZE
+    return enumerate(items[start:start + PAGE_SIZE], start + 1)
+
+def turn_page(choice, items, page):
+    last_page = max(0, (len(items) - 1) // PAGE_SIZE)
+    if choice == ">":
+        return min(page + 1, last_page)
+    return max(page - 1, 0)
+
+def print_paging_help(items, page):
+    print(f"Page {page + 1} of {max(1, -(-len(items) // PAGE_SIZE))}, {len(items)} entries")
+    print("Enter '>' or '<' to show the next or previous page")
+    print("Enter '/text' to search by name, or '/' alone to list everything again")
+
+def select_item(choice, items, lookup):
+    try:
+        index = int(choice) - 1
+        return items[index]
+    except (ValueError, IndexError):
+        return lookup(choice)
+
 def show_networks(solution):
-    subnet_selection = None
+    subnets = solution.subnets
+    page = 0
     while True:
         print("\n")
         print("The following networks and CIDR blocks were created")
-        i = 1
-        for subnet in solution.subnets:
-            print(f"{i}) {subnet.subnet_name} - {subnet.cidr}")
-            i += 1
+        for i, subnet in page_items(subnets, page):
+            print(f"{i}) {subnet.subnet_name} - {subnet.cidr}{f', {subnet.ipv6_cidr}' if subnet.dual_stack else ''}")
         print("\n")
-        print("Enter a number next to view and change network details")
+        print_paging_help(subnets, page)
+        print("Enter a number or name to view and change network details")
         print("Enter 'x' to return to the previous menu")
         print("\n")
         choice = input("Enter a selection: ")
 
-        try:
-            index = int(choice) - 1
-            subnet_selection = solution.subnets[index]
-        except (ValueError, IndexError):
-            if choice == "x":
-                break
-            else:
-                print("Please enter a valid selection")
+        if choice == "x":
+            break
+        elif choice in ("<", ">"):
+            page = turn_page(choice, subnets, page)
+        elif choice.startswith("/"):
+            page = 0
+            subnets = solution.subnets
+            if choice[1:]:
+                subnets = [solution.subnet_index.get(name) for name in solution.subnet_index.search(choice[1:])]
         else:
-            display_network(solution, subnet_selection, index)
-            subnet_selection = None
+            subnet_selection = select_item(choice, subnets, solution.subnet_index.get)
+            if subnet_selection is None:
+                print("Please enter a valid selection")
+            else:
+                display_network(solution, subnet_selection, solution.subnets.index(subnet_selection))
 
 def display_network(solution, subnet, subnet_index):
-    port_selection = None
+    def lookup_port(port_name):
+        port = solution.get_port_by_name(port_name)
+        if port is not None and port[0].subnet_name == subnet.subnet_name:
+            return port[0]
+
+    ports = subnet.ports
+    page = 0
     while True:
         print("\n")
         print(f"Network {subnet.subnet_name} uses CIDR {subnet.cidr}")
+        if subnet.dual_stack:
+            print(f"Network {subnet.subnet_name} is dual-stack with IPv6 prefix {subnet.ipv6_cidr}")
         print(f"Ports in {subnet.subnet_name}:")
-        i = 1
-        for port in subnet.ports:
+        for i, port in page_items(ports, page):
             gateway = False
             if port.name == subnet.gateway_port_name:
                 gateway = True
-            print(f"{'*' if gateway else ' '}{i}) {port.name} - instance: {port.instance}, address: {port.address}")
-            i += 1
+            ipv6 = f", ipv6 address: {port.ipv6_address_string}" if port.ipv6_address is not None else ""
+            print(f"{'*' if gateway else ' '}{i}) {port.name} - instance: {port.instance}, address: {port.address_string}{ipv6}")
         print("\n")
-        print("Enter the number for a port to update the address")
+        print_paging_help(ports, page)
+        print("Enter the number or name of a port to update the address")
         print("Enter 'c' to change the network address")
         print("Enter 'g' to select a gateway port for the network")
+        print("Enter '6' to add, change or remove the IPv6 prefix of a dual-stack network")
+        print("Enter 'u' or 'y' to undo or redo the last edit")
         print("Enter 'x' to return to the previous menu")
         print("\n")
         choice = input("Enter a selection: ")
 
-        try:
-            index = int(choice) - 1
-            port_selection = subnet.ports[index]
-        except (ValueError, IndexError):
-            if choice == "c":
-                updated_subnet = update_network_address(solution, subnet)
-                if updated_subnet is not None:
-                    solution.subnets[subnet_index] = updated_subnet
-            elif choice == "g":
-                updated_subnet = select_gateway(subnet, subnet.ports)
-                if updated_subnet is not None:
-                    solution.subnets[subnet_index] = updated_subnet
-            elif choice == "x":
-                break
-            else:
-                print("Please enter a valid selection")
+        if choice == "c":
+            updated_subnet = update_network_address(solution, subnet)
+            if updated_subnet is not None:
+                solution.subnets[subnet_index] = updated_subnet
+        elif choice == "g":
+            updated_subnet = select_gateway(solution, subnet, ports, lookup_port)
+            if updated_subnet is not None:
+                solution.subnets[subnet_index] = updated_subnet
+        elif choice == "6":
+            update_ipv6_prefix(solution, subnet)
+        elif choice in ("u", "y"):
+            undo_redo(solution, choice)
+        elif choice == "x":
+            break
+        elif choice in ("<", ">"):
+            page = turn_page(choice, ports, page)
+        elif choice.startswith("/"):
+            page = 0
+            ports = subnet.ports
+            if choice[1:]:
+                ports = [port for port in map(lookup_port, solution.port_index.search(choice[1:])) if port is not None]
         else:
-            update_port_address(solution, port_selection)
-            port_selection = None
+            port_selection = select_item(choice, ports, lookup_port)
+            if port_selection is None:
+                print("Please enter a valid selection")
+            else:
+                update_port_address(solution, port_selection)
 
-def select_gateway(subnet, subnet_ports):
+def select_gateway(solution, subnet, subnet_ports, lookup_port):
     while True:
-        choice = input("Please enter the number of the port that should be used as the gateway for the subnet: ")
-        try:
-            index = int(choice) - 1
-            gateway_port_name = subnet_ports[index].name
-        except (ValueError, IndexError):
-            if choice == "x":
-                break
-            else:
-                print("Please enter a valid selection")
+        choice = input("Please enter the number or name of the port that should be used as the gateway for the subnet: ")
+        if choice == "x":
+            break
+        gateway_port = select_item(choice, subnet_ports, lookup_port)
+        if gateway_port is None:
+            print("Please enter a valid selection")
         else:
-            subnet.gateway_port_name = gateway_port_name
+            solution.history.record(f"gateway of {subnet.subnet_name}", subnet)
+            subnet.gateway_port_name = gateway_port.name
             return subnet
 
 def update_network_address(solution, subnet):
+    import ipaddress
+
     while True:
         new_cidr = input("Please enter a new CIDR for the network: ")
         try:
@@ -213,10 +693,106 @@ def update_network_address(solution, subnet):
                 break
             print("Please enter a valid address")
         else:
+            if subnet.dual_stack and network.version == 6:
+                print("A dual-stack network needs an IPv4 CIDR, remove its IPv6 prefix first")
+                continue
+            overlapping = [
+                other.subnet_name
+                for other in solution.address_index.overlapping(network.version, int(network.network_address), int(network.broadcast_address))
+                if other is not subnet
+            ]
+            if subnet.subnet_name != solution.management_network_name and solution.management_network_name in overlapping:
+                print(f"Network {network} overlaps the management network, please enter another CIDR")
+                continue
+            if overlapping:
+                print(f"Note: {network} overlaps {', '.join(sorted(overlapping))}")
+            plan = solution.plan_renumber({subnet.cidr: str(network)}, [subnet.subnet_name])
+            for collision in plan.collisions:
+                print(f"{collision}, port addresses are left unchanged")
+            if not plan.collisions and subnet.ports:
+                remap = input(f"Move the {len(subnet.ports)} port addresses into {network} as well? (y/n): ")
+                if remap in ['y', 'Y', 'yes', 'Yes', 'YES']:
+                    solution.history.record(f"CIDR of {subnet.subnet_name}", subnet, *subnet.ports)
+                    solution.apply_renumber(plan)
+                    return subnet
+            solution.history.record(f"CIDR of {subnet.subnet_name}", subnet)
             subnet.update_cidr(str(network))
             return subnet
 
+def update_ipv6_prefix(solution, subnet):
+    import ipaddress
+
+    while True:
+        new_cidr = input("Please enter an IPv6 prefix for the network, or 'none' to remove it: ")
+        if new_cidr == 'x':
+            break
+        if new_cidr == 'none':
+            solution.history.record(f"IPv6 prefix of {subnet.subnet_name}", subnet, *subnet.ports)
+            solution.set_ipv6_prefix(subnet, None)
+            break
+        try:
+            network = ipaddress.IPv6Network(new_cidr, strict=False)
+        except ValueError:
+            print("Please enter a valid IPv6 prefix")
+        else:
+            if subnet.ip_version == 6:
+                print(f"Network {subnet.subnet_name} is already IPv6 only, change its CIDR instead")
+                break
+            solution.history.record(f"IPv6 prefix of {subnet.subnet_name}", subnet, *subnet.ports)
+            solution.set_ipv6_prefix(subnet, str(network))
+            break
+
+def bulk_renumber(solution):
+    import hcl
+    import ipaddress
+
+    cidr_map = {}
+    print("Enter each renumbering as OLD_CIDR=NEW_CIDR, or an empty line when done")
+    while True:
+        mapping = input("Renumber: ")
+        if not mapping:
+            break
+        old_cidr, _, new_cidr = mapping.partition("=")
+        try:
+            old_network = ipaddress.ip_network(old_cidr.strip(), strict=False)
+            new_network = ipaddress.ip_network(new_cidr.strip(), strict=False)
+        except ValueError:
+            print("Please enter two valid CIDRs separated by '='")
+        else:
+            cidr_map[str(old_network)] = str(new_network)
+    if not cidr_map:
+        return None
+
+    subnet_names = None
+    names = input("Enter the subnets to renumber separated by commas, or leave empty for all subnets: ")
+    if names:
+        subnet_names = {name.strip() for name in names.split(",")}
+
+    plan = solution.plan_renumber(cidr_map, subnet_names)
+    if not plan.changes:
+        print("No subnets match the given CIDRs")
+        return None
+    for subnet, network_address, prefix_length, ip_version, port_addresses in plan.changes:
+        print(f"{subnet.subnet_name}: {subnet.cidr} -> {hcl.format_cidr(network_address, prefix_length, ip_version)}, {len(port_addresses)} ports")
+    if plan.compacted:
+        print(f"{len(plan.compacted)} ports do not keep their host offset and are packed at the start of the new network")
+    if plan.collisions:
+        for collision in plan.collisions:
+            print(collision)
+        print("Nothing was renumbered")
+        return None
+
+    apply = input("Apply this renumbering? (y/n): ")
+    if apply in ['y', 'Y', 'yes', 'Yes', 'YES']:
+        changed = []
+        for subnet, *_ in plan.changes:
+            changed += [subnet, *subnet.ports]
+        solution.history.record(f"renumbering of {len(plan.changes)} subnets", *changed)
+        solution.apply_renumber(plan)
+
 def update_port_address(solution, port):
+    import ipaddress
+
     while True:
         new_address = input(f"Please enter a new address for port {port.name}: ")
         try:
@@ -227,101 +803,149 @@ def update_port_address(solution, port):
             print("Please enter a valid address")
         else:
             subnet = solution.get_subnet_by_name(port.subnet_name)
-            if new_ip in ipaddress.ip_network(subnet.cidr):
-                port.update_address(new_address)
+            if solution.in_management_network(int(new_ip), new_ip.version, subnet):
+                print(f"Address {new_address} is inside the management network, please enter another address")
+            elif new_ip in subnet.network:
+                solution.history.record(f"address of {port.name}", port)
+                port.update_address(int(new_ip), new_ip.version)
+                return port
+            elif subnet.dual_stack and new_ip.version == 6 and subnet.contains_ipv6(int(new_ip)):
+                solution.history.record(f"IPv6 address of {port.name}", port)
+                port.update_ipv6_address(int(new_ip))
                 return port
             else:
+                owner = solution.address_index.owner(int(new_ip), new_ip.version)
+                if owner is not None:
+                    print(f"Address {new_address} belongs to subnet {owner.subnet_name}, not {subnet.subnet_name}")
                 print(f"Address {new_address} is not in network {subnet.cidr}, please enter a valid address")
 
 def show_instances(solution):
+    instances = solution.instances
+    page = 0
     while True:
         print("\n")
         print("The solution consists of the following instances: ")
-        i = 1
-        for instance in solution.instances:
+        for i, instance in page_items(instances, page):
             floater = instance.floating_ip
             print(f"{'*' if floater else ' '}{i}) {instance.name}")
-            i += 1
         print("\n")
-        print("Enter the number for an instance to see and change interface information")
+        print_paging_help(instances, page)
+        print("Enter the number or name for an instance to see and change interface information")
         print("Enter 'f' to toggle creation of a floating IP for an instance")
+        print("Enter 'u' or 'y' to undo or redo the last edit")
         print("Enter 'x' to return to the previous menu")
         print("\n")
         choice = input("Enter a selection: ")
-        try:
-            index = int(choice) - 1
-            selected_instance = solution.instances[index]
-        except (ValueError, IndexError):
-            if choice == "x":
-                break
-            elif choice == "f":
-                set_floating_ip(solution)
-            else:
-                print("Please enter a valid selection")
+
+        if choice == "x":
+            break
+        elif choice == "f":
+            set_floating_ip(solution, instances)
+        elif choice in ("u", "y"):
+            undo_redo(solution, choice)
+        elif choice in ("<", ">"):
+            page = turn_page(choice, instances, page)
+        elif choice.startswith("/"):
+            page = 0
+            instances = solution.instances
+            if choice[1:]:
+                instances = [solution.instance_index.get(name) for name in solution.instance_index.search(choice[1:])]
         else:
-            display_instance(solution, selected_instance)
+            selected_instance = select_item(choice, instances, solution.get_instance_by_name)
+            if selected_instance is None:
+                print("Please enter a valid selection")
+            else:
+                display_instance(solution, selected_instance)
 
-def set_floating_ip(solution):
+def set_floating_ip(solution, instances):
     while True:
-        choice = input("Please enter the number of the instance that should have a floating IP: ")
-        try:
-            index = int(choice) - 1
-            instance = solution.instances[index]
-        except (ValueError, IndexError):
-            if choice == "x":
-                break
-        else:
+        choice = input("Please enter the number or name of the instance that should have a floating IP: ")
+        if choice == "x":
+            break
+        instance = select_item(choice, instances, solution.get_instance_by_name)
+        if instance is not None:
             instance_port0, _ = solution.get_port_by_name(instance.port_names[0])
             if instance_port0.subnet_name == solution.management_network_name:
+                solution.history.record(f"floating IP of {instance.name}", instance)
                 instance.floating_ip=True
-                solution.instances[index] = instance
             else:
                 print(f"Floating IP requires an instance's eth0 to be in network {solution.management_network_name}")
             break
 
 def display_instance(solution, instance):
+    def lookup_port_name(port_name):
+        if port_name in instance.port_names:
+            return port_name
+
+    instance_port_names = instance.port_names
+    page = 0
     while True:
         print("\n")
         print(f"Displaying ports for instance {instance.name}:")
-        i = 1
-        instance_port_names = instance.port_names
-        for port_index, port_name in enumerate(instance_port_names):
+        for i, port_name in page_items(instance_port_names, page):
             port, _ = solution.get_port_by_name(port_name)
-            print(f"{i}) {port.name} - instance: {port.instance}, address: {port.address}")
-            i += 1
+            ipv6 = f", ipv6 address: {port.ipv6_address_string}" if port.ipv6_address is not None else ""
+            print(f"{i}) {port.name} - instance: {port.instance}, address: {port.address_string}{ipv6}")
         print("\n")
-        print("Select the number for a port to change the address")
+        print_paging_help(instance_port_names, page)
+        print("Select the number or name for a port to change the address")
+        print("Enter 'u' or 'y' to undo or redo the last edit")
         print("Enter 'x' to return to the previous menu")
         print("\n")
         choice = input("Enter a selection: ")
-        try:
-            index = int(choice) - 1
-            selected_port_name = instance_port_names[index]
-        except (ValueError, IndexError):
-            if choice == "x":
-                break
-            else:
-                print("Please enter a valid selection")
+
+        if choice == "x":
+            break
+        elif choice in ("u", "y"):
+            undo_redo(solution, choice)
+        elif choice in ("<", ">"):
+            page = turn_page(choice, instance_port_names, page)
+        elif choice.startswith("/"):
+            page = 0
+            instance_port_names = instance.port_names
+            if choice[1:]:
+                instance_port_names = [
+                    port_name for port_name in solution.port_index.search(choice[1:]) if port_name in instance.port_names
+                ]
         else:
-            port, index = solution.get_port_by_name(selected_port_name)
-            subnet = solution.get_subnet_by_name(port.subnet_name)
-            updated_port = update_port_address(solution, port)
-            subnet.update_port(index, updated_port)
+            selected_port_name = select_item(choice, instance_port_names, lookup_port_name)
+            if selected_port_name is None:
+                print("Please enter a valid selection")
+            else:
+                port, index = solution.get_port_by_name(selected_port_name)
+                subnet = solution.get_subnet_by_name(port.subnet_name)
+                updated_port = update_port_address(solution, port)
+                if updated_port is not None:
+                    subnet.update_port(index, updated_port)
 
 def validate_networking(solution):
     for subnet in solution.subnets:
-        network_obj = ipaddress.ip_network(subnet.cidr)
-        subnet_addresses = []
+        subnet_addresses = set()
+        subnet_ipv6_addresses = set()
         for index, port in enumerate(subnet.ports):
-            if not ipaddress.ip_address(port.address) in network_obj:
-                print(f"Port {port.name} address {port.address} is not in subnet {subnet.subnet_name}, please enter a new address")
+            if port.ip_version != subnet.ip_version or not subnet.contains(port.address):
+                print(f"Port {port.name} address {port.address_string} is not in subnet {subnet.subnet_name}, please enter a new address")
                 updated_port = update_port_address(solution, port)
-                subnet.update_port(index, updated_port)
+                if updated_port is not None:
+                    subnet.update_port(index, updated_port)
  
+            if solution.in_management_network(port.address, port.ip_version, subnet):
+                print(f"Port {port.name} address {port.address_string} is inside the management network, please fix before writing solution")
+
             if port.address not in subnet_addresses:
-                subnet_addresses.append(port.address)
+                subnet_addresses.add(port.address)
             else:
-                print(f"Subnet {subnet.subnet_name} has multiple ports using address {port.address} please fix before writing solution")
+                print(f"Subnet {subnet.subnet_name} has multiple ports using address {port.address_string} please fix before writing solution")
+
+            if not subnet.dual_stack:
+                continue
+            if port.ipv6_address is None or not subnet.contains_ipv6(port.ipv6_address):
+                print(f"Port {port.name} has no IPv6 address in prefix {subnet.ipv6_cidr}, please enter a new IPv6 address")
+                update_port_address(solution, port)
+            elif port.ipv6_address not in subnet_ipv6_addresses:
+                subnet_ipv6_addresses.add(port.ipv6_address)
+            else:
+                print(f"Subnet {subnet.subnet_name} has multiple ports using IPv6 address {port.ipv6_address_string} please fix before writing solution")
 
     for instance in solution.instances:
         port0, _ = solution.get_port_by_name(instance.port_names[0])
@@ -330,6 +954,8 @@ def validate_networking(solution):
             print(f"Subnet {subnet.subnet_name} needs a gateway selected due to cloud-init for instance {instance.name}")
         
 def setup_variables(solution):
+    import hcl
+
     solution.variables.append(hcl.HclVariable.create("openstack_user"))
     solution.variables.append(hcl.HclVariable.create("openstack_domain_name", default="128T"))
     solution.variables.append(hcl.HclVariable.create(
@@ -352,6 +978,8 @@ def setup_variables(solution):
 
 
 def setup_solution_management(solution, management_network_name, management_network_id):
+    import ipaddress
+
     mn = ipaddress.ip_network(DEFAULT_MANAGEMENT_CIDR, strict=False)
 
     solution.setup_solution_management(
@@ -361,7 +989,10 @@ def setup_solution_management(solution, management_network_name, management_netw
         DNS_SERVERS,
     )
 
-def handle_networks(networks, solution):
+def handle_networks(networks, solution, ipv6_cidr=None):
+    import hcl
+    import ipaddress
+
     for network in networks:
         network_name = network.get("name")
         network_id = network.get("id")
@@ -375,47 +1006,82 @@ def handle_networks(networks, solution):
                 name=network_name,
                 network_id=network_id,
             ))
-            solution.subnets.append(hcl.ResourceOpenstackNetworkingSubnetV2.create(
+            solution.add_subnet(hcl.ResourceOpenstackNetworkingSubnetV2.create(
                 name=network_name,
                 network_id=network_id,
                 cidr=str(nw),
+                ipv6_cidr=ipv6_cidr,
             ))
 
 
 def handle_nodes(nodes, solution):
+    """
+    Create the ports and instances for every node. Interfaces are first
+    gathered per subnet so each subnet hands out all of its addresses in one
+    allocation, then ports are created in node order. The addresses match
+    allocating one interface at a time.
+    """
+    import hcl
+    import terraform
 
+    subnets = {}
+    interfaces_by_subnet = {}
+    gathered = []
     for node in nodes:
+        interfaces = []
+        for interface in node.xpath("interface"):
+            network_id = interface.get("network_id")
+            if network_id not in subnets:
+                subnets[network_id] = solution.get_subnet_by_id(network_id)
+            subnet = subnets[network_id]
+            port_name = f"{node.get('name')}_{interface.get('id')}"
+            interfaces.append((interface.get("id"), subnet, port_name))
+            interfaces_by_subnet.setdefault(subnet.subnet_name, []).append(port_name)
+        gathered.append((node, interfaces))
+
+    addresses = {}
+    ipv6_addresses = {}
+    for subnet in subnets.values():
+        port_names = interfaces_by_subnet.pop(subnet.subnet_name, None)
+        if port_names is None:
+            continue
+        allocated = subnet.allocate_addresses(len(port_names))
+        if len(allocated) < len(port_names):
+            sys.exit(f"ERROR: Subnet {subnet.subnet_name} has no free address left for port {port_names[len(allocated)]}")
+        addresses[subnet.subnet_name] = iter(allocated)
+        if subnet.dual_stack:
+            ipv6_addresses[subnet.subnet_name] = iter(subnet.allocate_ipv6_addresses(len(port_names)))
+
+    for node, interfaces in gathered:
         default_template = False
         node_name = node.get("name")
         node_template = node.get("template")
         ifnames = []
-        interfaces = node.xpath("interface")
         nw0 = None
-        for interface in interfaces:
-            if_id = interface.get("id")
-            network_id = interface.get("network_id")
-            port_name = f"{node_name}_{if_id}"
-            subnet = solution.get_subnet_by_id(network_id)
-            first_address = str(subnet.available_addresses()[0])
+        for if_id, subnet, port_name in interfaces:
+            ipv6_address = None
+            if subnet.dual_stack:
+                ipv6_address = next(ipv6_addresses[subnet.subnet_name], None)
             if if_id == "0":
                 nw0 = subnet
-            available_addresses = str(subnet.available_addresses())
 
             port = hcl.ResourceOpenstackNetworkingPortV2.create(
               name=port_name,
               subnet_name=subnet.subnet_name,
-              address=first_address,
+              address=next(addresses[subnet.subnet_name]),
               instance=node_name,
+              ip_version=subnet.ip_version,
+              ipv6_address=ipv6_address,
             )
-            subnet.ports.append(port)
+            solution.add_port(subnet, port)
             ifnames.append(port_name)
         if nw0.subnet_name == solution.management_network_name:
             default_template = True
 
-        solution.instances.append(hcl.ResourceOpenstackComputeInstanceV2.create(
+        solution.add_instance(hcl.ResourceOpenstackComputeInstanceV2.create(
             node_name,
             ifnames,
-            image_name="var.t128_image" if node_template == "128T" else "var.image",
+            image_name=hcl.Expression("var.t128_image" if node_template == "128T" else "var.image"),
             user_data=terraform.TerraformSolution.DEFAULT_TEMPLATE_NAME if default_template else node_name
         ))
 